@@ -0,0 +1,38 @@
+"""lowercase user emails
+
+Revision ID: 0b7e4a9c2f61
+Revises: f58d2c3b9e14
+Create Date: 2026-10-18 15:03:44.907215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e4a9c2f61'
+down_revision: Union[str, Sequence[str], None] = 'f58d2c3b9e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    duplicates = bind.execute(sa.text(
+        "SELECT lower(email) FROM users GROUP BY lower(email) HAVING count(*) > 1"
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            "Users with emails differing only in case must be merged before this migration: "
+            + ", ".join(duplicates[:20])
+        )
+    op.execute("UPDATE users SET email = lower(email) WHERE email <> lower(email)")
+    op.create_index('ix_users_lower_email', 'users', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_lower_email', table_name='users')
@@ -0,0 +1,28 @@
+"""add email outbox claimed_by
+
+Revision ID: 3e7a5c90d1b4
+Revises: b83f1d6a4e52
+Create Date: 2026-10-18 18:42:07.913264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e7a5c90d1b4'
+down_revision: Union[str, Sequence[str], None] = 'b83f1d6a4e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('email_outbox', sa.Column('claimed_by', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('email_outbox', 'claimed_by')
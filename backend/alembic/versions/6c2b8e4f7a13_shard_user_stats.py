@@ -0,0 +1,57 @@
+"""shard user stats counters
+
+Revision ID: 6c2b8e4f7a13
+Revises: 3e7a5c90d1b4
+Create Date: 2026-10-18 19:10:36.205871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c2b8e4f7a13'
+down_revision: Union[str, Sequence[str], None] = '3e7a5c90d1b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _copy_signups(shard: bool) -> None:
+    """Rebuild user_signups_daily with or without the shard column, merging shards on the way down."""
+    columns = [
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('signups', sa.Integer(), nullable=False),
+    ]
+    if shard:
+        columns.append(sa.Column('shard', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table(
+        'user_signups_daily_new', *columns,
+        sa.PrimaryKeyConstraint('day', 'shard') if shard else sa.PrimaryKeyConstraint('day'),
+    )
+    op.execute(
+        "INSERT INTO user_signups_daily_new (day, signups) "
+        "SELECT day, sum(signups) FROM user_signups_daily GROUP BY day"
+    )
+    op.drop_table('user_signups_daily')
+    op.rename_table('user_signups_daily_new', 'user_signups_daily')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # user_stats rows are already keyed by id, which now names the shard; the
+    # existing row simply becomes shard 1. Daily signups get a shard in their key.
+    _copy_signups(shard=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "INSERT INTO user_stats (id, total, verified, active, updated_at) "
+        "SELECT -1, coalesce(sum(total), 0), coalesce(sum(verified), 0), coalesce(sum(active), 0), "
+        "max(updated_at) FROM user_stats HAVING count(*) > 0"
+    )
+    op.execute("DELETE FROM user_stats WHERE id <> -1")
+    op.execute("UPDATE user_stats SET id = 1")
+    _copy_signups(shard=False)
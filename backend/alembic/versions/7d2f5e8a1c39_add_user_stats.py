@@ -0,0 +1,54 @@
+"""add user stats counters
+
+Revision ID: 7d2f5e8a1c39
+Revises: 0b7e4a9c2f61
+Create Date: 2026-10-18 15:47:12.630514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2f5e8a1c39'
+down_revision: Union[str, Sequence[str], None] = '0b7e4a9c2f61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'user_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('verified', sa.Integer(), nullable=False),
+        sa.Column('active', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'user_signups_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('signups', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day'),
+    )
+
+    true = "true" if op.get_bind().dialect.name == 'postgresql' else "1"
+    op.execute(
+        "INSERT INTO user_stats (id, total, verified, active, updated_at) "
+        f"SELECT 1, count(*), count(CASE WHEN is_verified = {true} THEN 1 END), "
+        f"count(CASE WHEN is_active = {true} THEN 1 END), CURRENT_TIMESTAMP FROM users"
+    )
+    op.execute(
+        "INSERT INTO user_signups_daily (day, signups) "
+        "SELECT date(created_at), count(*) FROM users WHERE created_at IS NOT NULL GROUP BY date(created_at)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_signups_daily')
+    op.drop_table('user_stats')
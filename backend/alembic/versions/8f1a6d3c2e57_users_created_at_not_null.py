@@ -0,0 +1,38 @@
+"""users created_at not null
+
+Revision ID: 8f1a6d3c2e57
+Revises: 6c2b8e4f7a13
+Create Date: 2026-10-18 21:03:48.162540
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f1a6d3c2e57'
+down_revision: Union[str, Sequence[str], None] = '6c2b8e4f7a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Users from before created_at existed count as the oldest ones, so the admin
+    # listing keeps them last and can page through (created_at, id) without NULLs.
+    op.execute(
+        "UPDATE users SET created_at = COALESCE((SELECT min(created_at) FROM users), CURRENT_TIMESTAMP) "
+        "WHERE created_at IS NULL"
+    )
+    # SQLite cannot alter a column in place, and rebuilding users would drop its
+    # expression index; there the model's default keeps new rows non-NULL.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('users', 'created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('users', 'created_at', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,35 @@
+"""add user listing indexes
+
+Revision ID: a3f0c2d81b47
+Revises: 5b1e9c7d3a20
+Create Date: 2026-10-18 10:02:13.550912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f0c2d81b47'
+down_revision: Union[str, Sequence[str], None] = '5b1e9c7d3a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+    if op.get_bind().dialect.name == 'postgresql':
+        # LIKE 'prefix%' can only use a btree index built with text_pattern_ops.
+        op.execute("CREATE INDEX ix_users_lower_name_prefix ON users (lower(name) text_pattern_ops)")
+        op.execute("CREATE INDEX ix_users_lower_email_prefix ON users (lower(email) text_pattern_ops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_users_lower_email_prefix")
+        op.execute("DROP INDEX IF EXISTS ix_users_lower_name_prefix")
+    op.drop_index('ix_users_created_at_id', table_name='users')
@@ -0,0 +1,70 @@
+"""add broadcast jobs
+
+Revision ID: e4b9a17c5d63
+Revises: c71d4e8f9a02
+Create Date: 2026-10-18 13:02:51.552180
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b9a17c5d63'
+down_revision: Union[str, Sequence[str], None] = 'c71d4e8f9a02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'broadcast_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('message_content', sa.Text(), nullable=False),
+        sa.Column('created_by', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('recipients_loaded', sa.Boolean(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('sent', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('unknown', sa.Integer(), nullable=False),
+        sa.Column('worker_id', sa.String(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_broadcast_jobs_id'), 'broadcast_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_broadcast_jobs_status'), 'broadcast_jobs', ['status'], unique=False)
+
+    op.create_table(
+        'broadcast_deliveries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['broadcast_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('job_id', 'email', name='uq_broadcast_deliveries_job_id_email'),
+    )
+    op.create_index(op.f('ix_broadcast_deliveries_id'), 'broadcast_deliveries', ['id'], unique=False)
+    op.create_index('ix_broadcast_deliveries_job_id_status', 'broadcast_deliveries', ['job_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_broadcast_deliveries_job_id_status', table_name='broadcast_deliveries')
+    op.drop_index(op.f('ix_broadcast_deliveries_id'), table_name='broadcast_deliveries')
+    op.drop_table('broadcast_deliveries')
+    op.drop_index(op.f('ix_broadcast_jobs_status'), table_name='broadcast_jobs')
+    op.drop_index(op.f('ix_broadcast_jobs_id'), table_name='broadcast_jobs')
+    op.drop_table('broadcast_jobs')
@@ -0,0 +1,64 @@
+"""partial indexes for user tokens and status
+
+Revision ID: f58d2c3b9e14
+Revises: e4b9a17c5d63
+Create Date: 2026-10-18 14:26:09.318842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f58d2c3b9e14'
+down_revision: Union[str, Sequence[str], None] = 'e4b9a17c5d63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _where(condition: str) -> dict:
+    return {"postgresql_where": sa.text(condition), "sqlite_where": sa.text(condition)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Clear what the sweeper would clear anyway, so the new indexes start small.
+    op.execute(
+        "UPDATE users SET verification_token = NULL, verification_token_expiry = NULL "
+        "WHERE verification_token IS NOT NULL AND verification_token_expiry < CURRENT_TIMESTAMP"
+    )
+    op.execute(
+        "UPDATE users SET password_reset_token = NULL, password_reset_token_expiry = NULL "
+        "WHERE password_reset_token IS NOT NULL AND password_reset_token_expiry < CURRENT_TIMESTAMP"
+    )
+
+    op.drop_index('ix_users_verification_token', table_name='users')
+    op.drop_index('ix_users_password_reset_token', table_name='users')
+    op.create_index('ix_users_verification_token', 'users', ['verification_token'], unique=True,
+                    **_where("verification_token IS NOT NULL"))
+    op.create_index('ix_users_password_reset_token', 'users', ['password_reset_token'], unique=True,
+                    **_where("password_reset_token IS NOT NULL"))
+    op.create_index('ix_users_verification_token_expiry', 'users', ['verification_token_expiry'], unique=False,
+                    **_where("verification_token IS NOT NULL"))
+    op.create_index('ix_users_password_reset_token_expiry', 'users', ['password_reset_token_expiry'], unique=False,
+                    **_where("password_reset_token IS NOT NULL"))
+
+    false = "false" if op.get_bind().dialect.name == 'postgresql' else "0"
+    op.create_index('ix_users_unverified_created_at_id', 'users', ['created_at', 'id'], unique=False,
+                    **_where(f"is_verified = {false}"))
+    op.create_index('ix_users_inactive_created_at_id', 'users', ['created_at', 'id'], unique=False,
+                    **_where(f"is_active = {false}"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_inactive_created_at_id', table_name='users')
+    op.drop_index('ix_users_unverified_created_at_id', table_name='users')
+    op.drop_index('ix_users_password_reset_token_expiry', table_name='users')
+    op.drop_index('ix_users_verification_token_expiry', table_name='users')
+    op.drop_index('ix_users_password_reset_token', table_name='users')
+    op.drop_index('ix_users_verification_token', table_name='users')
+    op.create_index('ix_users_password_reset_token', 'users', ['password_reset_token'], unique=True)
+    op.create_index('ix_users_verification_token', 'users', ['verification_token'], unique=True)
@@ -1,22 +1,186 @@
-from fastapi import Depends, HTTPException
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
 import models
-from utils import blacklist, decode_access_token, get_user_by_email
+from replicas import get_async_read_db, set_read_subject
+from revocation import revocation_store
+from utils import decode_access_token, get_user_by_email_async, hash_token, is_session_revoked
+
+load_dotenv()
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
 
-    
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    if token in blacklist:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    
-    payload = decode_access_token(token)
-    username: str = payload.get("sub")
-    if username is None:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    user = get_user_by_email(db, username)
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller: decoded token claims plus the user columns routes need."""
+    id: int
+    email: str
+    name: str
+    is_verified: bool
+    is_active: bool
+    is_admin: bool
+    claims: Dict = field(default_factory=dict, compare=False)
+
+    @classmethod
+    def from_user(cls, user: models.User, claims: Dict) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            name=user.name,
+            is_verified=bool(user.is_verified),
+            is_active=bool(user.is_active),
+            is_admin=bool(user.is_admin),
+            claims=claims,
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "email": self.email,
+            "name": self.name,
+            "is_verified": self.is_verified,
+            "is_active": self.is_active,
+            "is_admin": self.is_admin,
+        }
+
+
+class PrincipalCache:
+    """
+    LRU cache of token -> Principal.
+
+    Entries live for `ttl` seconds, never past the token's `exp`. Anything that
+    changes a user row must call `invalidate_user` so the next request reloads it.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (principal, expires_at)
+        self._tokens_by_email: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def put(self, token: str, principal: Principal) -> None:
+        expires_at = time.time() + self.ttl
+        exp = principal.claims.get("exp")
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (principal, expires_at)
+            self._tokens_by_email.setdefault(principal.email, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_token(self, token: str) -> None:
+        with self._lock:
+            if self._remove(token):
+                self.invalidations += 1
+
+    def invalidate_user(self, email: str) -> None:
+        with self._lock:
+            for token in list(self._tokens_by_email.get(email, ())):
+                self._remove(token)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_email.clear()
+
+    def _remove(self, token: str) -> bool:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return False
+        email = entry[0].email
+        tokens = self._tokens_by_email.get(email)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[email]
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db)
+) -> Principal:
+    cred_exc = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    principal = principal_cache.get(token)
+    if principal is not None:
+        # Revocation is an O(1) local lookup, so it is still checked on every hit.
+        if revocation_store.is_revoked(hash_token(token)) or is_session_revoked(principal.claims):
+            principal_cache.invalidate_token(token)
+            raise cred_exc
+        set_read_subject(principal.email)
+        return principal
+
+    payload = decode_access_token(token)  # raises on invalid/expired/revoked
+    email = payload.get("sub")
+    if not email:
+        raise cred_exc
+    # Reads for this caller go to a replica unless they wrote something in the last few seconds.
+    set_read_subject(email)
+    user = await get_user_by_email_async(db, email)
     if user is None:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    return user
+        raise cred_exc
+
+    principal = Principal.from_user(user, payload)
+    principal_cache.put(token, principal)
+    return principal
+
+
+async def get_current_admin(principal: Principal = Depends(get_current_principal)) -> Principal:
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized as admin")
+    return principal
@@ -0,0 +1,16 @@
+"""
+Benchmarks for the auth and mail hot paths. Run from backend/:
+
+    python -m benchmarks load --requests 500 --concurrency 20
+    python -m benchmarks micro
+    python -m benchmarks import-time --budget-ms 1500
+    python -m benchmarks compare benchmarks/results/old.json benchmarks/results/new.json
+
+`load` starts the app under uvicorn against a scratch SQLite database (or
+--database-url, e.g. a local Postgres) with a local SMTP sink, seeds users and
+drives the HTTP endpoints and `send_broadcast_email` at the given concurrency.
+`micro` times single functions in-process and `import-time` times cold imports
+of the app, failing above the budget. All of them write p50/p95/p99 latency and
+throughput to a JSON file; `compare` diffs two of them and exits non-zero on
+a regression.
+"""
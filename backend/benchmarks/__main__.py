@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import sys
+from typing import List, Optional
+
+from benchmarks.environment import AppServer, configure, seed_users
+from benchmarks.import_time import run_import_time
+from benchmarks.micro import run_micro
+from benchmarks.results import compare, environment_info, print_results, save_results
+from benchmarks.smtp_sink import SMTPSink
+
+MICRO_BENCHMARKS = ("hash_token", "create_access_token", "decode_access_token",
+                    "build_msg_for_user", "compiled_broadcast_render", "rate_limit_reject",
+                    "jwt_sign_hs256", "jwt_verify_hs256", "jwt_sign_eddsa", "jwt_verify_eddsa",
+                    "jwt_sign_es256", "jwt_verify_es256")
+LOAD_SCENARIOS = ("login", "me", "register", "admin_users", "broadcast")
+
+
+def _names(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def load(args) -> int:
+    from benchmarks.load import run_broadcast, run_http
+
+    sink = SMTPSink().start()
+    database_url = configure(args.database_url, sink.port)
+    emails = seed_users(args.users)
+    server = AppServer(workers=args.workers).start()
+    try:
+        results = asyncio.run(run_http(
+            server.url, args.scenarios, emails, args.requests, args.concurrency, args.warmup
+        ))
+        if "broadcast" in args.scenarios:
+            results["broadcast.send_broadcast_email"] = run_broadcast(emails, args.recipients, args.sessions)
+    finally:
+        server.stop()
+        sink.stop()
+
+    print_results(results)
+    meta = environment_info(
+        database=database_url.split(":", 1)[0], users=args.users, requests=args.requests,
+        concurrency=args.concurrency, warmup=args.warmup, workers=args.workers,
+        recipients=args.recipients, sessions=args.sessions, smtp_messages=sink.messages,
+    )
+    print("Results written to", save_results("load", results, meta, args.output))
+    return 0
+
+
+def micro(args) -> int:
+    configure(args.database_url, 25)
+    results = run_micro(args.benchmarks, args.repeat, args.number)
+    print_results(results)
+    meta = environment_info(repeat=args.repeat, number=args.number)
+    print("Results written to", save_results("micro", results, meta, args.output))
+    return 0
+
+
+def import_time(args) -> int:
+    results, slowest = run_import_time(args.module, args.repeat)
+    print_results(results)
+    print("Slowest app modules (median self time):")
+    for name, seconds in slowest[:10]:
+        print(f"  {name:<20} {1000 * seconds:8.1f} ms")
+    meta = environment_info(module=args.module, repeat=args.repeat, budget_ms=args.budget_ms)
+    print("Results written to", save_results("import", results, meta, args.output))
+    p50 = results[f"import.{args.module}"]["p50_ms"]
+    if p50 > args.budget_ms:
+        print(f"Import of {args.module} takes {p50:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        return 1
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Auth and mail benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("load", help="drive the HTTP API and broadcast sender")
+    p.add_argument("--database-url", help="defaults to a scratch SQLite file")
+    p.add_argument("--scenarios", type=_names, default=list(LOAD_SCENARIOS),
+                   help=f"comma-separated, from {','.join(LOAD_SCENARIOS)}")
+    p.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    p.add_argument("--concurrency", type=int, default=10)
+    p.add_argument("--warmup", type=int, default=5, help="untimed requests per scenario")
+    p.add_argument("--users", type=int, default=1000, help="seeded users")
+    p.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    p.add_argument("--recipients", type=int, default=1000, help="broadcast recipients")
+    p.add_argument("--sessions", type=int, default=4, help="broadcast SMTP sessions")
+    p.add_argument("--output", help="result file; defaults to benchmarks/results/load-<time>.json")
+    p.set_defaults(run=load)
+
+    p = commands.add_parser("micro", help="time single functions in-process")
+    p.add_argument("--database-url", help="defaults to a scratch SQLite file (never queried)")
+    p.add_argument("--benchmarks", type=_names, default=list(MICRO_BENCHMARKS),
+                   help=f"comma-separated, from {','.join(MICRO_BENCHMARKS)}")
+    p.add_argument("--repeat", type=int, default=50, help="timed batches per benchmark")
+    p.add_argument("--number", type=int, default=200, help="calls per batch")
+    p.add_argument("--output", help="result file; defaults to benchmarks/results/micro-<time>.json")
+    p.set_defaults(run=micro)
+
+    p = commands.add_parser("import-time", help="cold import time of the app, checked against a budget")
+    p.add_argument("--module", default="main")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--budget-ms", type=float, default=1500.0, help="fail when the median import is slower")
+    p.add_argument("--output", help="result file; defaults to benchmarks/results/import-<time>.json")
+    p.set_defaults(run=import_time)
+
+    p = commands.add_parser("compare", help="diff two result files")
+    p.add_argument("baseline")
+    p.add_argument("candidate")
+    p.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    p.set_defaults(run=lambda a: 1 if compare(a.baseline, a.candidate, a.threshold) else 0)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
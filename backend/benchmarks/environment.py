@@ -0,0 +1,117 @@
+"""
+Scratch environment for benchmarks: settings, seeded users and the app server.
+
+`configure` must run before any app module is imported, since they read their
+settings from the environment at import time.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_PASSWORD = "benchmark-password"
+BENCH_ADMIN_EMAIL = "bench-admin@example.com"
+BENCH_SECRET_KEY = "benchmark-secret-key-not-for-production"
+
+
+def configure(database_url: Optional[str], smtp_port: int) -> str:
+    """Point the app at the scratch database and SMTP sink; returns the database URL."""
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bitva-bench-"), "bench.db")
+    smtp = {"HOST": "127.0.0.1", "PORT": str(smtp_port), "USE_SSL": "0", "STARTTLS": "0", "PASSWORD": ""}
+    for key, value in smtp.items():
+        os.environ[f"EMAIL_{key}"] = value
+        os.environ[f"B_EMAIL_{key}"] = value
+    os.environ.update({
+        "DATABASE_URL": database_url,
+        "EMAIL_HOST_USER": "noreply@example.com",
+        "B_EMAIL_HOST_USER": "news@example.com",
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or BENCH_SECRET_KEY,
+        "FRONTEND_URL": "http://localhost:5173",
+        "BROADCAST_JOB_RUNNER": "0",
+        "TOKEN_SWEEP_INTERVAL_SECONDS": "0",
+        "RATE_LIMIT_ENABLED": "0",  # every request comes from 127.0.0.1
+    })
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return database_url
+
+
+def seed_users(count: int) -> List[str]:
+    """Create `count` verified users sharing one password hash, plus the admin; returns their emails."""
+    from sqlalchemy import delete, insert
+    from database import SessionLocal
+    from hashing import pwd_context
+    from models import User
+    from schema import init_schema
+    from user_stats import rebuild_user_stats
+
+    init_schema()  # scratch databases start empty; an existing one must already be at head
+    password = pwd_context.hash(BENCH_PASSWORD)
+    emails = [f"bench-user-{i}@example.com" for i in range(count)]
+    rows = [
+        {"email": email, "name": f"Bench User {i}", "password": password,
+         "is_verified": True, "is_active": True, "is_admin": email == BENCH_ADMIN_EMAIL}
+        for i, email in enumerate(emails + [BENCH_ADMIN_EMAIL])
+    ]
+    with SessionLocal() as db:
+        db.execute(delete(User).where(User.email.like("bench-%@example.com")))
+        db.execute(insert(User), rows)
+        db.commit()
+    rebuild_user_stats()
+    return emails
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """The app under uvicorn in a child process, so the load generator does not share its event loop."""
+
+    def __init__(self, workers: int = 1):
+        self.port = _free_port()
+        self.workers = workers
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 30.0) -> "AppServer":
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR,
+            env=os.environ.copy(),
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"App server exited with code {self._process.returncode}")
+            try:
+                httpx.get(f"{self.url}/metrics", timeout=1.0)
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("App server did not start in time")
+
+    def stop(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = None
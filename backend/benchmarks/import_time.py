@@ -0,0 +1,62 @@
+"""
+Import time of the app module, measured in fresh interpreters with `-X importtime`.
+
+The database settings are removed from the environment, so the run also
+proves that importing the app needs neither a database nor its configuration.
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from benchmarks.environment import BACKEND_DIR
+from benchmarks.results import summarize
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def _app_modules() -> set:
+    return {name[:-3] for name in os.listdir(BACKEND_DIR) if name.endswith(".py")}
+
+
+def import_once(module: str) -> Tuple[float, Dict[str, float]]:
+    """Returns (total seconds, self seconds per app module) for one cold import of `module`."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    for name in ("DATABASE_URL", "ASYNC_DATABASE_URL", "DB_HOST", "DB_PORT"):
+        env.pop(name, None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    app_modules = _app_modules()
+    total = 0.0
+    own: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        if name == module and not indent.strip(" "):
+            total = int(cumulative_us) / 1e6
+        if name in app_modules:
+            own[name] = int(self_us) / 1e6
+    return total, own
+
+
+def run_import_time(module: str, repeat: int) -> Tuple[Dict[str, dict], List[Tuple[str, float]]]:
+    """Summary of `repeat` cold imports, plus the app modules' median self time, slowest first."""
+    totals: List[float] = []
+    own: Dict[str, List[float]] = {}
+    for _ in range(repeat):
+        total, modules = import_once(module)
+        totals.append(total)
+        for name, seconds in modules.items():
+            own.setdefault(name, []).append(seconds)
+    summary = summarize(totals, sum(totals))
+    slowest = sorted(((name, statistics.median(v)) for name, v in own.items()), key=lambda item: -item[1])
+    return {f"import.{module}": summary}, slowest
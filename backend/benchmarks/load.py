@@ -0,0 +1,117 @@
+"""
+HTTP load scenarios against a running app, plus a broadcast run against the SMTP sink.
+"""
+import asyncio
+import itertools
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.environment import BENCH_ADMIN_EMAIL, BENCH_PASSWORD
+from benchmarks.results import summarize
+
+# Sends one request for call number i; returns whether it succeeded.
+Request = Callable[[httpx.AsyncClient, int], Awaitable[bool]]
+
+
+async def drive(client: httpx.AsyncClient, request: Request, total: int, concurrency: int, warmup: int = 0) -> dict:
+    """Run `total` requests with `concurrency` in flight and summarize their latency."""
+    for i in range(warmup):
+        await request(client, -1 - i)
+
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            started = time.perf_counter()
+            try:
+                ok = await request(client, i)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors, concurrency=concurrency)
+
+
+def build_requests(emails: List[str], tokens: List[str], admin_token: str) -> Dict[str, Request]:
+    run_id = uuid.uuid4().hex[:8]
+
+    async def login(client, i):
+        form = {"username": emails[i % len(emails)], "password": BENCH_PASSWORD}
+        return (await client.post("/api/login", data=form)).status_code == 200
+
+    async def me(client, i):
+        headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+        return (await client.get("/api/me", headers=headers)).status_code == 200
+
+    async def register(client, i):
+        body = {"email": f"bench-reg-{run_id}-{i}@example.com", "name": "Bench", "password": BENCH_PASSWORD}
+        return (await client.post("/api/register", json=body)).status_code == 200
+
+    async def admin_users(client, i):
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        status = ("all", "verified", "active")[i % 3]
+        return (await client.get(f"/api/admin/users/{status}", params={"limit": 50}, headers=headers)).status_code == 200
+
+    return {"login": login, "me": me, "register": register, "admin_users": admin_users}
+
+
+async def run_http(base_url: str, scenarios: List[str], emails: List[str], requests: int,
+                   concurrency: int, warmup: int) -> Dict[str, dict]:
+    from utils import create_access_token
+
+    tokens = [create_access_token({"sub": email}) for email in emails[:100]]
+    admin_token = create_access_token({"sub": BENCH_ADMIN_EMAIL})
+    available = build_requests(emails, tokens, admin_token)
+
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        for name in scenarios:
+            if name in available:
+                results[f"http.{name}"] = await drive(client, available[name], requests, concurrency, warmup)
+    return results
+
+
+def run_broadcast(emails: List[str], recipients: int, sessions: int) -> dict:
+    """Time `send_broadcast_email` over `recipients` addresses with `sessions` SMTP sessions, unthrottled."""
+    from broadcast import BroadcastEngine, send_broadcast_email
+
+    class TimedEngine(BroadcastEngine):
+        """Stamps each recipient when its message is built and again when its result arrives."""
+
+        def run(self, recipients, build_message, on_result=None, on_progress=None):
+            started: Dict[str, float] = {}
+
+            def build(username, email):
+                started.setdefault(email, time.perf_counter())
+                return build_message(username, email)
+
+            def result(username, email, delivered, error):
+                self.latencies.append(time.perf_counter() - started.pop(email, time.perf_counter()))
+                if on_result is not None:
+                    on_result(username, email, delivered, error)
+
+            return super().run(recipients, build, on_result=result, on_progress=on_progress)
+
+    engine = TimedEngine(sessions=sessions, rate_per_second=0, progress_seconds=3600)
+    engine.latencies = []
+    users: List[Tuple[str, str]] = [
+        (f"Bench User {i}", emails[i % len(emails)].replace("@", f"+{i}@")) for i in range(recipients)
+    ]
+    started = time.perf_counter()
+    sent = send_broadcast_email(users, "Benchmark broadcast", "<p>Hello from the benchmark.</p>", engine=engine)
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for _, _, ok in sent if not ok)
+    return summarize(engine.latencies, elapsed, errors, concurrency=sessions)
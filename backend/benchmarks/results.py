@@ -0,0 +1,105 @@
+"""
+Latency summaries and the JSON result files written by `load` and `micro`.
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile (q in 0..100) of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0, **extra) -> dict:
+    """Latencies in seconds -> p50/p95/p99/mean in ms plus operations per second."""
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": round(1000 * percentile(values, 50), 4),
+        "p95_ms": round(1000 * percentile(values, 95), 4),
+        "p99_ms": round(1000 * percentile(values, 99), 4),
+        "mean_ms": round(1000 * sum(values) / len(values), 4) if values else 0.0,
+        "max_ms": round(1000 * values[-1], 4) if values else 0.0,
+        "throughput_per_s": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    summary.update(extra)
+    return summary
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info(**config) -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+    }
+
+
+def save_results(kind: str, results: Dict[str, dict], meta: dict, path: Optional[str] = None) -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"kind": kind, "meta": meta, "results": results}, f, indent=2)
+    return path
+
+
+def print_results(results: Dict[str, dict]) -> None:
+    print(f"{'benchmark':<32} {'count':>7} {'err':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<32} {r['count']:>7} {r['errors']:>5} {r['p50_ms']:>10.3f} "
+              f"{r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['throughput_per_s']:>10.1f}")
+
+
+def compare(baseline_path: str, candidate_path: str, threshold: float = 10.0) -> int:
+    """
+    Print p95 and throughput changes between two result files. Returns the number
+    of benchmarks whose p95 rose, or throughput fell, by more than `threshold` percent.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    with open(candidate_path, encoding="utf-8") as f:
+        candidate = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'benchmark':<32} {'p95 before':>11} {'p95 after':>11} {'change':>8} {'ops/s change':>13}")
+    for name in sorted(set(baseline) & set(candidate)):
+        before, after = baseline[name], candidate[name]
+        p95_change = _change(before["p95_ms"], after["p95_ms"])
+        rate_change = _change(before["throughput_per_s"], after["throughput_per_s"])
+        regressed = p95_change > threshold or rate_change < -threshold
+        regressions += regressed
+        print(f"{name:<32} {before['p95_ms']:>11.3f} {after['p95_ms']:>11.3f} {p95_change:>+7.1f}% "
+              f"{rate_change:>+12.1f}%{'  REGRESSION' if regressed else ''}")
+    for name in sorted(set(baseline) ^ set(candidate)):
+        print(f"{name:<32} only in {'baseline' if name in baseline else 'candidate'}")
+    return regressions
+
+
+def _change(before: float, after: float) -> float:
+    return 100 * (after - before) / before if before else 0.0
@@ -0,0 +1,377 @@
+"""
+Parallel broadcast sender.
+
+Recipients are fanned out over `sessions` worker threads, each holding its own
+pooled SMTP session. A shared token bucket caps the overall send rate, every
+session is recycled after `max_messages_per_connection` messages, and failed
+recipients are classified: 4xx replies and dropped connections are retried
+with backoff, 5xx replies fail the recipient immediately.
+"""
+import heapq
+import itertools
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+
+from mailer import BROADCAST_SMTP, SMTPConfig, SMTPConnectionPool, compile_broadcast, smtp_pool
+
+load_dotenv()
+
+logger = logging.getLogger("broadcast")
+
+BROADCAST_SESSIONS = int(os.getenv("BROADCAST_SESSIONS", "4"))
+BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", "20"))  # 0 = unlimited
+BROADCAST_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("BROADCAST_MAX_MESSAGES_PER_CONNECTION", "100"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_RETRY_BASE_SECONDS = float(os.getenv("BROADCAST_RETRY_BASE_SECONDS", "5"))
+BROADCAST_PROGRESS_SECONDS = float(os.getenv("BROADCAST_PROGRESS_SECONDS", "10"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until a token is available."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class BroadcastProgress:
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Messages delivered per second so far."""
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "messages_per_second": round(self.throughput, 2),
+        }
+
+
+def classify_failure(exc: Exception) -> Tuple[bool, bool]:
+    """
+    Returns (retry, reconnect) for a failed send.
+    5xx replies are permanent; 4xx replies and connection problems are worth retrying.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        return any(400 <= code < 500 for code in codes), False
+    if isinstance(exc, smtplib.SMTPResponseException):
+        if exc.smtp_code == 421:  # server is closing the session
+            return True, True
+        return 400 <= exc.smtp_code < 500, False
+    if isinstance(exc, (smtplib.SMTPServerDisconnected, OSError)):
+        return True, True
+    return False, False
+
+
+class BroadcastAborted(Exception):
+    """
+    Raised by an `on_result` / `on_progress` callback to stop the run: nothing
+    more is sent, and `BroadcastEngine.run` re-raises it once the workers stop.
+    """
+
+
+# (username, email, delivered, error)
+ResultCallback = Callable[[str, str, bool, Optional[str]], None]
+# Returns an EmailMessage, or bytes ready for sendmail (see mailer.CompiledBroadcast)
+MessageBuilder = Callable[[str, str], Union[EmailMessage, bytes]]
+
+
+class BroadcastEngine:
+    def __init__(
+        self,
+        cfg: SMTPConfig = BROADCAST_SMTP,
+        sessions: int = BROADCAST_SESSIONS,
+        rate_per_second: float = BROADCAST_RATE_PER_SECOND,
+        max_messages_per_connection: int = BROADCAST_MAX_MESSAGES_PER_CONNECTION,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+        retry_base_seconds: float = BROADCAST_RETRY_BASE_SECONDS,
+        progress_seconds: float = BROADCAST_PROGRESS_SECONDS,
+        pool: SMTPConnectionPool = smtp_pool,
+    ):
+        self.cfg = cfg
+        self.sessions = max(1, sessions)
+        self.bucket = TokenBucket(rate_per_second)
+        self.max_messages_per_connection = max_messages_per_connection
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.progress_seconds = progress_seconds
+        self.pool = pool
+
+    def run(
+        self,
+        recipients: Iterable[Tuple[str, str]],
+        build_message: MessageBuilder,
+        on_result: Optional[ResultCallback] = None,
+        on_progress: Optional[Callable[[BroadcastProgress], None]] = None,
+    ) -> BroadcastProgress:
+        """
+        Send one message per (username, email) recipient and block until all are done.
+        `recipients` is consumed lazily, so it can be a generator over a DB cursor.
+        A callback raising BroadcastAborted stops the run and is re-raised here.
+        """
+        run = _BroadcastRun(self, build_message, on_result, on_progress)
+        return run.execute(recipients)
+
+
+class _BroadcastRun:
+    def __init__(self, engine: BroadcastEngine, build_message, on_result, on_progress):
+        self.engine = engine
+        self.build_message = build_message
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.progress = BroadcastProgress()
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=engine.sessions * 50)
+        self._retries: List[Tuple[float, int, Tuple[str, str, int]]] = []  # (ready_at, seq, item)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._feeding = True
+        self._aborted: Optional[BroadcastAborted] = None
+        self._next_report = time.monotonic() + engine.progress_seconds
+
+    def execute(self, recipients: Iterable[Tuple[str, str]]) -> BroadcastProgress:
+        workers = [
+            threading.Thread(target=self._work, name=f"broadcast-{i}", daemon=True)
+            for i in range(self.engine.sessions)
+        ]
+        for t in workers:
+            t.start()
+        try:
+            for username, email in recipients:
+                with self._lock:
+                    self._pending += 1
+                    self.progress.queued += 1
+                if not self._put((username, email, 0)):
+                    break
+        finally:
+            with self._lock:
+                self._feeding = False
+            for t in workers:
+                t.join()
+
+        self.progress.finished_at = time.monotonic()
+        if self._aborted is not None:
+            raise self._aborted
+        self._report(force=True)
+        return self.progress
+
+    def _put(self, item: Tuple[str, str, int]) -> bool:
+        """Queue an item; False once the run is aborted (workers may no longer drain the queue)."""
+        while self._aborted is None:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _abort(self, exc: BroadcastAborted) -> None:
+        with self._lock:
+            if self._aborted is None:
+                self._aborted = exc
+                logger.warning("Broadcast aborted: %s", exc or type(exc).__name__)
+
+    def _next_item(self) -> Optional[Tuple[str, str, int]]:
+        while True:
+            with self._lock:
+                if self._aborted is not None:
+                    return None
+                if self._retries and self._retries[0][0] <= time.monotonic():
+                    return heapq.heappop(self._retries)[2]
+                if not self._feeding and self._pending == 0:
+                    return None
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _work(self) -> None:
+        engine = self.engine
+        conn = None
+        try:
+            while True:
+                item = self._next_item()
+                if item is None:
+                    return
+                username, email, attempt = item
+
+                try:
+                    msg = self.build_message(username, email)
+                except Exception as e:
+                    self._finish(username, email, False, f"Failed to build message: {e}")
+                    continue
+
+                engine.bucket.acquire()
+                try:
+                    if conn is None:
+                        conn = engine.pool.acquire(engine.cfg)
+                    if isinstance(msg, bytes):
+                        conn.server.sendmail(engine.cfg.user, [email], msg)
+                    else:
+                        conn.server.send_message(msg)
+                    engine.pool.record_sent(conn)
+                    self._finish(username, email, True, None)
+                except Exception as e:
+                    retry, reconnect = classify_failure(e)
+                    if reconnect and conn is not None:
+                        engine.pool.release(engine.cfg, conn, healthy=False)
+                        conn = None
+                    if retry and attempt < engine.max_retries:
+                        self._retry(username, email, attempt + 1)
+                    else:
+                        logger.warning("Failed to send to %s <%s>: %s", username, email, e)
+                        self._finish(username, email, False, str(e))
+
+                if conn is not None and conn.messages >= engine.max_messages_per_connection:
+                    engine.pool.release(engine.cfg, conn, healthy=False)  # retire it, start a fresh session
+                    conn = None
+        finally:
+            if conn is not None:
+                engine.pool.release(engine.cfg, conn)
+
+    def _retry(self, username: str, email: str, attempt: int) -> None:
+        ready_at = time.monotonic() + self.engine.retry_base_seconds * (2 ** (attempt - 1))
+        with self._lock:
+            heapq.heappush(self._retries, (ready_at, next(self._seq), (username, email, attempt)))
+            self.progress.retried += 1
+
+    def _finish(self, username: str, email: str, delivered: bool, error: Optional[str]) -> None:
+        if self.on_result is not None:
+            try:
+                self.on_result(username, email, delivered, error)
+            except BroadcastAborted as e:
+                self._abort(e)
+            except Exception:
+                logger.exception("Broadcast result callback failed")
+        with self._lock:
+            self._pending -= 1
+            if delivered:
+                self.progress.sent += 1
+            else:
+                self.progress.failed += 1
+        self._report()
+
+    def _report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not force and now < self._next_report:
+                return
+            self._next_report = now + self.engine.progress_seconds
+        logger.info("Broadcast progress: %s", self.progress.as_dict())
+        if self.on_progress is not None:
+            try:
+                self.on_progress(self.progress)
+            except BroadcastAborted as e:
+                self._abort(e)
+            except Exception:
+                logger.exception("Broadcast progress callback failed")
+
+
+def send_broadcast_email(
+    user_info: Iterable[Tuple[str, str]],
+    subject: str,
+    message_content: str,
+    attachments: Optional[Union[str, Iterable[str]]] = None,
+    reply_to: Optional[str] = None,
+    inline_images: Optional[Dict[str, str]] = None,
+    sleep_between: float = 0.0,
+    engine: Optional[BroadcastEngine] = None,
+    on_result: Optional[ResultCallback] = None,
+    on_progress: Optional[Callable[[BroadcastProgress], None]] = None,
+) -> List[Tuple[str, str, bool]]:
+    """
+    Send to many recipients over parallel pooled SMTP sessions.
+    Returns [(username, email, success_bool), ...] in completion order; pass
+    `on_result` instead to handle results as they arrive.
+    `sleep_between` is kept for old callers and maps to a rate limit of 1/sleep_between.
+    Template: templates/email/broadcast.html with {{ user_name }} and {{ MESSAGE_CONTENT | safe }}.
+    """
+    if engine is None:
+        engine = BroadcastEngine()
+        if sleep_between > 0:
+            engine.bucket = TokenBucket(1 / sleep_between, 1)
+    cfg = engine.cfg
+
+    results: List[Tuple[str, str, bool]] = []
+
+    def collect(username: str, email: str, delivered: bool, error: Optional[str]) -> None:
+        if on_result is not None:
+            on_result(username, email, delivered, error)
+        else:
+            results.append((username, email, delivered))
+
+    def fail_all(error: str) -> List[Tuple[str, str, bool]]:
+        for username, email in user_info:
+            collect(username, email, False, error)
+        return results
+
+    # Render and MIME-encode once; only To and the greeting differ per recipient
+    try:
+        compiled = compile_broadcast(
+            cfg, subject, message_content,
+            attachments=attachments,
+            reply_to=reply_to,
+            inline_images=inline_images,
+        )
+    except Exception as e:
+        logger.error("Failed to render broadcast.html: %s", e)
+        return fail_all(f"Failed to render broadcast.html: {e}")
+
+    # Fail fast if we cannot log in at all
+    try:
+        engine.pool.release(cfg, engine.pool.acquire(cfg))
+    except Exception as e:
+        logger.error("SMTP login failed: %s", e)
+        return fail_all(f"SMTP login failed: {e}")
+
+    engine.run(user_info, compiled.render, on_result=collect, on_progress=on_progress)
+    return results
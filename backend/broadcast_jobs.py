@@ -0,0 +1,376 @@
+"""
+Broadcasts as resumable background jobs.
+
+`create_broadcast_job` records a job in the caller's transaction and returns
+immediately. `BroadcastJobRunner` streams the verified users' (name, email)
+into `broadcast_deliveries`, then sends them in batches through the broadcast
+engine. A batch is marked "sending" and committed before its first message
+goes out, and its results are committed together as a checkpoint, so a job
+picked up again after a crash continues from the last checkpoint. Rows still
+"sending" at that point may or may not have been delivered; they are marked
+"unknown" and never re-sent.
+`python broadcast_jobs.py` runs the runner standalone.
+"""
+import itertools
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, insert, or_, select, update
+from dotenv import load_dotenv
+
+from broadcast import BroadcastAborted, BroadcastEngine, send_broadcast_email
+from database import SessionLocal
+from models import BroadcastDelivery, BroadcastJob
+from replicas import ReadSessionLocal
+from utils import iter_verified_recipients
+
+load_dotenv()
+
+logger = logging.getLogger("broadcast_jobs")
+
+BROADCAST_JOB_RUNNER = os.getenv("BROADCAST_JOB_RUNNER", "1") == "1"
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+BROADCAST_JOB_POLL_SECONDS = float(os.getenv("BROADCAST_JOB_POLL_SECONDS", "5"))
+# A running job whose heartbeat is older than this is taken over by another runner.
+# The heartbeat is refreshed at every checkpoint and progress report, so keep it
+# well above BROADCAST_PROGRESS_SECONDS.
+BROADCAST_JOB_STALE_SECONDS = float(os.getenv("BROADCAST_JOB_STALE_SECONDS", "120"))
+
+
+def create_broadcast_job(db, subject: str, message_content: str, created_by: Optional[str] = None) -> BroadcastJob:
+    """
+    Add a pending broadcast job. Works with both Session and AsyncSession;
+    the runner only sees it once the caller commits.
+    """
+    job = BroadcastJob(
+        subject=subject,
+        message_content=message_content,
+        created_by=created_by,
+        status="pending",
+        recipients_loaded=False,
+        total=0,
+        sent=0,
+        failed=0,
+        unknown=0,
+    )
+    db.add(job)
+    return job
+
+
+def broadcast_job_status(job: BroadcastJob) -> dict:
+    """Progress as of the job's last checkpoint."""
+    pending = max(job.total - job.sent - job.failed - job.unknown, 0)
+    elapsed = 0.0
+    if job.started_at is not None:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+    return {
+        "id": job.id,
+        "subject": job.subject,
+        "status": job.status,
+        "created_by": job.created_by,
+        "total": job.total if job.recipients_loaded else None,
+        "sent": job.sent,
+        "failed": job.failed,
+        "unknown": job.unknown,
+        "pending": pending if job.recipients_loaded else None,
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_second": round(job.sent / elapsed, 2) if elapsed > 0 else 0.0,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class _JobLost(BroadcastAborted):
+    """
+    Another runner took the job over (our heartbeat went stale). Raised from the
+    progress heartbeat, it also stops the engine mid-batch.
+    """
+
+
+# delivery id -> (delivered, error)
+_Results = Dict[int, Tuple[bool, Optional[str]]]
+
+
+class BroadcastJobRunner:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        read_session_factory=ReadSessionLocal,
+        engine_factory=BroadcastEngine,
+        batch_size: int = BROADCAST_BATCH_SIZE,
+        poll_seconds: float = BROADCAST_JOB_POLL_SECONDS,
+        stale_seconds: float = BROADCAST_JOB_STALE_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.engine_factory = engine_factory
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="broadcast-jobs", daemon=True)
+        self._thread.start()
+        logger.info("Broadcast job runner %s started", self.worker_id)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Finish the current batch, then hand the job back so it resumes without a stale wait."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def notify(self) -> None:
+        """Wake the runner after committing a new job instead of waiting for the next poll."""
+        self._wake.set()
+
+    def run_once(self) -> bool:
+        """Claim one job and work it in the calling thread; returns False if there was none."""
+        job_id = self._claim_job()
+        if job_id is None:
+            return False
+        self._run_job(job_id)
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                logger.exception("Broadcast job runner failed")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    # ----------------------------
+    # Job ownership
+    # ----------------------------
+    def _claim_job(self) -> Optional[int]:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.stale_seconds)
+        with self.session_factory() as db:
+            job = db.execute(
+                select(BroadcastJob)
+                .where(or_(
+                    BroadcastJob.status == "pending",
+                    and_(
+                        BroadcastJob.status == "running",
+                        or_(BroadcastJob.heartbeat_at.is_(None), BroadcastJob.heartbeat_at < stale),
+                    ),
+                ))
+                .order_by(BroadcastJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).scalars().first()
+            if job is None:
+                return None
+
+            if job.status == "running":
+                # The previous owner may have sent these before dying; do not send them twice.
+                unknown = db.execute(
+                    update(BroadcastDelivery)
+                    .where(BroadcastDelivery.job_id == job.id, BroadcastDelivery.status == "sending")
+                    .values(status="unknown", error="Runner stopped while sending")
+                ).rowcount or 0
+                job.unknown += unknown
+                logger.warning("Resuming broadcast job %s (%d deliveries in unknown state)", job.id, unknown)
+
+            job.status = "running"
+            job.worker_id = self.worker_id
+            job.heartbeat_at = now
+            job.started_at = job.started_at or now
+            db.commit()
+            return job.id
+
+    def _owned(self, job_id: int):
+        return and_(BroadcastJob.id == job_id, BroadcastJob.worker_id == self.worker_id)
+
+    def _heartbeat(self, job_id: int, **values) -> None:
+        with self.session_factory() as db:
+            result = db.execute(
+                update(BroadcastJob).where(self._owned(job_id)).values(**{"heartbeat_at": datetime.utcnow(), **values})
+            )
+            db.commit()
+        if not result.rowcount:
+            raise _JobLost()
+
+    # ----------------------------
+    # Job execution
+    # ----------------------------
+    def _run_job(self, job_id: int) -> None:
+        try:
+            with self.session_factory() as db:
+                job = db.get(BroadcastJob, job_id)
+                subject, message_content, loaded = job.subject, job.message_content, job.recipients_loaded
+            if not loaded:
+                self._load_recipients(job_id)
+
+            engine = self.engine_factory()
+            while not self._stop.is_set():
+                if not self._smtp_available(job_id, engine):
+                    self._stop.wait(self.poll_seconds)
+                    continue
+                batch = self._claim_batch(job_id)
+                if not batch:
+                    self._heartbeat(job_id, status="completed", finished_at=datetime.utcnow(), last_error=None)
+                    logger.info("Broadcast job %s completed", job_id)
+                    return
+                results = self._send(job_id, subject, message_content, batch, engine)
+                self._checkpoint(job_id, batch, results)
+
+            # Shutting down between batches: release the job for the next runner.
+            self._heartbeat(job_id, worker_id=None, heartbeat_at=None)
+        except _JobLost:
+            logger.warning("Broadcast job %s was taken over by another runner", job_id)
+        except Exception as e:
+            logger.exception("Broadcast job %s failed", job_id)
+            try:
+                self._heartbeat(job_id, status="failed", finished_at=datetime.utcnow(), last_error=str(e))
+            except Exception:
+                logger.exception("Could not mark broadcast job %s as failed", job_id)
+
+    def _load_recipients(self, job_id: int) -> None:
+        """
+        Snapshot the recipient list, streaming it from the users table (on a
+        replica when one is usable) in chunks; the deliveries are written in
+        one transaction so a crash simply reloads it.
+        """
+        total = 0
+        with self.read_session_factory() as reader, self.session_factory() as db:
+            recipients = iter_verified_recipients(reader, chunk_size=self.batch_size)
+            while True:
+                chunk = [
+                    {"job_id": job_id, "name": name, "email": email, "status": "pending"}
+                    for name, email in itertools.islice(recipients, self.batch_size)
+                ]
+                if not chunk:
+                    break
+                db.execute(insert(BroadcastDelivery), chunk)
+                total += len(chunk)
+            result = db.execute(
+                update(BroadcastJob)
+                .where(self._owned(job_id))
+                .values(total=total, recipients_loaded=True, heartbeat_at=datetime.utcnow())
+            )
+            if not result.rowcount:
+                db.rollback()
+                raise _JobLost()
+            db.commit()
+        logger.info("Broadcast job %s: %d recipients", job_id, total)
+
+    def _smtp_available(self, job_id: int, engine: BroadcastEngine) -> bool:
+        """Wait out an SMTP outage instead of failing every recipient of the batch."""
+        try:
+            engine.pool.release(engine.cfg, engine.pool.acquire(engine.cfg))
+            return True
+        except Exception as e:
+            logger.error("Broadcast job %s waiting for SMTP: %s", job_id, e)
+            self._heartbeat(job_id, last_error=f"SMTP unavailable: {e}")
+            return False
+
+    def _claim_batch(self, job_id: int) -> List[Tuple[int, str, str]]:
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            batch = db.execute(
+                select(BroadcastDelivery.id, BroadcastDelivery.name, BroadcastDelivery.email)
+                .where(BroadcastDelivery.job_id == job_id, BroadcastDelivery.status == "pending")
+                .order_by(BroadcastDelivery.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if batch:
+                db.execute(
+                    update(BroadcastDelivery)
+                    .where(BroadcastDelivery.id.in_([row.id for row in batch]))
+                    .values(status="sending", attempted_at=now)
+                )
+                result = db.execute(update(BroadcastJob).where(self._owned(job_id)).values(heartbeat_at=now))
+                if not result.rowcount:
+                    db.rollback()
+                    raise _JobLost()
+            db.commit()
+        return [tuple(row) for row in batch]
+
+    def _send(self, job_id: int, subject: str, message_content: str,
+              batch: List[Tuple[int, str, str]], engine: BroadcastEngine) -> _Results:
+        ids_by_email = {email: delivery_id for delivery_id, _, email in batch}
+        results: _Results = {}
+
+        def collect(username: str, email: str, delivered: bool, error: Optional[str]) -> None:
+            results[ids_by_email[email]] = (delivered, error)
+
+        send_broadcast_email(
+            ((name or "", email) for _, name, email in batch),
+            subject,
+            message_content,
+            engine=engine,
+            on_result=collect,
+            on_progress=lambda progress: self._heartbeat(job_id),
+        )
+        return results
+
+    def _checkpoint(self, job_id: int, batch: List[Tuple[int, str, str]], results: _Results) -> None:
+        sent_ids: List[int] = []
+        failed: Dict[str, List[int]] = {}
+        unknown_ids: List[int] = []
+        for delivery_id, _, _ in batch:
+            outcome = results.get(delivery_id)
+            if outcome is None:
+                unknown_ids.append(delivery_id)
+            elif outcome[0]:
+                sent_ids.append(delivery_id)
+            else:
+                failed.setdefault(outcome[1] or "Unknown error", []).append(delivery_id)
+
+        with self.session_factory() as db:
+            if sent_ids:
+                db.execute(update(BroadcastDelivery).where(BroadcastDelivery.id.in_(sent_ids)).values(status="sent"))
+            for error, ids in failed.items():
+                db.execute(
+                    update(BroadcastDelivery).where(BroadcastDelivery.id.in_(ids)).values(status="failed", error=error)
+                )
+            if unknown_ids:
+                db.execute(
+                    update(BroadcastDelivery).where(BroadcastDelivery.id.in_(unknown_ids)).values(status="unknown")
+                )
+            result = db.execute(
+                update(BroadcastJob)
+                .where(self._owned(job_id))
+                .values(
+                    sent=BroadcastJob.sent + len(sent_ids),
+                    failed=BroadcastJob.failed + sum(len(ids) for ids in failed.values()),
+                    unknown=BroadcastJob.unknown + len(unknown_ids),
+                    heartbeat_at=datetime.utcnow(),
+                )
+            )
+            if not result.rowcount:
+                db.rollback()
+                raise _JobLost()
+            db.commit()
+
+
+broadcast_runner = BroadcastJobRunner()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    broadcast_runner.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broadcast_runner.stop()
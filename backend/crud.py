@@ -1,12 +1,57 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from utils import get_password_hash
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import dialect_insert
+from utils import get_password_hash, normalize_email
 from schemas import UserCreate
 from models import User
 
-def create_user(db: Session, user: UserCreate):
-    hashed_pw = get_password_hash(user.password)
-    db_user = User(email=user.email, name=user.name, password=hashed_pw)
+def create_user(db: Session, user: UserCreate, hashed_pw: str = None):
+    if hashed_pw is None:
+        hashed_pw = get_password_hash(user.password)
+    db_user = User(email=normalize_email(user.email), name=user.name, password=hashed_pw)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
+
+async def register_user_async(
+    db: AsyncSession,
+    user: UserCreate,
+    hashed_pw: str,
+    verification_token: str,
+    verification_token_expiry: datetime,
+) -> Optional[Row]:
+    """
+    Insert a new user together with their verification token in one
+    INSERT ... ON CONFLICT DO NOTHING RETURNING. Returns (id, email, name),
+    or None if the email is already registered. Does not commit.
+    """
+    stmt = (
+        dialect_insert(db, User)
+        .values(
+            email=normalize_email(user.email),
+            name=user.name,
+            password=hashed_pw,
+            verification_token=verification_token,
+            verification_token_expiry=verification_token_expiry,
+        )
+        .on_conflict_do_nothing()
+        .returning(User.id, User.email, User.name)
+    )
+    result = await db.execute(stmt)
+    return result.first()
+
+async def update_password_hash_async(db: AsyncSession, user_id: int, old_hash: str, new_hash: str) -> bool:
+    """
+    Replace a stored hash with one made under the current hashing policy.
+    Conditional on the old hash, so a password changed meanwhile is never
+    overwritten. Does not commit.
+    """
+    result = await db.execute(
+        update(User).where(User.id == user_id, User.password == old_hash).values(password=new_hash)
+    )
+    return bool(result.rowcount)
@@ -1,7 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 import os
+import threading
 
 
 load_dotenv()
@@ -12,17 +16,115 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
 
-DATABASE_URL = f"postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    return parsed.set(drivername=_ASYNC_DRIVERS.get(backend, parsed.drivername)).render_as_string(hide_password=False)
+
+# Built when an engine is first needed, not at import: without DATABASE_URL the
+# DB_* settings may be incomplete, and that should only fail code that connects.
+def database_url() -> str:
+    return os.getenv("DATABASE_URL") or f"postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+def async_database_url() -> str:
+    return os.getenv("ASYNC_DATABASE_URL") or _async_url(database_url())
+
+def _engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+_engine = None
+_async_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    """The sync engine, created on first use so importing this module never loads a DB driver."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                url = database_url()
+                _engine = create_engine(url, **_engine_options(url))
+    return _engine
+
+def get_async_engine() -> AsyncEngine:
+    """Engine for the async routes, so a slow query only suspends its own request."""
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                url = async_database_url()
+                _async_engine = create_async_engine(url, **_engine_options(url))
+    return _async_engine
+
+async def dispose_engines() -> None:
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
+
+class _LazyBind:
+    """Session factory that binds to its engine when the first session is made."""
+
+    def __init__(self, engine_factory, **kw):
+        super().__init__(**kw)
+        self._engine_factory = engine_factory
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self._engine_factory())
+        return super().__call__(**local_kw)
+
+class _LazySessionmaker(_LazyBind, sessionmaker):
+    pass
+
+class _LazyAsyncSessionmaker(_LazyBind, async_sessionmaker):
+    pass
+
+
+SessionLocal = _LazySessionmaker(get_engine, autocommit=False, autoflush=False)
+AsyncSessionLocal = _LazyAsyncSessionmaker(get_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def __getattr__(name):
+    # `from database import engine` (or DATABASE_URL) keeps working; it is just built at that point.
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "DATABASE_URL":
+        return database_url()
+    if name == "ASYNC_DATABASE_URL":
+        return async_database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 Base = declarative_base()
 
+_UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+def dialect_insert(session, table):
+    """`insert()` for the session's backend, with on_conflict_do_nothing/do_update available."""
+    return _UPSERT_DIALECTS[session.get_bind().dialect.name].insert(table)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
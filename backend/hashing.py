@@ -0,0 +1,386 @@
+"""
+Password hashing, offloaded to a process pool.
+
+The hashing policy (PASSWORD_HASH_SCHEME and its cost parameters) decides how
+new hashes are made; hashes made under an older or weaker policy still verify
+and are replaced on the next successful login (`verify_and_update_password_async`).
+A cost set to "auto" is picked at startup by `configure_hashing`, which times
+verification on this machine and takes the highest cost that stays within
+PASSWORD_HASH_TARGET_MS. Hashes are only ever upgraded, so workers that
+calibrate to different costs do not rehash each other's hashes back and forth.
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+from metrics import Counter, observe_operation, register_metric
+
+load_dotenv()
+
+logger = logging.getLogger("hashing")
+
+# ----------------------------
+# Configuration
+# ----------------------------
+# Number of worker processes hashing passwords. 0 hashes in the calling thread (dev/tests).
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(os.cpu_count() or 1)))
+# Jobs allowed to wait for a free worker before new ones are rejected with 503.
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+HASH_POOL_START_METHOD = os.getenv("HASH_POOL_START_METHOD", "spawn")
+
+# Scheme for new hashes: bcrypt or argon2 (argon2id; needs argon2-cffi).
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+# Cost parameters; "auto" calibrates against PASSWORD_HASH_TARGET_MS at startup.
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS", "12")
+ARGON2_TIME_COST = os.getenv("ARGON2_TIME_COST", "2")
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+# Verify time per login that calibration aims for, on one core.
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+
+# Calibration never picks less than this, however slow the machine.
+BCRYPT_MIN_ROUNDS = 10
+ARGON2_MIN_TIME_COST = 2
+SCHEMES = ("bcrypt", "argon2")
+
+
+# ----------------------------
+# Policy
+# ----------------------------
+@dataclass(frozen=True)
+class HashPolicy:
+    scheme: str = "bcrypt"
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 2
+    argon2_memory_cost: int = 19456
+    argon2_parallelism: int = 1
+
+    def context(self) -> CryptContext:
+        """New hashes use `scheme`; the other schemes stay verifiable if their backend is installed."""
+        if self.scheme not in SCHEMES:
+            raise ValueError(f"Unsupported PASSWORD_HASH_SCHEME: {self.scheme!r}")
+        schemes = [self.scheme] + [s for s in SCHEMES if s != self.scheme and _has_backend(s)]
+        settings = {"bcrypt__rounds": self.bcrypt_rounds}
+        if "argon2" in schemes:
+            settings.update(argon2__type="ID", argon2__rounds=self.argon2_time_cost,
+                            argon2__memory_cost=self.argon2_memory_cost,
+                            argon2__parallelism=self.argon2_parallelism)
+        return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+    def is_weaker(self, hashed: str) -> bool:
+        """True if `hashed` uses another scheme or a lower cost than this policy."""
+        handler = pwd_context.identify(hashed, resolve=True, required=False)
+        if handler is None or handler.name != self.scheme:
+            return True
+        parsed = handler.from_string(hashed)
+        if self.scheme == "bcrypt":
+            return parsed.rounds < self.bcrypt_rounds
+        return (parsed.type != "id" or parsed.rounds < self.argon2_time_cost
+                or parsed.memory_cost < self.argon2_memory_cost)
+
+
+def _has_backend(scheme: str) -> bool:
+    from passlib.registry import get_crypt_handler
+
+    return get_crypt_handler(scheme).has_backend()
+
+
+def _cost(value: str, default: int) -> int:
+    return default if value == "auto" else int(value)
+
+
+def policy_from_env() -> HashPolicy:
+    """The configured policy, with "auto" costs at their defaults until calibrated."""
+    return HashPolicy(
+        scheme=PASSWORD_HASH_SCHEME,
+        bcrypt_rounds=_cost(BCRYPT_ROUNDS, 12),
+        argon2_time_cost=_cost(ARGON2_TIME_COST, 2),
+        argon2_memory_cost=ARGON2_MEMORY_COST,
+        argon2_parallelism=ARGON2_PARALLELISM,
+    )
+
+
+policy = policy_from_env()
+pwd_context = policy.context()
+calibrated_verify_ms: Optional[float] = None
+
+
+def set_policy(new_policy: HashPolicy) -> None:
+    """Install `new_policy` in this process; also the pool processes' initializer."""
+    global policy, pwd_context
+    policy, pwd_context = new_policy, new_policy.context()
+
+
+def measure_verify_ms(candidate: HashPolicy, samples: int = 3) -> float:
+    context = candidate.context()
+    hashed = context.hash("calibration password")
+    best = math.inf
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("calibration password", hashed)
+        best = min(best, time.perf_counter() - started)
+    return 1000 * best
+
+
+def calibrate(base: HashPolicy, target_ms: float = PASSWORD_HASH_TARGET_MS) -> Tuple[HashPolicy, float]:
+    """
+    Highest cost for `base.scheme` whose verify time stays within `target_ms`
+    on this machine (never below the minimum); returns it with its measured time.
+    """
+    if base.scheme == "bcrypt":
+        # Each round doubles the work.
+        ms = measure_verify_ms(replace(base, bcrypt_rounds=BCRYPT_MIN_ROUNDS))
+        rounds = BCRYPT_MIN_ROUNDS + max(0, math.floor(math.log2(target_ms / ms)))
+        tuned = replace(base, bcrypt_rounds=min(rounds, 20))
+    else:
+        # Time cost scales linearly at a fixed memory cost.
+        ms = measure_verify_ms(replace(base, argon2_time_cost=1))
+        tuned = replace(base, argon2_time_cost=min(max(ARGON2_MIN_TIME_COST, math.floor(target_ms / ms)), 20))
+    return tuned, measure_verify_ms(tuned, samples=1)
+
+
+def configure_hashing() -> HashPolicy:
+    """Calibrate "auto" costs and install the policy; call at startup, before the pool is used."""
+    global calibrated_verify_ms
+    configured = policy_from_env()
+    auto = BCRYPT_ROUNDS == "auto" if configured.scheme == "bcrypt" else ARGON2_TIME_COST == "auto"
+    if auto:
+        configured, calibrated_verify_ms = calibrate(configured)
+    if configured != policy:
+        set_policy(configured)
+        hash_pool.shutdown()  # pool processes pick the policy up when they are restarted
+    logger.info("Password hashing: %s%s", asdict(policy),
+                f" (calibrated, verify {calibrated_verify_ms:.0f} ms)" if auto else "")
+    return policy
+
+
+# ----------------------------
+# Worker-side functions (run inside the pool processes)
+# ----------------------------
+def _timed(func: Callable, *args) -> Tuple[object, float]:
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+def _hash(password: str) -> Tuple[str, float]:
+    return _timed(pwd_context.hash, password)
+
+def _verify(plain_password: str, hashed_password: str) -> Tuple[bool, float]:
+    return _timed(pwd_context.verify, plain_password, hashed_password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[Tuple[bool, Optional[str]], float]:
+    def verify_and_update():
+        if not pwd_context.verify(plain_password, hashed_password):
+            return False, None
+        return True, pwd_context.hash(plain_password) if policy.is_weaker(hashed_password) else None
+    return _timed(verify_and_update)
+
+def _hash_plain(password: str) -> str:
+    return pwd_context.hash(password)
+
+# metrics operation name per pool job (compute time only, queueing excluded)
+_OPERATIONS = {_hash: "password_hash", _verify: "password_verify", _verify_and_update: "password_verify"}
+
+password_rehashes = register_metric(Counter(
+    "bitva_password_rehashes_total", "Stored password hashes upgraded to the current policy at login.", ("scheme",)))
+
+
+# ----------------------------
+# Pool
+# ----------------------------
+class PasswordHashPool:
+    """
+    Process pool for password hashing with a bounded backlog.
+
+    At most `size + queue_size` jobs are accepted at once; anything beyond that is
+    rejected with 503 instead of piling up behind the CPU.
+    """
+
+    def __init__(self, size: int, queue_size: int, start_method: str = "spawn"):
+        self.size = size
+        self.queue_size = queue_size
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        self._in_flight = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._compute_total = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.size,
+                        mp_context=multiprocessing.get_context(self.start_method),
+                        initializer=set_policy,
+                        initargs=(policy,),
+                    )
+        return self._executor
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.size + self.queue_size:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server is busy, please try again shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._in_flight += 1
+            self._submitted += 1
+
+    def _release(self, func: Callable, started: float, compute: Optional[float]) -> None:
+        latency = time.perf_counter() - started
+        if compute is not None and func in _OPERATIONS:
+            observe_operation(_OPERATIONS[func], compute)
+        with self._lock:
+            self._in_flight -= 1
+            if compute is None:
+                self._failed += 1
+                return
+            self._completed += 1
+            self._latency_total += latency
+            self._compute_total += compute
+            if latency > self._latency_max:
+                self._latency_max = latency
+
+    def _submit(self, func: Callable, *args) -> Tuple[Future, float]:
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            if self.size <= 0:
+                future: Future = Future()
+                try:
+                    future.set_result(func(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._release(func, started, None)
+            raise
+        return future, started
+
+    def run(self, func: Callable, *args):
+        """Run `func` on the pool and block the calling thread until it finishes."""
+        future, started = self._submit(func, *args)
+        compute = None
+        try:
+            result, compute = future.result()
+            return result
+        finally:
+            self._release(func, started, compute)
+
+    async def run_async(self, func: Callable, *args):
+        """Run `func` on the pool without blocking the event loop."""
+        if self.size <= 0:
+            return await asyncio.to_thread(self.run, func, *args)
+        future, started = self._submit(func, *args)
+        compute = None
+        try:
+            result, compute = await asyncio.wrap_future(future)
+            return result
+        finally:
+            self._release(func, started, compute)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            completed = self._completed or 1
+            return {
+                "pool_size": self.size,
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - max(self.size, 1)),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "latency_avg_ms": 1000 * self._latency_total / completed,
+                "latency_max_ms": 1000 * self._latency_max,
+                "compute_avg_ms": 1000 * self._compute_total / completed,
+                "wait_avg_ms": 1000 * (self._latency_total - self._compute_total) / completed,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+hash_pool = PasswordHashPool(HASH_POOL_SIZE, HASH_QUEUE_SIZE, HASH_POOL_START_METHOD)
+
+
+# ----------------------------
+# Public API
+# ----------------------------
+def hash_password(password: str) -> str:
+    return hash_pool.run(_hash, password)
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return hash_pool.run(_verify, plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.run_async(_hash, password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    (verified, new hash). The new hash is set when the stored one is weaker than
+    the current policy; it is computed in the same pool job as the verification.
+    """
+    verified, new_hash = await hash_pool.run_async(_verify_and_update, plain_password, hashed_password)
+    if new_hash is not None:
+        password_rehashes.inc(policy.scheme)
+    return verified, new_hash
+
+def hashing_stats() -> dict:
+    return {**hash_pool.stats(), "policy": asdict(policy), "calibrated_verify_ms": calibrated_verify_ms}
+
+
+# ----------------------------
+# Bulk hashing (imports)
+# ----------------------------
+def create_bulk_hash_executor(workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    A separate process pool for bulk jobs, so an import never fills the
+    request pool's backlog and starves logins. 0 hashes inline.
+    """
+    if workers <= 0:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(HASH_POOL_START_METHOD),
+                               initializer=set_policy, initargs=(policy,))
+
+def hash_passwords(passwords: List[str], executor: Optional[ProcessPoolExecutor] = None, chunksize: int = 1) -> List[str]:
+    """Hash many passwords, spread over `executor`'s processes; results keep the input order."""
+    if executor is None:
+        return [pwd_context.hash(password) for password in passwords]
+    return list(executor.map(_hash_plain, passwords, chunksize=chunksize))
+
+def is_password_hash(value: str) -> bool:
+    """True if `value` is already a hash this app can verify (e.g. bcrypt from a migrated user base)."""
+    return pwd_context.identify(value, required=False) is not None
+
+
+if __name__ == "__main__":
+    # Print the cost "auto" would pick on this machine, to pin it in the environment.
+    logging.basicConfig(level=logging.INFO)
+    tuned, ms = calibrate(policy_from_env())
+    print(f"{asdict(tuned)}: verify {ms:.0f} ms (target {PASSWORD_HASH_TARGET_MS:.0f} ms)")
@@ -0,0 +1,294 @@
+"""
+Bulk user import.
+
+Rows come in as CSV (with a header) or NDJSON, each with `email`, `name` and
+either `password` or an existing bcrypt `password_hash`. Every batch is
+checked against the users table with one set-based query, plaintext
+passwords are hashed across a process pool, and the new users are inserted
+with a single executemany per batch.
+`python importer.py users.csv` runs an import from the command line.
+"""
+import argparse
+import codecs
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+
+from database import SessionLocal
+from hashing import create_bulk_hash_executor, hash_passwords, is_password_hash
+from models import User
+from schemas import UserImportRow
+from user_stats import bump_user_stats
+from utils import normalize_email
+
+load_dotenv()
+
+logger = logging.getLogger("importer")
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Processes hashing plaintext passwords during an import (0 = inline).
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", str(os.cpu_count() or 1)))
+IMPORT_MAX_ERRORS = 100  # rejected rows listed in the report
+
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.total / elapsed if elapsed > 0 else 0.0
+
+    def reject(self, line: int, reason: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append(f"row {line}: {reason}")
+
+    def as_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "errors": self.errors,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def decode_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    UTF-8 text lines, line endings included, from bytes split at arbitrary
+    points (an upload as it arrives). Raises UnicodeDecodeError on bad input.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="strict")
+    tail = ""
+    for chunk in chunks:
+        *lines, tail = (tail + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class RowParser:
+    """
+    Turns a stream of CSV or NDJSON lines into dicts. CSV goes through a single
+    csv.reader, so quoted fields may span lines; its first record is the header.
+    """
+
+    def __init__(self, format: str):
+        if format not in ("csv", "ndjson"):
+            raise ValueError(f"Unknown import format: {format!r}")
+        self.format = format
+        self.line = 0
+
+    def feed(self, lines: Iterable[str]) -> Iterator[dict]:
+        if self.format == "ndjson":
+            yield from self._ndjson(lines)
+            return
+        reader = csv.reader(lines)
+        header: Optional[List[str]] = None
+        for record in reader:
+            # A record starts on the line after the previous one ended.
+            line, self.line = self.line + 1, reader.line_num
+            if not any(value.strip() for value in record):
+                continue
+            if header is None:
+                header = [name.strip() for name in record]
+                continue
+            row = dict(zip(header, record))
+            row["_line"] = line
+            yield row
+
+    def _ndjson(self, lines: Iterable[str]) -> Iterator[dict]:
+        for text in lines:
+            self.line += 1
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                yield {"_line": self.line, "_error": f"invalid JSON: {e}"}
+                continue
+            if not isinstance(row, dict):
+                yield {"_line": self.line, "_error": "expected a JSON object"}
+                continue
+            row["_line"] = self.line
+            yield row
+
+
+class UserImporter:
+    """
+    Imports users batch by batch; use as a context manager so the hashing
+    processes are shut down afterwards.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        hash_workers: int = IMPORT_HASH_WORKERS,
+        verified: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.hash_workers = hash_workers
+        self.verified = verified
+        self.report = ImportReport()
+        self._seen: Set[str] = set()
+        self._executor = None
+
+    def __enter__(self) -> "UserImporter":
+        self._executor = create_bulk_hash_executor(self.hash_workers)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self.report.finished_at = time.monotonic()
+
+    def import_rows(self, rows: Iterable[dict]) -> ImportReport:
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        return self.report
+
+    def import_batch(self, rows: List[dict]) -> None:
+        report = self.report
+        report.total += len(rows)
+
+        candidates: Dict[str, UserImportRow] = {}
+        for raw in rows:
+            line = raw.pop("_line", report.total)
+            if "_error" in raw:
+                report.reject(line, raw["_error"])
+                continue
+            try:
+                row = UserImportRow(**{k: v for k, v in raw.items() if v not in ("", None)})
+            except ValidationError as e:
+                report.reject(line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                continue
+            if not row.password and not row.password_hash:
+                report.reject(line, "password or password_hash is required")
+                continue
+            if row.password_hash and not is_password_hash(row.password_hash):
+                report.reject(line, "password_hash is not a supported hash")
+                continue
+            row.email = normalize_email(row.email)
+            if row.email in self._seen:
+                report.duplicates += 1
+                continue
+            self._seen.add(row.email)
+            candidates[row.email] = row
+
+        if candidates:
+            self._insert(candidates)
+        logger.info("Import progress: %s", {k: v for k, v in report.as_dict().items() if k != "errors"})
+
+    def _insert(self, candidates: Dict[str, UserImportRow]) -> None:
+        with self.session_factory() as db:
+            for attempt in range(2):
+                existing = set(db.execute(
+                    select(func.lower(User.email)).where(func.lower(User.email).in_(list(candidates)))
+                ).scalars())
+                for email in existing:
+                    del candidates[email]
+                self.report.duplicates += len(existing)
+                if not candidates:
+                    return
+
+                if attempt == 0:
+                    hashes = self._hash([row for row in candidates.values() if not row.password_hash])
+                now = datetime.utcnow()
+                values = [
+                    {
+                        "email": row.email,
+                        "name": row.name,
+                        "password": row.password_hash or hashes[row.email],
+                        "is_verified": self.verified if row.is_verified is None else row.is_verified,
+                        "is_active": True,
+                        "is_admin": False,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for row in candidates.values()
+                ]
+                try:
+                    db.execute(insert(User), values)
+                    bump_user_stats(
+                        db,
+                        total=len(values),
+                        verified=sum(1 for v in values if v["is_verified"]),
+                        active=len(values),
+                        signups={now.date(): len(values)},
+                    )
+                    db.commit()
+                    self.report.imported += len(values)
+                    return
+                except IntegrityError:
+                    # Someone registered one of these emails since the duplicate check; check again.
+                    db.rollback()
+                    if attempt:
+                        raise
+
+    def _hash(self, rows: List[UserImportRow]) -> Dict[str, str]:
+        if not rows:
+            return {}
+        chunksize = max(1, len(rows) // (max(self.hash_workers, 1) * 4))
+        hashes = hash_passwords([row.password for row in rows], self._executor, chunksize=chunksize)
+        return {row.email: hashed for row, hashed in zip(rows, hashes)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk-import users from CSV or NDJSON.")
+    parser.add_argument("path", help="file to import, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="defaults to the file extension")
+    parser.add_argument("--verified", action="store_true", help="mark imported users as verified")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--hash-workers", type=int, default=IMPORT_HASH_WORKERS)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8", newline="")
+    try:
+        with UserImporter(batch_size=args.batch_size, hash_workers=args.hash_workers, verified=args.verified) as importer:
+            importer.import_rows(RowParser(fmt).feed(source))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(json.dumps(importer.report.as_dict(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
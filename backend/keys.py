@@ -0,0 +1,252 @@
+"""
+JWT signing keys.
+
+Tokens are signed with the active key of JWT_ALGORITHM: HS256 with SECRET_KEY
+(the default), or EdDSA / ES256 with private keys kept as `<kid>.pem` files in
+JWT_KEYS_DIR. The `kid` header picks the verifying key, so keys can be rotated:
+add a new key (`python keys.py generate`), let it become active (the newest kid
+wins unless JWT_ACTIVE_KID pins one), and delete the old file once the tokens
+it signed have expired. Key files are parsed once into key objects; the public
+half of every asymmetric key is published as a JWKS document so other services
+can verify tokens without the shared secret.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import jwt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("keys")
+
+SECRET_KEY = os.getenv("SECRET_KEY")
+# Algorithm new tokens are signed with: HS256, EdDSA or ES256.
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "")
+# Signing key; defaults to the newest kid (kids start with their creation time).
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", "")
+# Keep accepting HS256 tokens after switching to EdDSA/ES256, until they have expired.
+JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "1") == "1"
+# A token with an unknown kid re-reads JWT_KEYS_DIR (rolling rotation), at most once per
+# this many seconds whatever the kid; unknown kids in between are rejected without a read.
+JWT_KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", "5"))
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", "300"))
+
+ASYMMETRIC_ALGORITHMS = ("EdDSA", "ES256")
+
+
+@dataclass(frozen=True)
+class JWTKey:
+    kid: Optional[str]
+    algorithm: str
+    signing_key: object  # private key object, or the HMAC secret; None for verify-only keys
+    verifying_key: object
+
+    def jwk(self) -> dict:
+        from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+
+        to_jwk = OKPAlgorithm.to_jwk if self.algorithm == "EdDSA" else ECAlgorithm.to_jwk
+        return {**to_jwk(self.verifying_key, as_dict=True), "kid": self.kid, "alg": self.algorithm, "use": "sig"}
+
+
+# ----------------------------
+# Key files
+# ----------------------------
+def _algorithm_for(key) -> str:
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.name == "secp256r1":
+        return "ES256"
+    raise ValueError(f"Unsupported JWT key type: {type(key).__name__}")
+
+
+def load_key_file(path: str) -> JWTKey:
+    """`<kid>.pem` holds a private key; `<kid>.pub.pem` a public key used only to verify."""
+    from cryptography.hazmat.primitives import serialization
+
+    name = os.path.basename(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    if name.endswith(".pub.pem"):
+        public = serialization.load_pem_public_key(data)
+        return JWTKey(name[:-len(".pub.pem")], _algorithm_for(public), None, public)
+    private = serialization.load_pem_private_key(data, password=None)
+    return JWTKey(name[:-len(".pem")], _algorithm_for(private), private, private.public_key())
+
+
+def generate_private_key(algorithm: str):
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    raise ValueError(f"Unsupported JWT algorithm: {algorithm!r}")
+
+
+def new_kid() -> str:
+    return f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{secrets.token_hex(3)}"
+
+
+def write_key_file(directory: str, algorithm: str) -> str:
+    """Generate a key into `directory`; returns its kid."""
+    from cryptography.hazmat.primitives import serialization
+
+    key = generate_private_key(algorithm)
+    kid = new_kid()
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, f"{kid}.pem"), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    return kid
+
+
+# ----------------------------
+# Key set
+# ----------------------------
+class KeySet:
+    """
+    Keys by kid, plus the one new tokens are signed with. Verification looks the
+    key up by the token's raw header segment, so known headers are never parsed.
+    """
+
+    def __init__(self, keys: List[JWTKey], active: JWTKey, hs256: Optional[JWTKey] = None, directory: str = ""):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._last_reload = 0.0  # so the first unknown kid after startup reloads at once
+        self._install(keys, active, hs256)
+
+    def _install(self, keys: List[JWTKey], active: JWTKey, hs256: Optional[JWTKey]) -> None:
+        by_kid = {key.kid: key for key in keys}
+        by_header: Dict[str, JWTKey] = {}
+        for key in keys + ([hs256] if hs256 is not None else []):
+            header = {"alg": key.algorithm, "typ": "JWT", **({"kid": key.kid} if key.kid else {})}
+            by_header[_segment(header)] = key
+        jwks = json.dumps({"keys": [k.jwk() for k in keys if k.algorithm in ASYMMETRIC_ALGORITHMS]},
+                          separators=(",", ":")).encode()
+        # Swap everything at once; readers never take the lock.
+        self.active, self.hs256, self._by_kid, self._by_header = active, hs256, by_kid, by_header
+        self.jwks, self.jwks_etag = jwks, '"' + hashlib.sha256(jwks).hexdigest()[:16] + '"'
+
+    @classmethod
+    def from_env(cls) -> "KeySet":
+        hs256 = JWTKey(None, "HS256", SECRET_KEY, SECRET_KEY) if SECRET_KEY else None
+        if JWT_ALGORITHM == "HS256":
+            if hs256 is None:
+                raise RuntimeError("SECRET_KEY is required for HS256 tokens")
+            return cls([], hs256, hs256)
+        if JWT_ALGORITHM not in ASYMMETRIC_ALGORITHMS:
+            raise RuntimeError(f"Unsupported JWT_ALGORITHM: {JWT_ALGORITHM!r}")
+        keys = cls._read_dir(JWT_KEYS_DIR)
+        return cls(keys, cls._pick_active(keys), hs256 if JWT_ACCEPT_HS256 else None, JWT_KEYS_DIR)
+
+    @staticmethod
+    def _read_dir(directory: str) -> List[JWTKey]:
+        if not directory or not os.path.isdir(directory):
+            raise RuntimeError(f"JWT_KEYS_DIR {directory!r} does not exist; create a key with `python keys.py generate`")
+        return [load_key_file(os.path.join(directory, name))
+                for name in sorted(os.listdir(directory)) if name.endswith(".pem")]
+
+    @staticmethod
+    def _pick_active(keys: List[JWTKey]) -> JWTKey:
+        signing = [k for k in keys if k.signing_key is not None and k.algorithm == JWT_ALGORITHM]
+        if JWT_ACTIVE_KID:
+            signing = [k for k in signing if k.kid == JWT_ACTIVE_KID]
+        if not signing:
+            raise RuntimeError(f"No {JWT_ALGORITHM} private key {JWT_ACTIVE_KID or ''} in {JWT_KEYS_DIR!r}")
+        return max(signing, key=lambda k: k.kid)
+
+    def reload(self) -> None:
+        keys = self._read_dir(self.directory)
+        self._install(keys, self._pick_active(keys), self.hs256)
+        logger.info("JWT keys reloaded: %s (active %s)", sorted(self._by_kid), self.active.kid)
+
+    def sign(self, claims: dict) -> str:
+        key = self.active
+        headers = {"kid": key.kid} if key.kid else None
+        return jwt.encode(claims, key.signing_key, algorithm=key.algorithm, headers=headers)
+
+    def verify(self, token: str) -> dict:
+        """Decoded claims; raises jwt.PyJWTError (incl. ExpiredSignatureError) like jwt.decode."""
+        key = self._by_header.get(token.split(".", 1)[0])
+        if key is None:
+            key = self._lookup(token)
+        return jwt.decode(token, key.verifying_key, algorithms=[key.algorithm])
+
+    def _lookup(self, token: str) -> JWTKey:
+        header = jwt.get_unverified_header(token)
+        kid = header.get("kid")
+        if kid is None:
+            if self.hs256 is not None and header.get("alg") == "HS256":
+                return self.hs256
+            raise jwt.InvalidTokenError("Token has no kid")
+        key = self._by_kid.get(kid)
+        if key is None and self.directory:
+            key = self._reload_for(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown kid {kid!r}")
+        return key
+
+    def _reload_for(self, kid: str) -> Optional[JWTKey]:
+        # Anyone can send a made-up kid, so reloads are rate limited globally, not per kid.
+        if time.monotonic() - self._last_reload < JWT_KEYS_RELOAD_SECONDS:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return self._by_kid.get(kid)  # another request is reloading right now
+        try:
+            if time.monotonic() - self._last_reload >= JWT_KEYS_RELOAD_SECONDS:
+                self._last_reload = time.monotonic()
+                self.reload()
+        finally:
+            self._lock.release()
+        return self._by_kid.get(kid)
+
+
+def _segment(header: dict) -> str:
+    # PyJWT serializes headers with sorted keys and compact separators.
+    raw = json.dumps(header, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+_keyset: Optional[KeySet] = None
+_keyset_lock = threading.Lock()
+
+
+def get_keyset() -> KeySet:
+    """The process-wide key set, loaded on first use (the app loads it at startup)."""
+    global _keyset
+    if _keyset is None:
+        with _keyset_lock:
+            if _keyset is None:
+                _keyset = KeySet.from_env()
+    return _keyset
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage JWT signing keys.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="create a new private key in JWT_KEYS_DIR")
+    generate.add_argument("--algorithm", choices=ASYMMETRIC_ALGORITHMS,
+                          default=JWT_ALGORITHM if JWT_ALGORITHM in ASYMMETRIC_ALGORITHMS else "EdDSA")
+    generate.add_argument("--dir", default=JWT_KEYS_DIR or "jwt_keys")
+    commands.add_parser("jwks", help="print the public JWKS document")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        print(write_key_file(args.dir, args.algorithm))
+    else:
+        print(json.dumps(json.loads(get_keyset().jwks), indent=2))
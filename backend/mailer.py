@@ -1,16 +1,20 @@
 import os
+import quopri
+import re
 import smtplib
 import logging
-import threading
 import time
-from dataclasses import dataclass
-from functools import wraps
+import threading
+import uuid
+from dataclasses import dataclass, field
 from mimetypes import guess_type
 from pathlib import Path
 from typing import Dict, Iterable, Optional, Union, Tuple, List
+from email import policy
 from email.message import EmailMessage
 from email.utils import formataddr, make_msgid
 from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import escape
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,11 +28,17 @@ TEMPLATES_DIR = Path(__file__).resolve().parent / "templates" / "email"
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mailer")
 
+SMTP_POOL_MAX_IDLE = int(os.getenv("SMTP_POOL_MAX_IDLE", "4"))  # warm connections kept per SMTPConfig
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_NOOP_AFTER_SECONDS = float(os.getenv("SMTP_NOOP_AFTER_SECONDS", "30"))  # health-check idle connections
+SMTP_MAX_IDLE_SECONDS = float(os.getenv("SMTP_MAX_IDLE_SECONDS", "300"))  # servers drop idle sessions anyway
+EMAIL_TEMPLATES_AUTO_RELOAD = os.getenv("EMAIL_TEMPLATES_AUTO_RELOAD", "0") == "1"  # re-check template mtimes (development)
+
 
 # ----------------------------
 # SMTP configuration
 # ----------------------------
-@dataclass
+@dataclass(frozen=True)
 class SMTPConfig:
     host: str
     port: int
@@ -36,6 +46,7 @@ class SMTPConfig:
     password: str
     display_name: str = "No-Reply"
     use_ssl: bool = True  # If False, STARTTLS will be attempted
+    starttls: bool = True  # Only used when use_ssl is False; disable for a local test server
 
 PRIMARY_SMTP = SMTPConfig(
     host=os.getenv("EMAIL_HOST", ""),
@@ -44,6 +55,7 @@ PRIMARY_SMTP = SMTPConfig(
     password=os.getenv("EMAIL_PASSWORD", ""),
     display_name=os.getenv("DISPLAY_NAME", display_name),
     use_ssl=os.getenv("EMAIL_USE_SSL", "1") == "1",
+    starttls=os.getenv("EMAIL_STARTTLS", "1") == "1",
 )
 
 BROADCAST_SMTP = SMTPConfig(
@@ -52,31 +64,237 @@ BROADCAST_SMTP = SMTPConfig(
     user=os.getenv("B_EMAIL_HOST_USER", ""),
     password=os.getenv("B_EMAIL_PASSWORD", ""),
     use_ssl=os.getenv("B_EMAIL_USE_SSL", "1") == "1",
+    starttls=os.getenv("B_EMAIL_STARTTLS", "1") == "1",
 )
 
 # ----------------------------
-# Utilities
+# Templates
 # ----------------------------
-def run_async(func):
-    """Decorator to run a function in a separate thread (fire-and-forget)."""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        t = threading.Thread(target=func, args=args, kwargs=kwargs, daemon=True)
-        t.start()
-        return t  # return the thread if caller wants to join/inspect
-    return wrapper
+# Plain comments go; MSO conditional comments (<!--[if mso]>, <!--<![endif]-->, <!-- -->) must stay.
+_HTML_COMMENT = re.compile(r"<!--(?!\[if|<!\[endif|\s*-->)(?:(?!-->).)*-->", re.S)
+
+def minify_html(source: str) -> str:
+    """Drop comments, indentation and blank lines; line breaks are kept so nothing gets glued together."""
+    source = _HTML_COMMENT.sub("", source)
+    return "\n".join(line.strip() for line in source.splitlines() if line.strip())
+
+class _MinifyingLoader(FileSystemLoader):
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if template.endswith(".html"):
+            source = minify_html(source)
+        return source, filename, uptodate
+
+class TemplateRegistry:
+    """
+    Every *.html under `directory`, minified and compiled once.
+    With `auto_reload` a template is recompiled when its file's mtime changes;
+    otherwise rendering never touches the disk after the first load.
+    """
 
-def _deliver(msg: EmailMessage, cfg: SMTPConfig) -> None:
+    def __init__(self, directory: Path, auto_reload: bool = EMAIL_TEMPLATES_AUTO_RELOAD):
+        self.env = Environment(
+            loader=_MinifyingLoader(str(directory)),
+            autoescape=select_autoescape(["html", "xml"]),
+            auto_reload=auto_reload,
+            cache_size=-1,  # never evict
+        )
+
+    def load_all(self) -> List[str]:
+        """Compile every template up front (at startup) so the first email does not pay for it."""
+        names = self.env.list_templates(filter_func=lambda name: name.endswith(".html"))
+        for name in names:
+            self.env.get_template(name)
+        return names
+
+    def render(self, name: str, **context) -> str:
+        return self.env.get_template(name).render(**context)
+
+email_templates = TemplateRegistry(TEMPLATES_DIR)
+
+
+# ----------------------------
+# Utilities
+# ----------------------------
+def _connect(cfg: SMTPConfig) -> smtplib.SMTP:
+    """Open and authenticate an SMTP session. The caller is responsible for quit()."""
     if cfg.use_ssl:
-        with smtplib.SMTP_SSL(cfg.host, cfg.port, timeout=30) as server:
-            server.login(cfg.user, cfg.password)
-            server.send_message(msg)
+        server = smtplib.SMTP_SSL(cfg.host, cfg.port, timeout=30)
     else:
-        with smtplib.SMTP(cfg.host, cfg.port, timeout=30) as server:
+        server = smtplib.SMTP(cfg.host, cfg.port, timeout=30)
+        if cfg.starttls:
             server.ehlo()
             server.starttls()
+    try:
+        if cfg.user and cfg.password:
             server.login(cfg.user, cfg.password)
-            server.send_message(msg)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+# ----------------------------
+# Connection pool
+# ----------------------------
+@dataclass
+class PooledConnection:
+    server: smtplib.SMTP
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    messages: int = 0
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of authenticated SMTP sessions, keyed by SMTPConfig.
+
+    A connection is used by one thread at a time. Idle connections are NOOP-checked
+    before reuse once they have been idle for `noop_after` seconds, and retired after
+    `max_messages` messages so a single session never grows too old.
+    """
+
+    def __init__(
+        self,
+        max_idle: int = SMTP_POOL_MAX_IDLE,
+        max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+        noop_after: float = SMTP_NOOP_AFTER_SECONDS,
+        max_idle_seconds: float = SMTP_MAX_IDLE_SECONDS,
+    ):
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self.noop_after = noop_after
+        self.max_idle_seconds = max_idle_seconds
+        self._idle: Dict[SMTPConfig, List[PooledConnection]] = {}
+        self._lock = threading.Lock()
+
+        self.handshakes = 0
+        self.handshake_seconds = 0.0
+        self.reuses = 0
+        self.health_checks = 0
+        self.health_check_failures = 0
+        self.reconnects = 0
+        self.retired = 0
+        self.messages = 0
+
+    def acquire(self, cfg: SMTPConfig) -> PooledConnection:
+        while True:
+            with self._lock:
+                idle = self._idle.get(cfg)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                return self._open(cfg)
+
+            idle_for = time.monotonic() - conn.last_used
+            if idle_for > self.max_idle_seconds:
+                self._close(conn)
+                continue
+            if idle_for > self.noop_after and not self._healthy(conn):
+                self._close(conn)
+                continue
+            with self._lock:
+                self.reuses += 1
+            return conn
+
+    def release(self, cfg: SMTPConfig, conn: PooledConnection, healthy: bool = True) -> None:
+        conn.last_used = time.monotonic()
+        if healthy and conn.messages < self.max_messages:
+            with self._lock:
+                idle = self._idle.setdefault(cfg, [])
+                if len(idle) < self.max_idle:
+                    idle.append(conn)
+                    return
+        with self._lock:
+            self.retired += 1
+        self._close(conn)
+
+    def send(self, cfg: SMTPConfig, msg: EmailMessage) -> None:
+        """Send one message on a pooled connection, reconnecting once if the server hung up."""
+        for attempt in range(2):
+            conn = self.acquire(cfg)
+            try:
+                conn.server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._close(conn)
+                if attempt:
+                    raise
+                with self._lock:
+                    self.reconnects += 1
+                continue
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                # The server answered; smtplib has already RSET the transaction.
+                self.release(cfg, conn)
+                raise
+            except Exception:
+                self._close(conn)
+                raise
+            self.record_sent(conn)
+            self.release(cfg, conn)
+            return
+
+    def record_sent(self, conn: PooledConnection) -> None:
+        """Count a message sent on `conn` by a caller that drives the connection itself."""
+        conn.messages += 1
+        with self._lock:
+            self.messages += 1
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                self._close(conn, quit=True)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "idle_connections": sum(len(c) for c in self._idle.values()),
+                "handshakes": self.handshakes,
+                "handshake_avg_ms": 1000 * self.handshake_seconds / self.handshakes if self.handshakes else 0.0,
+                "reuses": self.reuses,
+                "health_checks": self.health_checks,
+                "health_check_failures": self.health_check_failures,
+                "reconnects": self.reconnects,
+                "retired": self.retired,
+                "messages": self.messages,
+            }
+
+    def _open(self, cfg: SMTPConfig) -> PooledConnection:
+        started = time.perf_counter()
+        server = _connect(cfg)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.handshakes += 1
+            self.handshake_seconds += elapsed
+        return PooledConnection(server)
+
+    def _healthy(self, conn: PooledConnection) -> bool:
+        try:
+            code, _ = conn.server.noop()
+            healthy = code == 250
+        except Exception:
+            healthy = False
+        with self._lock:
+            self.health_checks += 1
+            if not healthy:
+                self.health_check_failures += 1
+        return healthy
+
+    @staticmethod
+    def _close(conn: PooledConnection, quit: bool = False) -> None:
+        try:
+            if quit:
+                conn.server.quit()
+            else:
+                conn.server.close()
+        except Exception:
+            pass
+
+
+smtp_pool = SMTPConnectionPool()
+
+
+def _deliver(msg: EmailMessage, cfg: SMTPConfig) -> None:
+    smtp_pool.send(cfg, msg)
 
 def _attach_files(msg: EmailMessage, paths: Iterable[str]) -> None:
     for path in paths:
@@ -174,40 +392,49 @@ def send_email(
         return False
 
 # ----------------------------
-# App-specific helpers (async)
+# App-specific messages (delivered through the outbox, see outbox.py)
 # ----------------------------
-@run_async
-def send_verification_email(email: str, url: str):
+def render_verification_email(url: str) -> Tuple[str, str]:
     subject = "Email Verification"
-    html_path = TEMPLATES_DIR / "verify.html"
     try:
-        html = html_path.read_text(encoding="utf-8").replace("{{ CONFIRM_URL }}", url)
+        html = email_templates.render("verify.html", CONFIRM_URL=url)
     except Exception as e:
-        logger.error("Failed to load %s: %s", html_path, e)
+        logger.error("Failed to render verify.html: %s", e)
         html = f"<p>Verify your email: <a href='{url}'>Confirm</a></p>"
-    send_email(email, subject, html)
+    return subject, html
 
-@run_async
-def send_password_reset_email(email: str, url: str):
+def render_password_reset_email(url: str) -> Tuple[str, str]:
     subject = "Password Reset Request"
-    html_path = TEMPLATES_DIR / "reset.html"
     try:
-        html = html_path.read_text(encoding="utf-8").replace("{{ RESET_URL }}", url)
+        html = email_templates.render("reset.html", RESET_URL=url)
     except Exception as e:
-        logger.error("Failed to load %s: %s", html_path, e)
+        logger.error("Failed to render reset.html: %s", e)
         html = f"<p>Reset your password: <a href='{url}'>Reset</a></p>"
-    send_email(email, subject, html)
+    return subject, html
+
+# Outbox template name -> renderer taking the row's context as keyword arguments
+TRANSACTIONAL_TEMPLATES = {
+    "verify": render_verification_email,
+    "reset": render_password_reset_email,
+}
+
+def build_transactional_email(template: str, to_email: str, context: Dict[str, str]) -> EmailMessage:
+    cfg = PRIMARY_SMTP
+    subject, html = TRANSACTIONAL_TEMPLATES[template](**context)
+    msg = EmailMessage()
+    msg["From"] = formataddr((cfg.display_name, cfg.user))
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content("This message contains HTML content. Please view in an HTML-capable client.")
+    msg.add_alternative(html, subtype="html")
+    return msg
 
 
 
 # ----------------------------
-# Broadcast (multi-recipient) — reuses one SMTP session
+# Broadcast (multi-recipient) — reuses pooled SMTP sessions
 # ----------------------------
-_jinja_env = Environment(
-    loader=FileSystemLoader(str(TEMPLATES_DIR)),
-    autoescape=select_autoescape(["html", "xml"])
-)
-_broadcast_tpl = _jinja_env.get_template("broadcast.html")  # expects {{ user_name }} and {{ MESSAGE_CONTENT | safe }}
+# broadcast.html expects {{ user_name }} and {{ MESSAGE_CONTENT }}
 
 def _build_msg_for_user(
     cfg: SMTPConfig,
@@ -228,77 +455,105 @@ def _build_msg_for_user(
     msg.set_content("This message contains HTML content. Please view in an HTML-capable client.")
     msg.add_alternative(html_body or "<p>(no content)</p>", subtype="html")
 
-    if attachments:
-        _attach_files(msg, [attachments] if isinstance(attachments, str) else attachments)
-
+    # Images go into the HTML alternative, so embed them before attachments turn this into multipart/mixed
     if inline_images:
         _embed_images_cid(msg, inline_images)  # fresh CIDs per message
 
+    if attachments:
+        _attach_files(msg, [attachments] if isinstance(attachments, str) else attachments)
+
     return msg
 
-def send_broadcast_email(
-    user_info: Iterable[Tuple[str, str]],
+def _qp(text: str) -> bytes:
+    """Quoted-printable body with CRLF line endings, ending on a soft line break."""
+    return quopri.encodestring(text.encode("utf-8")).replace(b"\n", b"\r\n") + b"=\r\n"
+
+class CompiledBroadcast:
+    """
+    A broadcast message serialised once, for sending the same body to many users.
+
+    The MIME tree, attachments and inline images are encoded a single time;
+    `render` only splices the recipient's To header and the quoted-printable
+    HTML (with their name filled in) into the prepared bytes. The result is
+    passed to `sendmail` as is.
+    """
+
+    def __init__(
+        self,
+        cfg: SMTPConfig,
+        subject: str,
+        html_body: str,
+        placeholder: str,
+        attachments: Optional[Union[str, Iterable[str]]] = None,
+        reply_to: Optional[str] = None,
+        inline_images: Optional[Dict[str, str]] = None,
+    ):
+        self.cfg = cfg
+        self.subject = subject
+        self.html_body = html_body
+        self.placeholder = placeholder
+        self.attachments = attachments
+        self.reply_to = reply_to
+        self.inline_images = inline_images
+
+        marker = uuid.uuid4().hex
+        to_marker = f"to-{marker}@compiled.invalid"
+        html_marker = f"HTML{marker}"
+
+        msg = EmailMessage()
+        msg["From"] = formataddr((cfg.display_name, cfg.user))
+        msg["To"] = to_marker
+        msg["Subject"] = subject
+        if reply_to:
+            msg["Reply-To"] = reply_to
+        msg.set_content("This message contains HTML content. Please view in an HTML-capable client.")
+        msg.add_alternative(html_marker, subtype="html", cte="quoted-printable")
+        if inline_images:
+            cids = _embed_images_cid(msg, inline_images)  # one set of CIDs shared by every copy
+            for key, cid in cids.items():
+                html_body = html_body.replace(f"cid:{key}", f"cid:{cid}")
+        if attachments:
+            _attach_files(msg, [attachments] if isinstance(attachments, str) else attachments)
+
+        raw = msg.as_bytes(policy=policy.SMTP)
+        self._head, rest = raw.split(to_marker.encode("ascii"))
+        self._middle, self._tail = rest.split(html_marker.encode("ascii"))
+        self._html_segments = [_qp(segment) for segment in (html_body or "<p>(no content)</p>").split(placeholder)]
+
+    def render(self, username: str, email: str) -> Union[bytes, EmailMessage]:
+        if not email.isascii() or "\r" in email or "\n" in email:
+            # Needs header encoding; fall back to building the message normally.
+            return _build_msg_for_user(
+                self.cfg, email, self.subject, self.html_body.replace(self.placeholder, str(escape(username))),
+                attachments=self.attachments,
+                reply_to=self.reply_to,
+                inline_images=self.inline_images,
+            )
+        name = _qp(str(escape(username)))
+        parts = [self._head, email.encode("ascii"), self._middle, self._html_segments[0]]
+        for segment in self._html_segments[1:]:
+            parts.append(name)
+            parts.append(segment)
+        parts.append(self._tail)
+        return b"".join(parts)
+
+def compile_broadcast(
+    cfg: SMTPConfig,
     subject: str,
     message_content: str,
     attachments: Optional[Union[str, Iterable[str]]] = None,
     reply_to: Optional[str] = None,
     inline_images: Optional[Dict[str, str]] = None,
-    sleep_between: float = 0.0,
-) -> List[Tuple[str, str, bool]]:
-    """
-    Send to many recipients over a single SMTP session.
-    Returns [(username, email, success_bool), ...].
-    Template: templates/email/broadcast.html with {{ user_name }} and {{ MESSAGE_CONTENT | safe }}.
-    """
-    cfg = BROADCAST_SMTP
-    results: List[Tuple[str, str, bool]] = []
-
-    # Render static part once; keep user_name dynamic via a placeholder swap
-    try:
-        base_html = _broadcast_tpl.render(MESSAGE_CONTENT=message_content, user_name="__PLACEHOLDER__")
-    except Exception as e:
-        logger.error("Failed to render broadcast.html: %s", e)
-        return [(u, eaddr, False) for (u, eaddr) in user_info]
-
-    # Open one connection
-    try:
-        if cfg.use_ssl:
-            server = smtplib.SMTP_SSL(cfg.host, cfg.port, timeout=30)
-        else:
-            server = smtplib.SMTP(cfg.host, cfg.port, timeout=30)
-            server.ehlo()
-            server.starttls()
-        server.login(cfg.user, cfg.password)
-    except Exception as e:
-        logger.error("SMTP login failed: %s", e)
-        return [(u, eaddr, False) for (u, eaddr) in user_info]
-
-    try:
-        for username, email in user_info:
-            try:
-                html = base_html.replace("__PLACEHOLDER__", username)
-                msg = _build_msg_for_user(
-                    cfg, email, subject, html,
-                    attachments=attachments,
-                    reply_to=reply_to,
-                    inline_images=inline_images,
-                )
-                server.send_message(msg)
-                results.append((username, email, True))
-            except Exception as per_err:
-                logger.warning("Failed to send to %s <%s>: %s", username, email, per_err)
-                results.append((username, email, False))
-
-            if sleep_between > 0:
-                time.sleep(sleep_between)
-    finally:
-        try:
-            server.quit()
-        except Exception:
-            pass
-
-    return results
-
+) -> CompiledBroadcast:
+    """Render broadcast.html once, leaving a slot for each recipient's name."""
+    placeholder = f"__USER_NAME_{uuid.uuid4().hex}__"
+    html = email_templates.render("broadcast.html", MESSAGE_CONTENT=message_content, user_name=placeholder)
+    return CompiledBroadcast(
+        cfg, subject, html, placeholder,
+        attachments=attachments,
+        reply_to=reply_to,
+        inline_images=inline_images,
+    )
 
 def send_test_broadcast(
     to_email: str,
@@ -315,7 +570,7 @@ def send_test_broadcast(
     """
     cfg = BROADCAST_SMTP
     try:
-        html = _broadcast_tpl.render(MESSAGE_CONTENT=message_content, user_name=username)
+        html = email_templates.render("broadcast.html", MESSAGE_CONTENT=message_content, user_name=username)
     except Exception as e:
         logger.error("Failed to render broadcast.html: %s", e)
         return False
@@ -1,28 +1,52 @@
 import logging
-from fastapi import FastAPI, HTTPException, Depends, APIRouter, status
-import jwt
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, HTTPException, Depends, APIRouter, Query, Request, status
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from anyio import from_thread
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
 import hmac
-from database import get_db, engine
-from models import Base
+import csv
+import io
+import json
+from typing import Iterator, Optional
+from contextlib import asynccontextmanager
+from database import get_async_db, dispose_engines
+from replicas import ReadSessionLocal, get_async_read_db, replicas, set_read_subject
+from models import BroadcastJob, User
+from sqlalchemy import select, update
+from sqlalchemy.engine import Engine
 from schemas import (TestBroadcastIn, UserCreate, Token, ForgotPasswordIn, 
-                    PasswordResetIn, 
+                    PasswordResetIn, RefreshIn,
                     BroadcastIn,
                     UpdateProfileIn)
 import secrets
-from crud import create_user
-from utils import (create_access_token, get_user_by_email, get_user_by_password_reset_token, 
-                   get_user_by_verification_token,
-                   verify_password, get_password_hash, hash_token,
-                        get_user_by_status,
-                        decode_access_token,
-                        get_all_verified_users,
-                        blacklist)
-from auth import oauth2_scheme
-from mailer import (send_verification_email, 
-                    send_password_reset_email, 
-                    send_broadcast_email,
+from crud import register_user_async, update_password_hash_async
+from utils import (decode_access_token, get_user_by_email_async,
+                   get_user_by_password_reset_token_async,
+                   get_user_by_verification_token_async,
+                   hash_token,
+                        get_users_page_async,
+                        iter_users_by_status,
+                        user_status_filter,
+                        revoke_access_token)
+from auth import (oauth2_scheme, Principal, principal_cache,
+                  get_current_principal, get_current_admin)
+from hashing import (configure_hashing, hash_password_async, verify_and_update_password_async,
+                     hash_pool, hashing_stats)
+from outbox import enqueue_email, mail_outbox, MAIL_WORKERS
+from importer import RowParser, UserImporter, decode_lines
+from maintenance import token_sweeper
+from schema import check_schema_async
+from revocation import revocation_store
+from ratelimit import RateLimit, client_ip, rate_limiter
+from sessions import create_session, list_sessions, refresh_session, revoke_sessions
+from keys import JWKS_MAX_AGE_SECONDS, get_keyset
+from metrics import MetricsMiddleware, instrument_engine, register_collector, render_metrics
+from user_stats import bump_user_stats_async, get_user_stats_async
+from broadcast_jobs import (broadcast_runner, broadcast_job_status,
+                            create_broadcast_job, BROADCAST_JOB_RUNNER)
+from mailer import (smtp_pool, email_templates,
                     send_test_broadcast as send_test_broadcast_email)
 from datetime import datetime, timedelta, timezone
 import os
@@ -30,6 +54,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger("main")
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
@@ -37,65 +62,79 @@ api = APIRouter(prefix="/api", tags=["auth"])
 admin_api = APIRouter(prefix="/api/admin", tags=["admin"])
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here runs at import, so importing the app needs no database.
+    await check_schema_async()
+    get_keyset()  # parse signing keys now so a bad key fails startup, not the first login
+    await run_in_threadpool(configure_hashing)  # may time a few hashes when a cost is "auto"
+    email_templates.load_all()
+    if MAIL_WORKERS > 0:
+        mail_outbox.start()
+    if BROADCAST_JOB_RUNNER:
+        broadcast_runner.start()
+    token_sweeper.start()
+    revocation_store.start()
+    replicas.start()
+    try:
+        yield
+    finally:
+        replicas.stop()
+        revocation_store.stop()
+        token_sweeper.stop()
+        broadcast_runner.stop()
+        mail_outbox.stop()
+        smtp_pool.close_all()
+        hash_pool.shutdown()
+        await replicas.dispose()
+        await dispose_engines()
+
+
 app = FastAPI(
     title="Bitva Application",
     docs_url="/api/docs",
     description="API for user registration, login, and password management",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
+app.add_middleware(MetricsMiddleware)
+instrument_engine(Engine)  # engines are created on first use
+register_collector("hash_pool", hashing_stats)
+register_collector("replicas", replicas.stats)
+register_collector("principal_cache", principal_cache.stats)
+register_collector("smtp_pool", smtp_pool.stats)
+register_collector("rate_limit", rate_limiter.store.stats)
 RESET_TTL_MINUTES = 30
-
-Base.metadata.create_all(bind=engine)
-
-
-def current_user_dep(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
-):
-    cred_exc = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = decode_access_token(token)  # must raise on invalid/expired
-        email = payload.get("sub")
-        if not email:
-            raise cred_exc
-    except jwt.PyJWTError:
-        raise cred_exc
-
-    user = get_user_by_email(db, email)
-    if not user:
-        raise cred_exc
-    return user
+USER_PAGE_MAX = 500
+USER_EXPORT_CHUNK = 1000
+USER_EXPORT_FIELDS = ["id", "email", "name", "role", "status", "verification", "joined"]
+BROADCAST_LIST_MAX = 100
 
 
 # User Routes
 
-@api.post("/register")
-async def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = get_user_by_email(db, user.email)
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
+@api.post("/register", dependencies=[Depends(RateLimit("register", "email"))])
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     if '@' not in user.email:
         raise HTTPException(status_code=400, detail="Invalid email format")
 
     verification_token = secrets.token_urlsafe()
     verification_hash = hash_token(verification_token)
+    hashed_pw = await hash_password_async(user.password)
 
-    db_user = create_user(db, user)
-
-    # Update user with verification token and expiry
-    db_user.verification_token = verification_hash
-    db_user.verification_token_expiry = datetime.now(timezone.utc) + timedelta(minutes=30)
-
-    db.commit()
-    db.refresh(db_user)
+    # The insert is the existence check: a taken email makes it return no row.
+    db_user = await register_user_async(
+        db, user, hashed_pw,
+        verification_token=verification_hash,
+        verification_token_expiry=datetime.utcnow() + timedelta(minutes=30),
+    )
+    if db_user is None:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await bump_user_stats_async(db, total=1, active=1, signups={datetime.utcnow().date(): 1})
 
-    send_verification_email(
-        db_user.email, 
-        f"{FRONTEND_URL}/verify?token={verification_token}")
+    enqueue_email(db, "verify", db_user.email, url=f"{FRONTEND_URL}/verify?token={verification_token}")
+    await db.commit()
+    mail_outbox.notify()
 
     return {
         "User Email": db_user.email,
@@ -103,40 +142,108 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         "msg": "User registered successfully"
     }
 
-@api.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@api.post("/login", response_model=Token, dependencies=[Depends(RateLimit("login", "username"))])
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(),
+                db: AsyncSession = Depends(get_async_db)):
     # Use username field as email
-    user = get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.password):
+    user = await get_user_by_email_async(db, form_data.username)
+    verified, new_hash = await verify_and_update_password_async(form_data.password, user.password) if user else (False, None)
+    if not verified:
         raise HTTPException(status_code=400, detail="Invalid credentials")
     if not user.is_verified:
         raise HTTPException(status_code=400, detail="Email not verified")
     if user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized as regular user")
-    access_token = create_access_token(data={"sub": user.email})
-    return {
-        "name": user.name,
-        "email": user.email,
-        "access_token": access_token,
-        "token_type": "bearer"
-    }
+    if new_hash is not None:
+        await update_password_hash_async(db, user.id, user.password, new_hash)  # committed with the session
+    set_read_subject(user.email)  # the session insert pins this user's next reads to the primary
+    return await create_session(db, user, request.headers.get("user-agent"), client_ip(request))
+
+@api.post("/refresh", response_model=Token)
+async def refresh(data: RefreshIn, db: AsyncSession = Depends(get_async_db)):
+    """
+    Exchanges a refresh token for a new access token and refresh token.
+    The old refresh token stops working; sending it again ends the session.
+    """
+    return await refresh_session(db, data.refresh_token)
 
 @api.post("/logout")
-def logout(token: str = Depends(oauth2_scheme)):
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """
-    Logs out the user by blacklisting the provided access token.
+    Logs out the user by revoking the provided access token until it expires,
+    and ends the session it belongs to so its refresh token stops working.
     The token is automatically extracted from the Authorization header (Bearer token).
     """
-    blacklist.add(token)
+    try:
+        payload = decode_access_token(token)
+    except HTTPException:
+        payload = {}  # already expired, invalid or revoked
+    await run_in_threadpool(revoke_access_token, token)
+    principal_cache.invalidate_token(token)
+    if payload.get("sid") is not None:
+        user = await get_user_by_email_async(db, payload.get("sub", ""))
+        if user is not None:
+            await revoke_sessions(db, user.id, session_ids=[payload["sid"]], reason="logout")
     return {"msg": "User logged out successfully"}
 
 
+@api.get("/sessions")
+async def get_sessions(
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_current_principal)
+):
+    """
+    The caller's signed-in devices, most recently used first.
+    """
+    current = principal.claims.get("sid")
+    return [
+        {
+            "id": s.id,
+            "user_agent": s.user_agent,
+            "ip": s.ip,
+            "created_at": s.created_at,
+            "last_used_at": s.last_used_at,
+            "expires_at": s.expires_at,
+            "current": s.id == current,
+        }
+        for s in await list_sessions(db, principal.id)
+    ]
+
+
+@api.delete("/sessions/{session_id}")
+async def delete_session(
+    session_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_current_principal)
+):
+    """
+    Signs out one device: its refresh token and access tokens stop working.
+    """
+    if not await revoke_sessions(db, principal.id, session_ids=[session_id]):
+        raise HTTPException(status_code=404, detail="Session not found")
+    principal_cache.invalidate_user(principal.email)
+    return {"msg": "Session revoked"}
+
+
+@api.delete("/sessions")
+async def delete_other_sessions(
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_current_principal)
+):
+    """
+    Signs out every device except the one making the request.
+    """
+    revoked = await revoke_sessions(db, principal.id, except_id=principal.claims.get("sid"))
+    principal_cache.invalidate_user(principal.email)
+    return {"msg": "Other sessions revoked", "revoked": revoked}
+
+
 @api.post("/reset_password")
-def reset_password(
-    data: PasswordResetIn, db: Session = Depends(get_db)
+async def reset_password(
+    data: PasswordResetIn, db: AsyncSession = Depends(get_async_db)
 ):
     token_hash = hash_token(data.token)
-    user = get_user_by_password_reset_token(db, token_hash)
+    user = await get_user_by_password_reset_token_async(db, token_hash)
 
     if not user:
         raise HTTPException(status_code=404, detail="Invalid token")
@@ -154,21 +261,24 @@ def reset_password(
     user.password_reset_token = None
     user.password_reset_token_expiry = None
 
-    new_password = get_password_hash(data.new_password)
+    new_password = await hash_password_async(data.new_password)
     user.password = new_password
-    db.commit()
+    # Whoever knew the old password may hold a session; sign every device out.
+    # This also commits the new password.
+    await revoke_sessions(db, user.id, reason="password_reset")
+    principal_cache.invalidate_user(user.email)
 
     return {"msg": "Password reset successfully"}
 
 
-@api.post("/forgot_password")
-def forgot_password(
+@api.post("/forgot_password", dependencies=[Depends(RateLimit("forgot_password", "email"))])
+async def forgot_password(
     payload: ForgotPasswordIn,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     ):
     generic_msg = {"msg": "If the account exists, a password reset email will be sent."}
 
-    user = get_user_by_email(db, payload.email)
+    user = await get_user_by_email_async(db, payload.email)
 
     if not user:
         return generic_msg
@@ -177,12 +287,11 @@ def forgot_password(
     token_hash = hash_token(raw_token)
 
     user.password_reset_token = token_hash
-    user.password_reset_token_expiry = datetime.now(timezone.utc) + timedelta(minutes=RESET_TTL_MINUTES)
-    
-    db.commit()
-    db.refresh(user)
+    user.password_reset_token_expiry = datetime.utcnow() + timedelta(minutes=RESET_TTL_MINUTES)
 
-    send_password_reset_email(user.email, f"{FRONTEND_URL}/reset-password?token={raw_token}")
+    enqueue_email(db, "reset", user.email, url=f"{FRONTEND_URL}/reset-password?token={raw_token}")
+    await db.commit()
+    mail_outbox.notify()
 
     return generic_msg
 
@@ -190,27 +299,29 @@ def forgot_password(
 @api.post("/update_profile")
 async def update_profile(
     data: UpdateProfileIn,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
-    user = Depends(current_user_dep)
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_current_principal)
 ):
-    user.name = data.name
-    user.updated_at = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(user)
+    await db.execute(
+        update(User)
+        .where(User.id == principal.id)
+        .values(name=data.name, updated_at=datetime.utcnow())
+    )
+    await db.commit()
+    principal_cache.invalidate_user(principal.email)
     return {
         "msg": "Profile updated successfully",
-        "name": user.name,
-        "email": user.email
+        "name": data.name,
+        "email": principal.email
     }
 
 @api.get("/verify_email")
 async def verify_email(
     token: str,
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_async_db)):
 
     token_hash = hash_token(token)
-    user = get_user_by_verification_token(db, token_hash)
+    user = await get_user_by_verification_token_async(db, token_hash)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -226,120 +337,268 @@ async def verify_email(
     if not hmac.compare_digest(user.verification_token, token_hash):
         raise HTTPException(status_code=400, detail="Invalid or expired token")
 
-    user.is_verified = True
-    user.verification_token = None
-    user.verification_token_expiry = None
-    db.commit()
+    # Conditional so two concurrent clicks on the link count the user once.
+    result = await db.execute(
+        update(User)
+        .where(User.id == user.id, User.is_verified == False)
+        .values(is_verified=True, verification_token=None, verification_token_expiry=None)
+    )
+    if result.rowcount:
+        await bump_user_stats_async(db, verified=1)
+    await db.commit()
+    principal_cache.invalidate_user(user.email)
 
     return {"msg": "Email verified successfully"}
 
 @api.get("/me")
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = decode_access_token(token)
-    cred_exec = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    email = payload.get("sub")
-    if email is None:
-        raise cred_exec
-    user = get_user_by_email(db, email)
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+async def get_current_user(principal: Principal = Depends(get_current_principal)):
+    return principal.to_dict()
 
 
 # Admin Routes
 
-@admin_api.post("/login", response_model=Token)
-def admin_login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+@admin_api.post("/login", response_model=Token, dependencies=[Depends(RateLimit("login", "username"))])
+async def admin_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(),
+                      db: AsyncSession = Depends(get_async_db)):
     # Use username field as email
-    user = get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.password):
+    user = await get_user_by_email_async(db, form_data.username)
+    verified, new_hash = await verify_and_update_password_async(form_data.password, user.password) if user else (False, None)
+    if not verified:
         raise HTTPException(status_code=400, detail="Invalid credentials")
     if not user.is_verified:
         raise HTTPException(status_code=400, detail="Email not verified")
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized as admin")
-    access_token = create_access_token(data={"sub": user.email})
-    print(user.email)
-    return {
-        "name": user.name,
-        "email": user.email,
-        "access_token": access_token,
-        "token_type": "bearer"
-    }
+    if new_hash is not None:
+        await update_password_hash_async(db, user.id, user.password, new_hash)  # committed with the session
+    set_read_subject(user.email)  # the session insert pins this user's next reads to the primary
+    logger.info("Admin login: %s", user.email)
+    return await create_session(db, user, request.headers.get("user-agent"), client_ip(request))
+
+def _user_listing_item(u) -> dict:
+    return {"id": u.id,
+            "email": u.email,
+            "name": u.name,
+            "role": "admin" if u.is_admin else "user",
+            "status": "active" if u.is_active else "inactive",
+            "verification": "verified" if u.is_verified else "unverified",
+            "joined": u.created_at.isoformat() if u.created_at else None,
+            }
+
+@admin_api.get("/stats")
+async def get_user_stats(
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(get_async_read_db),
+    admin: Principal = Depends(get_current_admin),
+):
+    """
+    User totals by verification and active status, plus signups for each of the
+    last `days` days, read from the maintained counters rather than counted.
+    """
+    return await get_user_stats_async(db, days)
 
 @admin_api.get("/users/{status}")
-async def get_users_by_status(status: str, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def get_users_by_status(
+    status: str,
+    limit: int = Query(50, ge=1, le=USER_PAGE_MAX),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    admin: Principal = Depends(get_current_admin),
+):
     """
-    Retrieve users based on their verification status.
-    Status can be 'verified', 'unverified', or 'all'.
+    Retrieve one page of users filtered by status
+    ('all', 'verified', 'unverified', 'active' or 'inactive').
+    `q` is a case-insensitive name/email prefix. Pass the returned `next_cursor`
+    back as `cursor` to get the following page; it is null on the last page.
     """
-    payload = decode_access_token(token)
-    email = payload.get("sub")
-    if email is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    user = get_user_by_email(db, email)
-    if user is None or not user.is_admin:
-        raise HTTPException(status_code=403, detail="Not authorized as admin")
-
-    users = get_user_by_status(db, status)
+    users, next_cursor = await get_users_page_async(db, status, limit, cursor, q)
     # Return empty list if no users found, instead of 404
     return {
-        "users": [{"id": u.id, 
-                  "email": u.email, 
-                   "name": u.name, 
-                   "role": "admin" if u.is_admin else "user",
-                   "status": (
-                          "active" if u.is_active else "inactive"
-                   ),
-                     "verification": (
-                              "verified" if u.is_verified else "unverified"
-                     ),
-                   "joined": u.created_at.isoformat() if u.created_at else None,
-                   } for u in users]
+        "users": [_user_listing_item(u) for u in users],
+        "next_cursor": next_cursor,
     }
 
-@admin_api.post("/send_broadcast/")
-async def send_broadcast(broadcast: BroadcastIn, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = decode_access_token(token)
-    email = payload.get("sub")
-    if email is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    user = get_user_by_email(db, email)
-    if user is None or not user.is_admin:
-        raise HTTPException(status_code=403, detail="Not authorized as admin")
+@admin_api.get("/users/{status}/export")
+def export_users_by_status(
+    status: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    q: Optional[str] = None,
+    admin: Principal = Depends(get_current_admin),
+):
+    """
+    Stream every matching user as NDJSON or CSV without loading the table into memory.
+    """
+    user_status_filter(status)  # validate before the response starts
+
+    def rows():
+        db = ReadSessionLocal()
+        try:
+            if format == "csv":
+                buf = io.StringIO()
+                writer = csv.DictWriter(buf, fieldnames=USER_EXPORT_FIELDS)
+                writer.writeheader()
+                for u in iter_users_by_status(db, status, q, chunk_size=USER_EXPORT_CHUNK):
+                    writer.writerow(_user_listing_item(u))
+                    if buf.tell() >= 64 * 1024:
+                        yield buf.getvalue()
+                        buf.seek(0)
+                        buf.truncate()
+                yield buf.getvalue()
+            else:
+                for u in iter_users_by_status(db, status, q, chunk_size=USER_EXPORT_CHUNK):
+                    yield json.dumps(_user_listing_item(u)) + "\n"
+        finally:
+            db.close()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users-{status}.{format}"'},
+    )
 
-    # Dummy broadcast logic
-    verified_users = get_all_verified_users(db)
+@admin_api.post("/users/import")
+async def import_users(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    verified: bool = False,
+    admin: Principal = Depends(get_current_admin),
+):
+    """
+    Bulk-import users from a CSV (with header) or NDJSON request body with
+    email, name and password or password_hash per row. The body is read and
+    imported batch by batch; for very large files prefer `python importer.py`.
+    """
+    body = request.stream()
 
-    # Create a dictionary of both usernames and email
+    def chunks() -> Iterator[bytes]:
+        # The import runs in a worker thread; it pulls the body from the event loop as it goes.
+        while (chunk := from_thread.run(anext, body, None)) is not None:
+            yield chunk
 
-    users_info = [(u.name, u.email) for u in verified_users]
+    def run_import() -> dict:
+        with UserImporter(verified=verified) as importer:
+            importer.import_rows(RowParser(format).feed(decode_lines(chunks())))
+        return importer.report.as_dict()
 
-    print(f"Broadcasting to {len(users_info)} users: {users_info}")
-    send_broadcast_email(users_info, broadcast.subject, broadcast.message_content)
+    try:
+        return await run_in_threadpool(run_import)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8")
 
-    return {"msg": f"Broadcast sent to {len(users_info)} users"}
+@admin_api.post("/send_broadcast/", status_code=status.HTTP_202_ACCEPTED)
+async def send_broadcast(broadcast: BroadcastIn, db: AsyncSession = Depends(get_async_db), admin: Principal = Depends(get_current_admin)):
+    """
+    Queue a broadcast to every verified user and return its job id;
+    poll /broadcasts/{job_id} for progress.
+    """
+    job = create_broadcast_job(db, broadcast.subject, broadcast.message_content, created_by=admin.email)
+    await db.commit()
+    broadcast_runner.notify()
 
+    return {"msg": "Broadcast queued", "job_id": job.id}
+
+
+@admin_api.get("/broadcasts")
+async def list_broadcasts(
+    limit: int = Query(20, ge=1, le=BROADCAST_LIST_MAX),
+    db: AsyncSession = Depends(get_async_db),
+    admin: Principal = Depends(get_current_admin),
+):
+    """
+    Most recent broadcast jobs first.
+    """
+    result = await db.execute(select(BroadcastJob).order_by(BroadcastJob.id.desc()).limit(limit))
+    return {"broadcasts": [broadcast_job_status(job) for job in result.scalars()]}
 
-@admin_api.post("/send_test_broadcast/")
-async def send_test_broadcast(broadcast: TestBroadcastIn, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = decode_access_token(token)
-    email = payload.get("sub")
-    if email is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    user = get_user_by_email(db, email)
-    if user is None or not user.is_admin:
-        raise HTTPException(status_code=403, detail="Not authorized as admin")
 
-    if send_test_broadcast_email(broadcast.email, broadcast.subject, broadcast.message_content):
+@admin_api.get("/broadcasts/{job_id}")
+async def get_broadcast(job_id: int, db: AsyncSession = Depends(get_async_db), admin: Principal = Depends(get_current_admin)):
+    """
+    Sent/failed/pending counts and throughput of a broadcast job, as of its last checkpoint.
+    """
+    job = await db.get(BroadcastJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast_job_status(job)
+
+
+@admin_api.post("/send_test_broadcast/")
+async def send_test_broadcast(broadcast: TestBroadcastIn, admin: Principal = Depends(get_current_admin)):
+    if await run_in_threadpool(send_test_broadcast_email, broadcast.email, broadcast.subject, broadcast.message_content):
         return {"msg": "Test email sent successfully"}
     return {"msg": "Failed to send test email"}
 
 
+@admin_api.get("/hashing_stats")
+async def get_hashing_stats(admin: Principal = Depends(get_current_admin)):
+    """
+    Queue depth and latency of the password-hashing pool, for sizing HASH_POOL_SIZE.
+    """
+    return hashing_stats()
+
+
+@admin_api.get("/principal_cache_stats")
+async def get_principal_cache_stats(admin: Principal = Depends(get_current_admin)):
+    """
+    Hit/miss counters of the authenticated-principal cache.
+    """
+    return principal_cache.stats()
+
+
+@admin_api.get("/smtp_pool_stats")
+async def get_smtp_pool_stats(admin: Principal = Depends(get_current_admin)):
+    """
+    Connection reuse and handshake counters of the shared SMTP pool.
+    """
+    return smtp_pool.stats()
+
+
+@admin_api.get("/token_sweeper_stats")
+async def get_token_sweeper_stats(admin: Principal = Depends(get_current_admin)):
+    """
+    Rows cleared by the expired-token sweeper, per run and in total.
+    """
+    return token_sweeper.stats()
+
+
+@admin_api.get("/rate_limit_stats")
+async def get_rate_limit_stats(admin: Principal = Depends(get_current_admin)):
+    """
+    Configured limits and rejections per policy and key type.
+    """
+    return rate_limiter.stats()
+
+
+@admin_api.get("/replica_stats")
+async def get_replica_stats(admin: Principal = Depends(get_current_admin)):
+    """
+    Replica lag and health, and how read sessions were routed.
+    """
+    return replicas.stats()
+
+
+@app.get("/.well-known/jwks.json", include_in_schema=False)
+def jwks(request: Request):
+    """
+    Public keys for verifying our access tokens (EdDSA/ES256 only), serialized once per key set.
+    """
+    keyset = get_keyset()
+    headers = {"Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}", "ETag": keyset.jwks_etag}
+    if request.headers.get("if-none-match") == keyset.jwks_etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(keyset.jwks, media_type="application/json", headers=headers)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Request latency, SQL, bcrypt and JWT timings in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(api)
 app.include_router(admin_api)
 
@@ -0,0 +1,154 @@
+"""
+Periodic database maintenance.
+
+`sweep_expired_tokens` clears verification and password-reset tokens whose
+expiry has passed, a bounded batch per transaction, so their partial indexes
+only hold live tokens; `sweep_expired_sessions` deletes sessions past their
+expiry. `TokenSweeper` runs both on an interval.
+`python maintenance.py` runs a single sweep and prints the counts.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import delete, select, update
+from dotenv import load_dotenv
+
+from database import SessionLocal
+from models import User, UserSession
+
+load_dotenv()
+
+logger = logging.getLogger("maintenance")
+
+TOKEN_SWEEP_INTERVAL_SECONDS = float(os.getenv("TOKEN_SWEEP_INTERVAL_SECONDS", "3600"))  # 0 disables
+TOKEN_SWEEP_BATCH_SIZE = int(os.getenv("TOKEN_SWEEP_BATCH_SIZE", "1000"))
+
+# token column -> its expiry column
+TOKEN_COLUMNS = {
+    "verification_token": "verification_token_expiry",
+    "password_reset_token": "password_reset_token_expiry",
+}
+
+
+def sweep_expired_tokens(
+    session_factory=SessionLocal, batch_size: int = TOKEN_SWEEP_BATCH_SIZE, now: Optional[datetime] = None
+) -> Dict[str, int]:
+    """Null out expired tokens; returns the number of rows cleared per token column."""
+    now = now or datetime.utcnow()
+    swept = {}
+    for token_name, expiry_name in TOKEN_COLUMNS.items():
+        token, expiry = getattr(User, token_name), getattr(User, expiry_name)
+        swept[token_name] = 0
+        while True:
+            with session_factory() as db:
+                ids = db.execute(
+                    select(User.id).where(token.isnot(None), expiry < now).limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                db.execute(
+                    update(User)
+                    .where(User.id.in_(ids), expiry < now)
+                    .values({token_name: None, expiry_name: None, "updated_at": User.updated_at})
+                )
+                db.commit()
+            swept[token_name] += len(ids)
+            if len(ids) < batch_size:
+                break
+    return swept
+
+
+def sweep_expired_sessions(
+    session_factory=SessionLocal, batch_size: int = TOKEN_SWEEP_BATCH_SIZE, now: Optional[datetime] = None
+) -> int:
+    """Delete expired sessions (revoked ones included); returns how many were removed."""
+    now = now or datetime.utcnow()
+    swept = 0
+    while True:
+        with session_factory() as db:
+            ids = db.execute(
+                select(UserSession.id).where(UserSession.expires_at < now).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            db.execute(delete(UserSession).where(UserSession.id.in_(ids)))
+            db.commit()
+        swept += len(ids)
+        if len(ids) < batch_size:
+            break
+    return swept
+
+
+class TokenSweeper:
+    def __init__(self, interval: float = TOKEN_SWEEP_INTERVAL_SECONDS, batch_size: int = TOKEN_SWEEP_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.total_swept = 0
+        self.last_run: Optional[dict] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="token-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def run_once(self) -> Dict[str, int]:
+        started = time.perf_counter()
+        swept = sweep_expired_tokens(batch_size=self.batch_size)
+        swept["user_sessions"] = sweep_expired_sessions(batch_size=self.batch_size)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.runs += 1
+            self.total_swept += sum(swept.values())
+            self.last_run = {
+                "at": datetime.utcnow().isoformat(),
+                "swept": swept,
+                "duration_ms": round(1000 * elapsed, 1),
+            }
+        logger.info("Expired tokens swept: %s in %.0f ms", swept, 1000 * elapsed)
+        return swept
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                logger.exception("Expired token sweep failed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "interval_seconds": self.interval,
+                "batch_size": self.batch_size,
+                "runs": self.runs,
+                "failures": self.failures,
+                "total_swept": self.total_swept,
+                "last_run": self.last_run,
+            }
+
+
+token_sweeper = TokenSweeper()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(token_sweeper.run_once()))
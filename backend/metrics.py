@@ -0,0 +1,297 @@
+"""
+Request-level performance metrics.
+
+`MetricsMiddleware` times every request into a per-route latency histogram
+and, through a context variable, collects what the request spent on SQL
+(counted by engine events, see `instrument_engine`), bcrypt and JWT work.
+`render_metrics` returns everything in the Prometheus text format for
+GET /metrics. Set METRICS_SLOW_REQUEST_MS to log requests slower than that,
+with their query breakdown.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("metrics")
+
+# Requests slower than this are logged with their query breakdown (0 = off).
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", "0"))
+METRICS_SLOW_TOP_QUERIES = 5  # statements listed per slow request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+OPERATION_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Labels = Tuple[str, ...]
+
+
+# ----------------------------
+# Metric types
+# ----------------------------
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, rendered the way prometheus_client does."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+http_requests = Counter(
+    "bitva_http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+http_latency = Histogram(
+    "bitva_http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_db_queries = Histogram(
+    "bitva_http_request_db_queries", "SQL statements executed per HTTP request.", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS)
+http_db_time = Histogram(
+    "bitva_http_request_db_seconds", "Time spent in SQL per HTTP request.", ("method", "route"))
+db_queries = Histogram(
+    "bitva_db_query_duration_seconds", "SQL statement latency.", ("operation",), buckets=QUERY_BUCKETS)
+operations = Histogram(
+    "bitva_operation_duration_seconds", "Latency of expensive operations (bcrypt, JWT).", ("operation",),
+    buckets=OPERATION_BUCKETS)
+
+_METRICS = [http_requests, http_latency, http_db_queries, http_db_time, db_queries, operations]
+
+# name -> callable returning {metric suffix: value}, rendered as gauges
+_collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+
+def register_metric(metric):
+    """Add a Counter or Histogram defined elsewhere to the /metrics output."""
+    _METRICS.append(metric)
+    return metric
+
+
+def register_collector(prefix: str, collect: Callable[[], Dict[str, float]]) -> None:
+    """Expose an existing `stats()` dict as gauges named `bitva_<prefix>_<key>`."""
+    _collectors[prefix] = collect
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for prefix, collect in _collectors.items():
+        try:
+            values = collect()
+        except Exception:
+            logger.exception("Metrics collector %s failed", prefix)
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"bitva_{prefix}_{key}"
+            lines.extend([f"# TYPE {name} gauge", f"{name} {_number(value)}"])
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# Per-request accounting
+# ----------------------------
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    statements: Dict[str, List[float]] = field(default_factory=dict)  # statement -> [count, seconds]
+    operations: Dict[str, List[float]] = field(default_factory=dict)  # operation -> [count, seconds]
+
+    def breakdown(self, top: int = METRICS_SLOW_TOP_QUERIES) -> dict:
+        slowest = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            "queries": self.queries,
+            "db_ms": round(1000 * self.db_seconds, 1),
+            "operations": {op: {"count": int(c), "ms": round(1000 * s, 1)} for op, (c, s) in self.operations.items()},
+            "top_queries": [{"sql": sql, "count": int(c), "ms": round(1000 * s, 1)} for sql, (c, s) in slowest],
+        }
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def _add(bucket: Dict[str, List[float]], key: str, seconds: float) -> None:
+    entry = bucket.get(key)
+    if entry is None:
+        bucket[key] = [1, seconds]
+    else:
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def observe_operation(operation: str, seconds: float) -> None:
+    """Record one bcrypt/JWT/etc. call, globally and against the current request."""
+    operations.observe(seconds, operation)
+    stats = _request_stats.get()
+    if stats is not None:
+        _add(stats.operations, operation, seconds)
+
+
+@contextmanager
+def timed(operation: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_operation(operation, time.perf_counter() - started)
+
+
+# ----------------------------
+# SQLAlchemy
+# ----------------------------
+_WHITESPACE = re.compile(r"\s+")
+
+def _statement_key(statement: str) -> str:
+    return _WHITESPACE.sub(" ", statement).strip()[:200]
+
+
+def instrument_engine(engine) -> None:
+    """
+    Time every statement run on `engine`: an Engine, an AsyncEngine's sync_engine,
+    or the Engine class itself to cover engines that have not been created yet.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        elapsed = time.perf_counter() - started
+        db_queries.observe(elapsed, statement.lstrip().split(" ", 1)[0].upper() or "OTHER")
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            _add(stats.statements, _statement_key(statement), elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("metrics_started"):
+            conn.info["metrics_started"].pop()
+
+
+# ----------------------------
+# Middleware
+# ----------------------------
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed until their last chunk."""
+
+    def __init__(self, app, slow_request_ms: float = METRICS_SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            self._record(scope, status_code, elapsed, stats)
+
+    def _record(self, scope, status_code: int, elapsed: float, stats: RequestStats) -> None:
+        route = scope.get("route")
+        # Label by route template, never the raw path, to keep cardinality bounded.
+        path = getattr(route, "path", None) or "unmatched"
+        method = scope["method"]
+        http_requests.inc(method, path, str(status_code))
+        http_latency.observe(elapsed, method, path)
+        http_db_queries.observe(stats.queries, method, path)
+        http_db_time.observe(stats.db_seconds, method, path)
+        if self.slow_request_ms and 1000 * elapsed >= self.slow_request_ms:
+            logger.warning(
+                "Slow request %s %s -> %s in %.0f ms: %s",
+                method, scope.get("path", path), status_code, 1000 * elapsed, stats.breakdown(),
+            )
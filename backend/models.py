@@ -1,10 +1,37 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Index, JSON, Text, UniqueConstraint, func, text
 from database import Base
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset pagination of the admin listing (see utils.get_users_page_async).
+        # Postgres also gets lower(name)/lower(email) text_pattern_ops indexes for
+        # prefix search; those are expression indexes and live in the migration only.
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Partial indexes: only rows with a live token, or the minority status, are indexed.
+        Index("ix_users_verification_token", "verification_token", unique=True,
+              postgresql_where=text("verification_token IS NOT NULL"),
+              sqlite_where=text("verification_token IS NOT NULL")),
+        Index("ix_users_password_reset_token", "password_reset_token", unique=True,
+              postgresql_where=text("password_reset_token IS NOT NULL"),
+              sqlite_where=text("password_reset_token IS NOT NULL")),
+        # Used by the expired-token sweeper (maintenance.py).
+        Index("ix_users_verification_token_expiry", "verification_token_expiry",
+              postgresql_where=text("verification_token IS NOT NULL"),
+              sqlite_where=text("verification_token IS NOT NULL")),
+        Index("ix_users_password_reset_token_expiry", "password_reset_token_expiry",
+              postgresql_where=text("password_reset_token IS NOT NULL"),
+              sqlite_where=text("password_reset_token IS NOT NULL")),
+        # Admin listing of the "unverified" and "inactive" tabs; verified/active use ix_users_created_at_id.
+        Index("ix_users_unverified_created_at_id", "created_at", "id",
+              postgresql_where=text("is_verified = false"),
+              sqlite_where=text("is_verified = 0")),
+        Index("ix_users_inactive_created_at_id", "created_at", "id",
+              postgresql_where=text("is_active = false"),
+              sqlite_where=text("is_active = 0")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -15,12 +42,144 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
 
     # Email Verification
-    verification_token = Column(String, unique=True, index=True, nullable=True)
+    verification_token = Column(String, nullable=True)
     verification_token_expiry = Column(DateTime, nullable=True)
 
     # Password Reset
-    password_reset_token = Column(String, unique=True, index=True, nullable=True)
+    password_reset_token = Column(String, nullable=True)
     password_reset_token_expiry = Column(DateTime, nullable=True)
 
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Emails are compared case-insensitively (utils.normalize_email); this also keeps
+# differently cased duplicates out.
+Index("ix_users_lower_email", func.lower(User.email), unique=True)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # sha256 of the access token (see utils.hash_token); raw tokens are never stored
+    token_hash = Column(String, unique=True, index=True, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserSession(Base):
+    """
+    A signed-in device (sessions.py). Holds the hash of its current refresh
+    token and of the one it replaced, so a replayed old token is recognised.
+    """
+    __tablename__ = "user_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # sha256 of the secret half of the refresh token (see utils.hash_token)
+    refresh_token_hash = Column(String, nullable=False)
+    previous_token_hash = Column(String, nullable=True)
+    rotated_at = Column(DateTime, nullable=True)
+    user_agent = Column(String, nullable=True)
+    ip = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # slides forward on every refresh
+    revoked_at = Column(DateTime, nullable=True)
+    revoked_reason = Column(String, nullable=True)  # logout | revoked | reuse | password_reset
+
+
+class RateLimitCounter(Base):
+    """Shared fixed-window counters for the database rate-limit backend (ratelimit.py)."""
+    __tablename__ = "rate_limit_counters"
+
+    key = Column(String, primary_key=True)
+    window = Column(Integer, primary_key=True)  # floor(epoch seconds / window length)
+    count = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, index=True, nullable=False)
+
+
+class EmailOutbox(Base):
+    """Transactional mail waiting to be delivered by the outbox worker (outbox.py)."""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    template = Column(String, nullable=False)  # key of mailer.TRANSACTIONAL_TEMPLATES
+    recipient = Column(String, nullable=False)
+    context = Column(JSON(none_as_null=True), nullable=True)  # cleared once delivered or dead-lettered
+    status = Column(String, nullable=False, default="pending")  # pending | sending | sent | dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    claimed_by = Column(String, nullable=True)  # token of the batch that set status to "sending"
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class BroadcastJob(Base):
+    """A broadcast to every verified user, sent in the background by broadcast_jobs.py."""
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String, nullable=False)
+    message_content = Column(Text, nullable=False)
+    created_by = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending | running | completed | failed
+    # True once every recipient has a broadcast_deliveries row
+    recipients_loaded = Column(Boolean, nullable=False, default=False)
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    unknown = Column(Integer, nullable=False, default=0)
+    # Runner currently owning the job and its last checkpoint; a stale heartbeat lets another runner resume it.
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class BroadcastDelivery(Base):
+    """One recipient of a broadcast job and the outcome of sending to them."""
+    __tablename__ = "broadcast_deliveries"
+    __table_args__ = (
+        UniqueConstraint("job_id", "email", name="uq_broadcast_deliveries_job_id_email"),
+        Index("ix_broadcast_deliveries_job_id_status", "job_id", "status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("broadcast_jobs.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String, nullable=True)
+    email = Column(String, nullable=False)
+    # pending | sending | sent | failed | unknown (was being sent when the runner died; never retried)
+    status = Column(String, nullable=False, default="pending")
+    error = Column(Text, nullable=True)
+    attempted_at = Column(DateTime, nullable=True)
+
+
+class UserStats(Base):
+    """
+    Running totals of the users table, kept current by user_stats.py so the
+    admin dashboard never counts rows. Each write lands on a random shard row
+    and readers sum them. Unverified/inactive are derived.
+    """
+    __tablename__ = "user_stats"
+
+    id = Column(Integer, primary_key=True)  # shard number
+    total = Column(Integer, nullable=False, default=0)
+    verified = Column(Integer, nullable=False, default=0)
+    active = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserSignupsDaily(Base):
+    __tablename__ = "user_signups_daily"
+
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0, server_default="0")
+    signups = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,248 @@
+"""
+Durable outbox for transactional mail.
+
+`enqueue_email` writes the message in the caller's transaction; `MailOutbox`
+workers deliver pending rows in batches over pooled SMTP sessions, retry
+transient failures with backoff and dead-letter permanent ones.
+`python outbox.py` runs the workers standalone.
+"""
+import logging
+import os
+import random
+import smtplib
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select, update
+from dotenv import load_dotenv
+
+from database import SessionLocal
+from mailer import PRIMARY_SMTP, SMTPConfig, TRANSACTIONAL_TEMPLATES, build_transactional_email, smtp_pool
+from models import EmailOutbox
+
+load_dotenv()
+
+logger = logging.getLogger("outbox")
+
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "2"))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+MAIL_POLL_SECONDS = float(os.getenv("MAIL_POLL_SECONDS", "2"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+MAIL_RETRY_BASE_SECONDS = float(os.getenv("MAIL_RETRY_BASE_SECONDS", "30"))
+MAIL_RETRY_MAX_SECONDS = float(os.getenv("MAIL_RETRY_MAX_SECONDS", "3600"))
+# Rows left in "sending" longer than this (worker died mid-batch) are picked up again.
+MAIL_LOCK_TIMEOUT_SECONDS = float(os.getenv("MAIL_LOCK_TIMEOUT_SECONDS", "300"))
+
+
+def enqueue_email(db, template: str, recipient: str, **context) -> EmailOutbox:
+    """
+    Add a message to the outbox. Works with both Session and AsyncSession;
+    nothing is sent until the caller commits.
+    """
+    if template not in TRANSACTIONAL_TEMPLATES:
+        raise ValueError(f"Unknown email template: {template!r}")
+    row = EmailOutbox(
+        template=template,
+        recipient=recipient,
+        context=context,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(row)
+    return row
+
+
+def retry_delay(attempts: int) -> float:
+    delay = MAIL_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return min(delay, MAIL_RETRY_MAX_SECONDS) * random.uniform(0.8, 1.2)
+
+
+def is_permanent_failure(exc: Exception) -> bool:
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 500 <= exc.smtp_code < 600
+    return False
+
+
+@dataclass
+class _Job:
+    id: int
+    template: str
+    recipient: str
+    context: Dict[str, str]
+    attempts: int
+    claimed_by: str
+
+
+# (delivered, error, permanent, tried); untried jobs get their attempt back
+_Result = Tuple[bool, Optional[str], bool, bool]
+
+
+class MailOutbox:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        cfg: SMTPConfig = PRIMARY_SMTP,
+        workers: int = MAIL_WORKERS,
+        batch_size: int = MAIL_BATCH_SIZE,
+        poll_seconds: float = MAIL_POLL_SECONDS,
+        max_attempts: int = MAIL_MAX_ATTEMPTS,
+    ):
+        self.session_factory = session_factory
+        self.cfg = cfg
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"mail-outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info("Mail outbox started with %d workers", self.workers)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Wake idle workers after committing new rows instead of waiting for the next poll."""
+        self._wake.set()
+
+    def drain_once(self) -> int:
+        """Claim and deliver a single batch in the calling thread; returns its size."""
+        jobs = self._claim()
+        if jobs:
+            self._record(jobs, self._deliver(jobs))
+        return len(jobs)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.drain_once():
+                    continue
+            except Exception:
+                logger.exception("Mail outbox batch failed")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _claim(self) -> List[_Job]:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=MAIL_LOCK_TIMEOUT_SECONDS)
+        claimable = or_(
+            and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+            and_(EmailOutbox.status == "sending", EmailOutbox.locked_at < stale),
+        )
+        token = uuid.uuid4().hex
+        with self.session_factory() as db:
+            # SKIP LOCKED keeps Postgres workers off each other's candidates; SQLite ignores it,
+            # so the conditional UPDATE below is what makes a row belong to one batch.
+            ids = db.execute(
+                select(EmailOutbox.id)
+                .where(claimable)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not ids:
+                db.rollback()
+                return []
+            db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(ids), claimable)
+                .values(status="sending", locked_at=now, claimed_by=token, attempts=EmailOutbox.attempts + 1)
+            )
+            db.commit()
+
+            # Only the rows this UPDATE actually changed; another worker may have claimed the rest.
+            rows = db.execute(
+                select(EmailOutbox).where(EmailOutbox.claimed_by == token).order_by(EmailOutbox.next_attempt_at)
+            ).scalars().all()
+            return [_Job(row.id, row.template, row.recipient, dict(row.context or {}), row.attempts, token)
+                    for row in rows]
+
+    def _deliver(self, jobs: List[_Job]) -> Dict[int, _Result]:
+        results: Dict[int, _Result] = {}
+        for i, job in enumerate(jobs):
+            try:
+                msg = build_transactional_email(job.template, job.recipient, job.context)
+            except Exception as e:
+                results[job.id] = (False, f"Failed to build message: {e}", True, True)
+                continue
+
+            try:
+                smtp_pool.send(self.cfg, msg)
+                results[job.id] = (True, None, False, True)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                results[job.id] = (False, str(e), is_permanent_failure(e), True)
+            except Exception as e:
+                # Could not reach the server at all; retry the rest of the batch later.
+                results[job.id] = (False, f"SMTP unavailable: {e}", False, True)
+                for rest in jobs[i + 1:]:
+                    results[rest.id] = (False, f"SMTP unavailable: {e}", False, False)
+                break
+        return results
+
+    def _record(self, jobs: List[_Job], results: Dict[int, _Result]) -> None:
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            for job in jobs:
+                delivered, error, permanent, tried = results[job.id]
+                if not tried:
+                    values = dict(
+                        status="pending",
+                        attempts=EmailOutbox.attempts - 1,
+                        next_attempt_at=now + timedelta(seconds=retry_delay(max(job.attempts - 1, 1))),
+                        last_error=error,
+                        locked_at=None,
+                    )
+                elif delivered:
+                    values = dict(status="sent", sent_at=now, context=None, last_error=None, locked_at=None)
+                elif permanent or job.attempts >= self.max_attempts:
+                    logger.error("Dead-lettering email %s to %s after %d attempts: %s",
+                                 job.id, job.recipient, job.attempts, error)
+                    values = dict(status="dead", context=None, last_error=error, locked_at=None)
+                else:
+                    logger.warning("Email %s to %s failed (attempt %d), retrying: %s",
+                                   job.id, job.recipient, job.attempts, error)
+                    values = dict(
+                        status="pending",
+                        next_attempt_at=now + timedelta(seconds=retry_delay(job.attempts)),
+                        last_error=error,
+                        locked_at=None,
+                    )
+                # A worker whose claim went stale must not overwrite the result of the one that took over.
+                db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id == job.id, EmailOutbox.claimed_by == job.claimed_by)
+                    .values(**values)
+                )
+            db.commit()
+
+
+mail_outbox = MailOutbox()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    mail_outbox.workers = max(mail_outbox.workers, 1)
+    mail_outbox.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mail_outbox.stop()
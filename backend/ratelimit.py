@@ -0,0 +1,322 @@
+"""
+Rate limiting for the endpoints that cost a bcrypt run or an email.
+
+Each policy allows `limit` hits per `window` seconds per client IP and per
+target email. Hits are counted with a sliding-window estimate over two fixed
+windows: the previous window's count, weighted by how much of it still
+overlaps the sliding window, plus the current one. "memory" keeps the counters
+per process; "database" shares them between workers via `rate_limit_counters`.
+Rejections are decided before the body reaches bcrypt or the outbox, and a
+key that is already blocked is rejected from a local table without I/O.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import delete, select
+from dotenv import load_dotenv
+
+from database import AsyncSessionLocal, dialect_insert
+from metrics import Counter, register_metric
+from models import RateLimitCounter
+from utils import normalize_email
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# "memory" limits each worker separately; "database" shares counters between workers.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Take the client IP from X-Forwarded-For; only enable behind a proxy that sets it.
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+# Proxies in front of the app that append to X-Forwarded-For. The client IP is the entry
+# this many from the right; anything further left was sent by the client and can be forged.
+RATE_LIMIT_PROXY_HOPS = max(int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1")), 1)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # memory backend
+RATE_LIMIT_PURGE_SECONDS = float(os.getenv("RATE_LIMIT_PURGE_SECONDS", "300"))  # database backend
+
+# policy -> (per IP, per email) as "hits/seconds"; "0" disables that key
+RATE_LIMIT_POLICIES = {
+    "login": (os.getenv("RATE_LIMIT_LOGIN_IP", "30/60"), os.getenv("RATE_LIMIT_LOGIN_EMAIL", "10/300")),
+    "register": (os.getenv("RATE_LIMIT_REGISTER_IP", "10/3600"), os.getenv("RATE_LIMIT_REGISTER_EMAIL", "3/3600")),
+    "forgot_password": (
+        os.getenv("RATE_LIMIT_FORGOT_PASSWORD_IP", "10/900"),
+        os.getenv("RATE_LIMIT_FORGOT_PASSWORD_EMAIL", "3/900"),
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    limit: int
+    window: float  # seconds
+
+
+def parse_rule(text: str) -> Optional[Rule]:
+    """"10/60" -> Rule(10, 60.0); "0" or "" -> None (unlimited)."""
+    text = (text or "").strip()
+    if text in ("", "0"):
+        return None
+    limit, _, window = text.partition("/")
+    return Rule(int(limit), float(window or 60))
+
+
+def retry_after(previous: int, current: int, elapsed: float, rule: Rule) -> float:
+    """
+    Seconds until the sliding estimate `previous * (1 - elapsed) + current`
+    drops below the limit, if nothing else arrives. `elapsed` is the fraction
+    of the current window that has passed.
+    """
+    if current >= rule.limit:
+        # Only the next window's decay of `current` can bring it under.
+        return ((1 - elapsed) + (1 - rule.limit / current)) * rule.window or 1.0
+    return max((1 - (rule.limit - current) / previous) - elapsed, 0.0) * rule.window or 1.0
+
+
+rate_limited = register_metric(Counter(
+    "bitva_rate_limited_total", "Requests rejected by the rate limiter.", ("policy", "key")))
+
+
+# ----------------------------
+# Backends
+# ----------------------------
+class RateLimitStore:
+    async def hit(self, key: str, rule: Rule, now: float) -> float:
+        """Count one request for `key`; returns 0 if it is allowed, else seconds to wait."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    Per-process counters: one small list per key, under a single lock, kept in
+    least-recently-hit order so a full table evicts from the front in O(1).
+    """
+
+    # Entries looked at per insert into a full table; at least one is always evicted.
+    EVICT_BATCH = 8
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [window index, previous count, current count, expires at]
+        self._counters: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rule: Rule, now: float) -> float:
+        position = now / rule.window
+        index = int(position)
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None:
+                if len(self._counters) >= self.max_keys:
+                    self._evict(now)
+                entry = self._counters[key] = [index, 0, 0, 0.0]
+            else:
+                # Rejected hits count as use too, so a blocked key is the last to be evicted.
+                self._counters.move_to_end(key)
+                if entry[0] != index:
+                    entry[1] = entry[2] if entry[0] == index - 1 else 0
+                    entry[2] = 0
+                    entry[0] = index
+            previous, current = entry[1], entry[2]
+            elapsed = position - index
+            if previous * (1 - elapsed) + current >= rule.limit:
+                return retry_after(previous, current, elapsed, rule)
+            entry[2] = current + 1
+            entry[3] = (index + 2) * rule.window
+            return 0.0
+
+    async def hit(self, key: str, rule: Rule, now: float) -> float:
+        return self.take(key, rule, now)
+
+    def _evict(self, now: float) -> None:
+        # The front holds the keys hit longest ago: drop expired ones, and if the table
+        # is still full, the oldest live one rather than grow without bound.
+        for _ in range(self.EVICT_BATCH):
+            if not self._counters:
+                return
+            entry = next(iter(self._counters.values()))
+            if entry[3] > now and len(self._counters) < self.max_keys:
+                return
+            self._counters.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._counters), "max_keys": self.max_keys}
+
+
+class DatabaseRateLimitStore(RateLimitStore):
+    """
+    Counters shared by every worker in `rate_limit_counters`: one upsert per
+    allowed request. Once a key is rejected, this worker remembers until when
+    and rejects it locally, so a flood never reaches the database.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, purge_interval: float = RATE_LIMIT_PURGE_SECONDS):
+        self.session_factory = session_factory
+        self.purge_interval = purge_interval
+        self._blocked: Dict[str, float] = {}  # key -> blocked until
+        self._next_purge = 0.0
+        self.local_rejections = 0
+
+    async def hit(self, key: str, rule: Rule, now: float) -> float:
+        until = self._blocked.get(key)
+        if until is not None:
+            if until > now:
+                self.local_rejections += 1
+                return until - now
+            self._blocked.pop(key, None)
+
+        position = now / rule.window
+        index = int(position)
+        elapsed = position - index
+        async with self.session_factory() as db:
+            current = (await db.execute(
+                dialect_insert(db, RateLimitCounter)
+                .values(key=key, window=index, count=1,
+                        expires_at=datetime.utcfromtimestamp((index + 2) * rule.window))
+                .on_conflict_do_update(
+                    index_elements=["key", "window"],
+                    set_={"count": RateLimitCounter.count + 1},
+                )
+                .returning(RateLimitCounter.count)
+            )).scalar_one()
+            previous = 0
+            if current <= rule.limit:
+                previous = (await db.execute(
+                    select(RateLimitCounter.count)
+                    .where(RateLimitCounter.key == key, RateLimitCounter.window == index - 1)
+                )).scalar() or 0
+            await db.commit()
+            if now >= self._next_purge:
+                await self._purge(db, now)
+
+        # `current` already includes this request.
+        if previous * (1 - elapsed) + current - 1 < rule.limit:
+            return 0.0
+        wait = retry_after(previous, current - 1, elapsed, rule)
+        self._blocked[key] = now + wait
+        return wait
+
+    async def _purge(self, db, now: float) -> None:
+        self._next_purge = now + self.purge_interval
+        await db.execute(delete(RateLimitCounter).where(RateLimitCounter.expires_at < datetime.utcfromtimestamp(now)))
+        await db.commit()
+        for key in [key for key, until in self._blocked.items() if until <= now]:
+            self._blocked.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"blocked_keys": len(self._blocked), "local_rejections": self.local_rejections}
+
+
+def create_rate_limit_store(backend: str = RATE_LIMIT_BACKEND) -> RateLimitStore:
+    if backend == "memory":
+        return MemoryRateLimitStore()
+    if backend == "database":
+        return DatabaseRateLimitStore()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend!r}")
+
+
+# ----------------------------
+# Limiter
+# ----------------------------
+def _email_key(email: str) -> str:
+    # Hashed so the shared table never holds addresses; 128 bits is plenty for a counter key.
+    return hashlib.sha256(normalize_email(email).encode()).hexdigest()[:32]
+
+
+class RateLimiter:
+    def __init__(self, store: RateLimitStore, policies: Dict[str, Tuple[str, str]], enabled: bool = True):
+        self.store = store
+        self.enabled = enabled
+        self.policies = {name: (parse_rule(ip), parse_rule(email)) for name, (ip, email) in policies.items()}
+        self.rejected: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def check(self, policy: str, ip: Optional[str], email: Optional[str] = None) -> None:
+        """Count the request against `policy`; raises 429 with Retry-After once a limit is reached."""
+        if not self.enabled:
+            return
+        per_ip, per_email = self.policies[policy]
+        now = time.time()
+        for kind, identity, rule in (("ip", ip, per_ip), ("email", email and _email_key(email), per_email)):
+            if rule is None or not identity:
+                continue
+            wait = await self.store.hit(f"{policy}:{kind}:{identity}", rule, now)
+            if wait:
+                with self._lock:
+                    self.rejected[f"{policy}:{kind}"] = self.rejected.get(f"{policy}:{kind}", 0) + 1
+                rate_limited.inc(policy, kind)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests, please try again later",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            rejected = dict(self.rejected)
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.store).__name__,
+            "policies": {
+                name: {kind: f"{rule.limit}/{rule.window:g}s" if rule else None
+                       for kind, rule in zip(("ip", "email"), rules)}
+                for name, rules in self.policies.items()
+            },
+            "rejected": rejected,
+            **self.store.stats(),
+        }
+
+
+rate_limiter = RateLimiter(create_rate_limit_store(), RATE_LIMIT_POLICIES, RATE_LIMIT_ENABLED)
+
+
+def client_ip(request: Request) -> Optional[str]:
+    if RATE_LIMIT_TRUST_PROXY:
+        # Repeated headers count as one list, so a forged first header cannot hide the proxy's.
+        forwarded = ",".join(request.headers.getlist("x-forwarded-for"))
+        if forwarded:
+            hops = forwarded.split(",")
+            return hops[-min(RATE_LIMIT_PROXY_HOPS, len(hops))].strip()
+    return request.client.host if request.client else None
+
+
+async def _body_field(request: Request, name: str) -> Optional[str]:
+    # FastAPI has already read and cached the body, so this does not touch the socket.
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+            value = body.get(name) if isinstance(body, dict) else None
+        else:
+            value = (await request.form()).get(name)
+    except Exception:
+        return None
+    return value if isinstance(value, str) else None
+
+
+class RateLimit:
+    """
+    Route dependency: `dependencies=[Depends(RateLimit("login", "username"))]`.
+    `email_field` names the form or JSON field holding the target email.
+    """
+
+    def __init__(self, policy: str, email_field: Optional[str] = None):
+        if policy not in RATE_LIMIT_POLICIES:
+            raise ValueError(f"Unknown rate limit policy: {policy!r}")
+        self.policy = policy
+        self.email_field = email_field
+
+    async def __call__(self, request: Request) -> None:
+        if not rate_limiter.enabled:
+            return
+        email = await _body_field(request, self.email_field) if self.email_field else None
+        await rate_limiter.check(self.policy, client_ip(request), email)
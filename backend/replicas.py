@@ -0,0 +1,260 @@
+"""
+Read-replica routing.
+
+Read-only dependencies (principal lookups behind /api/me, admin listings and
+exports, the broadcast recipient scan) take their session from
+`ReadSessionLocal` / `AsyncReadSessionLocal`. Those sessions pick a replica
+from REPLICA_URLS when their first statement runs and keep it for the rest of
+the session; writes, and everything after a write, go to the primary.
+
+A monitor thread probes each replica's replication lag every
+REPLICA_CHECK_SECONDS. A replica that is unreachable or more than
+REPLICA_MAX_LAG_SECONDS behind is skipped, and with none left reads fall back
+to the primary. After a request commits a write, reads for the same subject
+(the caller's email) stay on the primary for READ_YOUR_WRITES_SECONDS, so
+nobody reads back older data than they just wrote. Like the principal cache,
+this is tracked per worker process.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from dotenv import load_dotenv
+
+from database import _async_url, _engine_options, get_async_engine, get_engine
+
+load_dotenv()
+
+logger = logging.getLogger("replicas")
+
+# Comma-separated sync URLs; async URLs are derived like ASYNC_DATABASE_URL.
+REPLICA_URLS = [url.strip() for url in os.getenv("REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Query returning how many seconds a replica is behind, e.g. from a heartbeat table.
+# Postgres replicas default to _POSTGRES_LAG_QUERY; other databases only get a reachability check.
+REPLICA_LAG_QUERY = os.getenv("REPLICA_LAG_QUERY", "")
+
+# An idle primary sends no WAL, so a replica that has replayed everything it received counts as 0.
+_POSTGRES_LAG_QUERY = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.async_url = _async_url(url)
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self._engine: Optional[Engine] = None
+        self._async_engine: Optional[AsyncEngine] = None
+        self._lock = threading.Lock()
+        # Unknown until the first probe, so reads stay on the primary until then.
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = create_engine(self.url, **_engine_options(self.url))
+        return self._engine
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        if self._async_engine is None:
+            with self._lock:
+                if self._async_engine is None:
+                    self._async_engine = create_async_engine(self.async_url, **_engine_options(self.async_url))
+        return self._async_engine
+
+    @property
+    def usable(self) -> bool:
+        return self.error is None and self.lag is not None and self.lag <= REPLICA_MAX_LAG_SECONDS
+
+    def probe(self) -> None:
+        try:
+            with self.engine.connect() as conn:
+                query = REPLICA_LAG_QUERY or (_POSTGRES_LAG_QUERY if conn.dialect.name == "postgresql" else "")
+                if query:
+                    self.lag = float(conn.execute(text(query)).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))  # nothing to measure (e.g. SQLite stand-ins)
+                    self.lag = 0.0
+            if self.error is not None:
+                logger.info("Replica %s is reachable again", self.name)
+            self.error = None
+        except Exception as e:
+            if self.error is None:
+                logger.warning("Replica %s is unavailable: %s", self.name, e)
+            self.error = str(e)
+        self.checked_at = time.time()
+
+
+class ReplicaSet:
+    """Replicas, their probed lag, and the subjects that recently wrote."""
+
+    def __init__(self, urls: List[str], interval: float = REPLICA_CHECK_SECONDS,
+                 sticky_seconds: float = READ_YOUR_WRITES_SECONDS):
+        self.replicas = [Replica(url) for url in urls]
+        self.interval = interval
+        self.sticky_seconds = sticky_seconds
+        self._next = itertools.count()
+        self._recent_writes: Dict[str, float] = {}  # subject -> read from the primary until
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.routed = {"replica": 0, "primary_no_replica": 0, "primary_sticky": 0, "primary_write": 0}
+
+    # -- routing --
+    def pick(self, subject: Optional[str]) -> Optional[Replica]:
+        """A usable replica, round-robin; None if reads must go to the primary."""
+        if subject is not None and self._recent_writes and self._recent_writes.get(subject, 0) > time.time():
+            self._count("primary_sticky")
+            return None
+        usable = [replica for replica in self.replicas if replica.usable]
+        if not usable:
+            self._count("primary_no_replica")
+            return None
+        self._count("replica")
+        return usable[next(self._next) % len(usable)]
+
+    def mark_write(self, subject: str) -> None:
+        now = time.time()
+        with self._lock:
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {s: until for s, until in self._recent_writes.items() if until > now}
+            self._recent_writes[subject] = now + self.sticky_seconds
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.routed[key] += 1
+
+    # -- monitor --
+    def start(self) -> None:
+        if self._thread is not None or not self.replicas:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def check_once(self) -> None:
+        for replica in self.replicas:
+            replica.probe()
+
+    def _run(self) -> None:
+        while True:
+            self.check_once()
+            if self._stop.wait(self.interval):
+                return
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            if replica._async_engine is not None:
+                await replica._async_engine.dispose()
+            if replica._engine is not None:
+                replica._engine.dispose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            routed = dict(self.routed)
+            sticky = len(self._recent_writes)
+        return {
+            "replicas": len(self.replicas),
+            "usable": sum(replica.usable for replica in self.replicas),
+            "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+            "sticky_subjects": sticky,
+            **{f"routed_{key}": value for key, value in routed.items()},
+            "status": [
+                {"replica": r.name, "lag_seconds": r.lag, "usable": r.usable, "error": r.error}
+                for r in self.replicas
+            ],
+        }
+
+
+replicas = ReplicaSet(REPLICA_URLS)
+
+
+# ----------------------------
+# Read-your-writes subject
+# ----------------------------
+_read_subject: ContextVar[Optional[str]] = ContextVar("read_subject", default=None)
+
+
+def set_read_subject(subject: Optional[str]) -> None:
+    """Name whose writes in this request pin its later reads to the primary (the caller's email)."""
+    _read_subject.set(subject)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("wrote", False) and replicas.replicas:
+        subject = _read_subject.get()
+        if subject is not None:
+            replicas.mark_write(subject)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("wrote", None)
+
+
+# ----------------------------
+# Sessions
+# ----------------------------
+class RoutingSession(Session):
+    """Sends reads to the replica chosen on first use, and writes to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        is_async = self.info.get("async", False)
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.info["primary"] = True
+            replicas._count("primary_write")
+        if not self.info.get("primary"):
+            if "replica" not in self.info:
+                self.info["replica"] = replicas.pick(_read_subject.get())
+            replica = self.info["replica"]
+            if replica is not None:
+                return replica.async_engine.sync_engine if is_async else replica.engine
+        return get_async_engine().sync_engine if is_async else get_engine()
+
+
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(
+    class_=AsyncSession, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False,
+    info={"async": True},
+)
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
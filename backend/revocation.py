@@ -0,0 +1,245 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import create_engine, delete, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from dotenv import load_dotenv
+
+from models import RevokedToken
+
+load_dotenv()
+
+logger = logging.getLogger("revocation")
+
+# "memory" keeps revocations per process; "database" shares them between workers.
+REVOCATION_BACKEND = os.getenv("REVOCATION_BACKEND", "memory")
+# Defaults to the application database; point at e.g. sqlite:///revoked.db to keep it separate.
+REVOCATION_DATABASE_URL = os.getenv("REVOCATION_DATABASE_URL")
+# How often each worker's background thread pulls revocations made by other workers.
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+# How often expired rows are deleted and the local copy reloaded from the live set.
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", "600"))
+
+
+def _to_db_time(expires_at: float) -> datetime:
+    return datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None)
+
+
+class RevocationStore:
+    """
+    Set of revoked access tokens, keyed by token hash (utils.hash_token).
+
+    Entries only need to live until the token's own `exp`; after that the JWT
+    check rejects the token anyway.
+    """
+
+    def revoke(self, token_hash: str, expires_at: float) -> None:
+        raise NotImplementedError
+
+    def is_revoked(self, token_hash: str) -> bool:
+        raise NotImplementedError
+
+    def purge(self) -> int:
+        """Drop expired entries; returns how many were removed."""
+        return 0
+
+    def start(self) -> None:
+        """Start background syncing, for stores shared between workers."""
+
+    def stop(self) -> None:
+        pass
+
+
+# ----------------------------
+# In-memory backend
+# ----------------------------
+class MemoryRevocationStore(RevocationStore):
+    """Per-process store; each entry is evicted once its token's `exp` has passed."""
+
+    def __init__(self):
+        self._entries: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def revoke(self, token_hash: str, expires_at: float) -> None:
+        if expires_at <= time.time():
+            return
+        with self._lock:
+            if token_hash not in self._entries:
+                self._entries[token_hash] = expires_at
+                heapq.heappush(self._expiry_heap, (expires_at, token_hash))
+
+    def is_revoked(self, token_hash: str) -> bool:
+        now = time.time()
+        if self._expiry_heap and self._expiry_heap[0][0] <= now:
+            self._evict(now)
+        return token_hash in self._entries
+
+    def purge(self) -> int:
+        return self._evict(time.time())
+
+    def entries(self) -> List[Tuple[str, float]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def _evict(self, now: float) -> int:
+        removed = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                _, token_hash = heapq.heappop(self._expiry_heap)
+                self._entries.pop(token_hash, None)
+                removed += 1
+        return removed
+
+
+# ----------------------------
+# Shared (database) backend
+# ----------------------------
+class DatabaseRevocationStore(RevocationStore):
+    """
+    Revocations persisted in `revoked_tokens` and shared by every worker.
+
+    Each worker answers `is_revoked` from a local copy of the live rows (a
+    MemoryRevocationStore), so the auth path never waits on the database.
+    A background thread pulls rows added by other workers every
+    `sync_interval` seconds, so a token revoked elsewhere can still be
+    accepted here for that long. Every `rebuild_interval` it deletes expired
+    rows and reloads the copy, which also picks up rows whose ids committed
+    out of order.
+    """
+
+    def __init__(
+        self,
+        engine: Union[Engine, Callable[[], Engine]],
+        sync_interval: float = REVOCATION_SYNC_SECONDS,
+        rebuild_interval: float = REVOCATION_REBUILD_SECONDS,
+    ):
+        self._engine = engine
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._table = RevokedToken.__table__
+
+        self._local = MemoryRevocationStore()
+        self._last_id = 0
+        self._next_rebuild = 0.0
+        self._sync_lock = threading.Lock()
+        self._engine_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def engine(self) -> Engine:
+        # Resolved on first use, so creating the store at import never connects.
+        if not isinstance(self._engine, Engine):
+            with self._engine_lock:
+                if not isinstance(self._engine, Engine):
+                    engine = self._engine()
+                    if engine.dialect.name == "sqlite":
+                        self._table.create(engine, checkfirst=True)
+                    self._engine = engine
+        return self._engine
+
+    def revoke(self, token_hash: str, expires_at: float) -> None:
+        if expires_at <= time.time():
+            return
+        self._local.revoke(token_hash, expires_at)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(self._table).values(
+                    token_hash=token_hash,
+                    expires_at=_to_db_time(expires_at),
+                    created_at=datetime.utcnow(),
+                ))
+        except IntegrityError:
+            pass  # already revoked
+
+    def is_revoked(self, token_hash: str) -> bool:
+        return self._local.is_revoked(token_hash)
+
+    def purge(self) -> int:
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                delete(self._table).where(self._table.c.expires_at <= datetime.utcnow())
+            )
+        return result.rowcount or 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sync()
+            except SQLAlchemyError as e:
+                logger.warning("Revocation sync failed, keeping local copy: %s", e)
+            if self._stop.wait(self.sync_interval):
+                return
+
+    def sync(self) -> None:
+        """Bring the local copy up to date; the first call (and every rebuild_interval) reloads it."""
+        with self._sync_lock:
+            now = time.monotonic()
+            if now >= self._next_rebuild:
+                self._rebuild()
+                self._next_rebuild = now + self.rebuild_interval
+            else:
+                self._pull()
+
+    def _pull(self) -> None:
+        """Add rows inserted by other workers since the last sync."""
+        t = self._table
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(t.c.id, t.c.token_hash, t.c.expires_at).where(t.c.id > self._last_id).order_by(t.c.id)
+            ).all()
+        for _, token_hash, expires_at in rows:
+            self._local.revoke(token_hash, expires_at.replace(tzinfo=timezone.utc).timestamp())
+        if rows:
+            self._last_id = rows[-1][0]
+
+    def _rebuild(self) -> None:
+        """Delete expired rows and reload the local copy from what is left."""
+        removed = self.purge()
+        t = self._table
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(t.c.id, t.c.token_hash, t.c.expires_at)).all()
+
+        local = MemoryRevocationStore()
+        for _, token_hash, expires_at in rows:
+            local.revoke(token_hash, expires_at.replace(tzinfo=timezone.utc).timestamp())
+        # Keep this worker's own revocations even if a concurrent reload missed them.
+        for token_hash, expires_at in self._local.entries():
+            local.revoke(token_hash, expires_at)
+        self._local = local
+        self._last_id = max((row[0] for row in rows), default=self._last_id)
+        logger.info("Revocation copy reloaded: %d live, %d expired removed", len(rows), removed)
+
+
+def create_revocation_store(backend: str = REVOCATION_BACKEND) -> RevocationStore:
+    if backend == "memory":
+        return MemoryRevocationStore()
+    if backend == "database":
+        if REVOCATION_DATABASE_URL:
+            return DatabaseRevocationStore(lambda: create_engine(REVOCATION_DATABASE_URL, pool_pre_ping=True))
+        from database import get_engine
+        return DatabaseRevocationStore(get_engine)
+    raise ValueError(f"Unknown REVOCATION_BACKEND: {backend!r}")
+
+
+revocation_store = create_revocation_store()
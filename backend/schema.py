@@ -0,0 +1,107 @@
+"""
+Schema version check.
+
+Alembic owns the schema: the app no longer runs `create_all`, it only checks
+at startup that the database is at the migration head (one small query).
+`python schema.py check` prints both revisions; `python schema.py init`
+creates the tables on an empty database and stamps it at head, since the
+migrations start from an existing users table.
+"""
+import logging
+import os
+import sys
+from typing import Tuple
+
+from sqlalchemy import inspect
+from dotenv import load_dotenv
+
+from database import get_async_engine, get_engine
+
+load_dotenv()
+
+logger = logging.getLogger("schema")
+
+# "error" refuses to start on a mismatch, "warn" only logs it, "off" skips the check.
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "error")
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+def _alembic_config():
+    from alembic.config import Config
+
+    return Config(ALEMBIC_INI)
+
+
+def expected_revisions() -> Tuple[str, ...]:
+    """Head revision(s) of the migration scripts shipped with this code."""
+    from alembic.script import ScriptDirectory
+
+    return tuple(sorted(ScriptDirectory.from_config(_alembic_config()).get_heads()))
+
+
+def _current_revisions(connection) -> Tuple[str, ...]:
+    from alembic.runtime.migration import MigrationContext
+
+    return tuple(sorted(MigrationContext.configure(connection).get_current_heads()))
+
+
+def current_revisions() -> Tuple[str, ...]:
+    with get_engine().connect() as conn:
+        return _current_revisions(conn)
+
+
+async def current_revisions_async() -> Tuple[str, ...]:
+    async with get_async_engine().connect() as conn:
+        return await conn.run_sync(_current_revisions)
+
+
+async def check_schema_async(mode: str = SCHEMA_CHECK) -> None:
+    if mode == "off":
+        return
+    current, expected = await current_revisions_async(), expected_revisions()
+    if current == expected:
+        return
+    message = (
+        f"Database schema is at {', '.join(current) or 'no revision'}, "
+        f"this code expects {', '.join(expected)}; run `alembic upgrade head` "
+        "(or `python schema.py init` on an empty database)"
+    )
+    if mode == "warn":
+        logger.warning(message)
+        return
+    raise SchemaVersionError(message)
+
+
+def init_schema() -> str:
+    """Create every table on an empty database and stamp it at head; returns what was done."""
+    from alembic import command
+
+    from models import Base
+
+    engine = get_engine()
+    current = current_revisions()
+    if current == expected_revisions():
+        return "already at head"
+    if current or inspect(engine).get_table_names():
+        raise SchemaVersionError("Database is not empty; use `alembic upgrade head` instead")
+    Base.metadata.create_all(bind=engine)
+    command.stamp(_alembic_config(), "head")
+    return "created"
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    action = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if action == "init":
+        print(init_schema())
+    elif action == "check":
+        print(f"current: {', '.join(current_revisions()) or '-'}")
+        print(f"expected: {', '.join(expected_revisions())}")
+        sys.exit(0 if current_revisions() == expected_revisions() else 1)
+    else:
+        sys.exit(f"usage: python {sys.argv[0]} [check|init]")
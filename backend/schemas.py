@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel, EmailStr
 
 class UserCreate(BaseModel):
@@ -11,6 +12,10 @@ class Token(BaseModel):
     email: str
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshIn(BaseModel):
+    refresh_token: str
 
 class ForgotPasswordIn(BaseModel):
     email: EmailStr
@@ -22,6 +27,13 @@ class PasswordResetIn(BaseModel):
     new_password: str
     token: str
 
+class UserImportRow(BaseModel):
+    email: EmailStr
+    name: str
+    password: Optional[str] = None
+    password_hash: Optional[str] = None  # existing bcrypt hash, stored as is
+    is_verified: Optional[bool] = None
+
 class UserRead(BaseModel):
     id: int
     email: str
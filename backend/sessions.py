@@ -0,0 +1,167 @@
+"""
+Refresh tokens and per-device sessions.
+
+Login creates a `user_sessions` row and returns a refresh token
+`<session id>.<secret>` next to the short-lived access token; only the
+secret's hash is stored. `/api/refresh` trades it for a new pair with one
+indexed lookup and one conditional update, so renewing an access token never
+runs bcrypt. Every refresh rotates the secret and slides the session's expiry
+forward (up to SESSION_MAX_DAYS after login). Presenting the secret that was
+just rotated out means it was copied: the session is revoked, and so are the
+access tokens issued for it, which carry the session id as `sid`.
+"""
+import hmac
+import logging
+import os
+import secrets
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+from metrics import Counter, register_metric
+from models import User, UserSession
+from revocation import revocation_store
+from utils import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, hash_token, session_revocation_key
+
+load_dotenv()
+
+logger = logging.getLogger("sessions")
+
+# A session ends after this long without a refresh...
+SESSION_IDLE_DAYS = float(os.getenv("SESSION_IDLE_DAYS", "14"))
+# ...and this long after login, however often it is refreshed.
+SESSION_MAX_DAYS = float(os.getenv("SESSION_MAX_DAYS", "90"))
+# A client that sends the same refresh token twice in this window (two tabs racing)
+# gets a 401 instead of losing the session.
+REFRESH_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+
+session_events = register_metric(Counter(
+    "bitva_session_events_total", "Sessions created, refreshed and revoked.", ("event",)))
+
+
+def _invalid(detail: str = "Invalid refresh token") -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+def _new_secret() -> Tuple[str, str]:
+    secret = secrets.token_urlsafe(32)
+    return secret, hash_token(secret)
+
+
+def _expiry(created_at: datetime, now: datetime) -> datetime:
+    return min(now + timedelta(days=SESSION_IDLE_DAYS), created_at + timedelta(days=SESSION_MAX_DAYS))
+
+
+def issue_tokens(user, session_id: int, secret: str) -> dict:
+    """Response body shared by login and refresh (schemas.Token)."""
+    return {
+        "name": user.name,
+        "email": user.email,
+        "access_token": create_access_token(data={"sub": user.email, "sid": session_id}),
+        "refresh_token": f"{session_id}.{secret}",
+        "token_type": "bearer",
+    }
+
+
+async def create_session(db: AsyncSession, user, user_agent: Optional[str] = None,
+                         ip: Optional[str] = None) -> dict:
+    """Start a session for `user` and return its tokens. Commits."""
+    now = datetime.utcnow()
+    secret, secret_hash = _new_secret()
+    session = UserSession(
+        user_id=user.id, refresh_token_hash=secret_hash, user_agent=(user_agent or "")[:256] or None,
+        ip=ip, created_at=now, last_used_at=now, expires_at=_expiry(now, now),
+    )
+    db.add(session)
+    await db.commit()
+    session_events.inc("created")
+    return issue_tokens(user, session.id, secret)
+
+
+async def refresh_session(db: AsyncSession, refresh_token: str) -> dict:
+    """Rotate a refresh token; returns the new tokens or raises 401."""
+    session_id, _, secret = refresh_token.partition(".")
+    if not session_id.isdigit() or not secret:
+        raise _invalid()
+    row = (await db.execute(
+        select(UserSession, User).join(User, User.id == UserSession.user_id)
+        .where(UserSession.id == int(session_id))
+    )).first()
+    if row is None:
+        raise _invalid()
+    session, user = row
+    now = datetime.utcnow()
+    if session.revoked_at is not None or session.expires_at <= now:
+        raise _invalid("Session has ended")
+    if not user.is_active or not user.is_verified:
+        raise _invalid()
+
+    presented = hash_token(secret)
+    if not hmac.compare_digest(session.refresh_token_hash, presented):
+        if session.previous_token_hash and hmac.compare_digest(session.previous_token_hash, presented):
+            if session.rotated_at and (now - session.rotated_at).total_seconds() < REFRESH_REUSE_GRACE_SECONDS:
+                raise _invalid("Refresh token already used")
+            logger.warning("Refresh token reused for session %s of user %s; revoking it", session.id, user.id)
+            await revoke_sessions(db, user.id, session_ids=[session.id], reason="reuse")
+        raise _invalid()
+
+    new_secret, new_hash = _new_secret()
+    # Conditional on the hash we read, so two concurrent refreshes cannot both win.
+    result = await db.execute(
+        update(UserSession)
+        .where(UserSession.id == session.id, UserSession.refresh_token_hash == presented,
+               UserSession.revoked_at.is_(None))
+        .values(refresh_token_hash=new_hash, previous_token_hash=presented, rotated_at=now,
+                last_used_at=now, expires_at=_expiry(session.created_at, now))
+    )
+    await db.commit()
+    if not result.rowcount:
+        raise _invalid("Refresh token already used")
+    session_events.inc("refreshed")
+    return issue_tokens(user, session.id, new_secret)
+
+
+async def list_sessions(db: AsyncSession, user_id: int) -> List[UserSession]:
+    result = await db.execute(
+        select(UserSession)
+        .where(UserSession.user_id == user_id, UserSession.revoked_at.is_(None),
+               UserSession.expires_at > datetime.utcnow())
+        .order_by(UserSession.last_used_at.desc())
+    )
+    return result.scalars().all()
+
+
+async def revoke_sessions(db: AsyncSession, user_id: int, session_ids: Optional[List[int]] = None,
+                          except_id: Optional[int] = None, reason: str = "revoked") -> int:
+    """
+    End the user's live sessions (all, or `session_ids`, minus `except_id`)
+    and reject their outstanding access tokens. Commits first, so the
+    revocation store never writes while this transaction holds row locks;
+    returns how many sessions were ended.
+    """
+    query = update(UserSession).where(UserSession.user_id == user_id, UserSession.revoked_at.is_(None))
+    if session_ids is not None:
+        query = query.where(UserSession.id.in_(session_ids))
+    if except_id is not None:
+        query = query.where(UserSession.id != except_id)
+    ended = (await db.execute(
+        query.values(revoked_at=datetime.utcnow(), revoked_reason=reason).returning(UserSession.id)
+    )).scalars().all()
+    await db.commit()
+    if ended:
+        await run_in_threadpool(_reject_access_tokens, ended)
+        session_events.inc(reason, amount=len(ended))
+    return len(ended)
+
+
+def _reject_access_tokens(session_ids: List[int]) -> None:
+    # Access tokens are stateless; the revocation store rejects them by `sid` until they expire.
+    expires_at = time.time() + 60 * ACCESS_TOKEN_EXPIRE_MINUTES
+    for session_id in session_ids:
+        revocation_store.revoke(session_revocation_key(session_id), expires_at)
@@ -0,0 +1,29 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test-secret-0123456789abcdef0123456789abcdef")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("REVOCATION_BACKEND", "memory")
+os.environ.setdefault("HASH_POOL_SIZE", "0")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app_db(tmp_path, monkeypatch):
+    """Points the app's engines at a fresh SQLite file with every table created."""
+    import database
+    from models import Base
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    monkeypatch.setattr(database, "_engine", None)
+    monkeypatch.setattr(database, "_async_engine", None)
+    monkeypatch.setitem(database.SessionLocal.kw, "bind", None)
+    monkeypatch.setitem(database.AsyncSessionLocal.kw, "bind", None)
+    Base.metadata.create_all(database.get_engine())
+    yield database
+    asyncio.run(database.dispose_engines())
@@ -0,0 +1,28 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from models import User
+from utils import decode_access_token, get_password_hash
+
+
+def test_refreshes_within_one_second_issue_distinct_tokens(app_db):
+    import main
+
+    with app_db.SessionLocal() as db:
+        db.add(User(email="jti@example.com", name="J", password=get_password_hash("pw-123456"), is_verified=True))
+        db.commit()
+    client = TestClient(main.app)
+
+    started = time.monotonic()
+    login = client.post("/api/login", data={"username": "jti@example.com", "password": "pw-123456"}).json()
+    first = client.post("/api/refresh", json={"refresh_token": login["refresh_token"]}).json()
+    second = client.post("/api/refresh", json={"refresh_token": first["refresh_token"]}).json()
+    assert time.monotonic() - started < 1
+
+    tokens = [login["access_token"], first["access_token"], second["access_token"]]
+    assert len(set(tokens)) == 3
+    claims = [decode_access_token(token) for token in tokens]
+    assert len({c["jti"] for c in claims}) == 3 and all("iat" in c for c in claims)
+    for token in tokens:
+        assert client.get("/api/me", headers={"Authorization": f"Bearer {token}"}).status_code == 200
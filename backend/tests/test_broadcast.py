@@ -0,0 +1,44 @@
+import pytest
+
+from broadcast import BroadcastAborted, BroadcastEngine
+
+
+class _Conn:
+    def __init__(self, sent):
+        self.messages = 0
+        self.server = self
+        self._sent = sent
+
+    def sendmail(self, sender, recipients, msg):
+        self._sent.extend(recipients)
+
+
+class _Pool:
+    def __init__(self):
+        self.sent = []
+
+    def acquire(self, cfg):
+        return _Conn(self.sent)
+
+    def record_sent(self, conn):
+        conn.messages += 1
+
+    def release(self, cfg, conn, healthy=True):
+        pass
+
+
+def test_callback_abort_stops_sending():
+    pool = _Pool()
+    engine = BroadcastEngine(sessions=2, rate_per_second=0, progress_seconds=0, pool=pool)
+    reports = []
+
+    def on_progress(progress):
+        reports.append(progress.done)
+        if len(reports) == 3:
+            raise BroadcastAborted("lease lost")
+
+    recipients = ((f"u{i}", f"u{i}@example.com") for i in range(10000))
+    with pytest.raises(BroadcastAborted):
+        engine.run(recipients, lambda name, email: b"msg", on_progress=on_progress)
+    # Workers finish at most the message each had in hand.
+    assert 3 <= len(pool.sent) <= 3 + engine.sessions
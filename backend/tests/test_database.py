@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+import database
+
+
+def test_import_does_not_need_database_settings():
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("DATABASE_URL", "ASYNC_DATABASE_URL", "DB_HOST", "DB_PORT")}
+    proc = subprocess.run([sys.executable, "-c", "import database, main"],
+                          cwd=os.path.dirname(database.__file__), env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_async_url_is_derived_from_database_url(monkeypatch):
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    monkeypatch.setenv("DATABASE_URL", "postgresql://u:p@db:5432/app")
+    assert database.async_database_url() == "postgresql+asyncpg://u:p@db:5432/app"
+    monkeypatch.setenv("DATABASE_URL", "sqlite:////tmp/app.db")
+    assert database.async_database_url() == "sqlite+aiosqlite:////tmp/app.db"
@@ -0,0 +1,26 @@
+import pytest
+
+from importer import RowParser, decode_lines
+
+
+def _bytewise(data: bytes):
+    return (data[i:i + 1] for i in range(len(data)))
+
+
+def test_csv_quoted_newlines_survive_arbitrary_chunking():
+    body = 'email,name,password\r\na@example.com,"Zoë\nSecond line, too",pw\r\n\r\nb@example.com,Łukasz,pw'
+    rows = list(RowParser("csv").feed(decode_lines(_bytewise(body.encode()))))
+    assert rows == [
+        {"email": "a@example.com", "name": "Zoë\nSecond line, too", "password": "pw", "_line": 2},
+        {"email": "b@example.com", "name": "Łukasz", "password": "pw", "_line": 5},
+    ]
+
+
+def test_invalid_utf8_is_rejected_even_at_the_end():
+    with pytest.raises(UnicodeDecodeError):
+        list(decode_lines([b"email,name\n", b"a@example.com,\xc3"]))
+
+
+def test_ndjson_lines_are_numbered():
+    rows = list(RowParser("ndjson").feed(decode_lines([b'{"email": "a@example.com"}\n\n[1]\n'])))
+    assert rows == [{"email": "a@example.com", "_line": 1}, {"_line": 3, "_error": "expected a JSON object"}]
@@ -0,0 +1,43 @@
+import jwt
+import pytest
+
+import keys
+from keys import KeySet, write_key_file
+
+
+@pytest.fixture
+def keyset(tmp_path, monkeypatch):
+    monkeypatch.setattr(keys, "JWT_ALGORITHM", "EdDSA")
+    monkeypatch.setattr(keys, "JWT_KEYS_DIR", str(tmp_path))
+    write_key_file(str(tmp_path), "EdDSA")
+    return KeySet.from_env()
+
+
+def test_new_kid_is_accepted_right_after_startup(keyset, tmp_path):
+    kid = write_key_file(str(tmp_path), "EdDSA")
+    rotated = KeySet.from_env()
+
+    token = jwt.encode({"sub": "a@example.com"}, rotated._by_kid[kid].signing_key, algorithm="EdDSA",
+                       headers={"kid": kid})
+    assert keyset.verify(token)["sub"] == "a@example.com"
+
+
+def test_unknown_kids_share_one_reload_per_interval(keyset, tmp_path, monkeypatch):
+    reloads = []
+    reload = keyset.reload
+    monkeypatch.setattr(keyset, "reload", lambda: reloads.append(1) or reload())
+    signing_key = keyset.active.signing_key
+
+    for i in range(5):
+        token = jwt.encode({"sub": "a@example.com"}, signing_key, algorithm="EdDSA", headers={"kid": f"forged-{i}"})
+        with pytest.raises(jwt.InvalidTokenError):
+            keyset.verify(token)
+    assert len(reloads) == 1
+
+    # Once the interval has passed, the next unknown kid reloads again and finds a new key.
+    kid = write_key_file(str(tmp_path), "EdDSA")
+    monkeypatch.setattr(keyset, "_last_reload", keyset._last_reload - keys.JWT_KEYS_RELOAD_SECONDS)
+    token = jwt.encode({"sub": "a@example.com"}, KeySet.from_env()._by_kid[kid].signing_key, algorithm="EdDSA",
+                       headers={"kid": kid})
+    assert keyset.verify(token)["sub"] == "a@example.com"
+    assert len(reloads) == 2
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import DateTime, event, select
+from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect
+
+from models import User
+from utils import create_access_token
+
+PG_EPOCH = datetime(2000, 1, 1)
+
+
+def _asyncpg_encode_datetimes(conn, clauseelement, multiparams, params, execution_options):
+    # Bind every datetime the way the asyncpg dialect would: its DateTime bind processing,
+    # then asyncpg's `timestamp` encoder, `value - datetime(2000, 1, 1)`, which raises
+    # TypeError for timezone-aware values.
+    if not hasattr(clauseelement, "compile"):
+        return
+    dialect = asyncpg_dialect()
+    compiled = clauseelement.compile(dialect=conn.dialect)
+    for values in multiparams or [params]:
+        for name, value in compiled.construct_params(values or None, _check=False).items():
+            bind = compiled.binds.get(name)
+            if not isinstance(value, datetime) or bind is None or not isinstance(bind.type, DateTime):
+                continue
+            processor = bind.type.dialect_impl(dialect).bind_processor(dialect)
+            value = processor(value) if processor else value
+            if not bind.type.timezone:
+                value - PG_EPOCH
+
+
+def test_timestamp_writes_encode_for_asyncpg(app_db):
+    import main
+
+    event.listen(app_db.get_async_engine().sync_engine, "before_execute", _asyncpg_encode_datetimes)
+    client = TestClient(main.app, raise_server_exceptions=True)
+
+    r = client.post("/api/register", json={"email": "naive@example.com", "name": "N", "password": "pw-123456"})
+    assert r.status_code == 200, r.text
+    r = client.post("/api/forgot_password", json={"email": "naive@example.com"})
+    assert r.status_code == 200, r.text
+
+    with app_db.SessionLocal() as db:
+        user = db.execute(select(User).where(User.email == "naive@example.com")).scalar_one()
+        user.is_verified = True
+        db.commit()
+        assert user.verification_token_expiry.tzinfo is None
+        assert user.password_reset_token_expiry.tzinfo is None
+    token = create_access_token({"sub": "naive@example.com"})
+    r = client.post("/api/update_profile", json={"name": "Renamed"}, headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200, r.text
@@ -0,0 +1,116 @@
+import socket
+import threading
+
+import pytest
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import sessionmaker
+
+from mailer import SMTPConfig
+from models import Base, EmailOutbox
+from outbox import MailOutbox, enqueue_email
+
+
+def test_concurrent_workers_claim_each_email_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(engine, tables=[EmailOutbox.__table__])
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        for i in range(60):
+            enqueue_email(db, "verify", f"user{i}@example.com", token=str(i))
+        db.commit()
+
+    claimed = []
+    start = threading.Barrier(4)
+
+    def worker():
+        outbox = MailOutbox(session_factory=factory, batch_size=7)
+        start.wait()
+        while jobs := outbox._claim():
+            claimed.extend(job.id for job in jobs)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(claimed) == len(set(claimed)) == 60
+    with factory() as db:
+        rows = db.execute(select(EmailOutbox)).scalars().all()
+    assert all(row.status == "sending" and row.attempts == 1 for row in rows)
+
+
+@pytest.fixture
+def outbox_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+    Base.metadata.create_all(engine, tables=[EmailOutbox.__table__])
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def smtp_server():
+    controller_module = pytest.importorskip("aiosmtpd.controller")
+
+    class Sink:
+        def __init__(self):
+            self.recipients = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.recipients.extend(envelope.rcpt_tos)
+            return "250 OK"
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    sink = Sink()
+    controller = controller_module.Controller(sink, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield sink, SMTPConfig(host="127.0.0.1", port=port, user="", password="", use_ssl=False, starttls=False)
+    controller.stop()
+
+
+def _enqueue(factory, count):
+    with factory() as db:
+        for i in range(count):
+            enqueue_email(db, "verify", f"user{i}@example.com", url=f"https://example.com/verify?token={i}")
+        db.commit()
+
+
+def test_outbox_delivers_through_the_pool_to_an_smtp_server(outbox_db, smtp_server):
+    sink, cfg = smtp_server
+    _enqueue(outbox_db, 5)
+
+    assert MailOutbox(session_factory=outbox_db, cfg=cfg).drain_once() == 5
+
+    assert sorted(sink.recipients) == sorted(f"user{i}@example.com" for i in range(5))
+    with outbox_db() as db:
+        assert {row.status for row in db.execute(select(EmailOutbox)).scalars()} == {"sent"}
+
+
+def test_untried_jobs_keep_their_attempts_when_smtp_is_down(outbox_db):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        closed_port = s.getsockname()[1]
+    cfg = SMTPConfig(host="127.0.0.1", port=closed_port, user="", password="", use_ssl=False, starttls=False)
+    _enqueue(outbox_db, 3)
+
+    MailOutbox(session_factory=outbox_db, cfg=cfg).drain_once()
+
+    with outbox_db() as db:
+        rows = db.execute(select(EmailOutbox).order_by(EmailOutbox.id)).scalars().all()
+    assert [row.status for row in rows] == ["pending"] * 3
+    assert [row.attempts for row in rows] == [1, 0, 0]
+
+
+def test_stale_worker_does_not_overwrite_the_new_claim(outbox_db):
+    _enqueue(outbox_db, 1)
+    stale = MailOutbox(session_factory=outbox_db)
+    jobs = stale._claim()
+    with outbox_db() as db:
+        db.execute(update(EmailOutbox).values(claimed_by="other-worker", status="sent"))
+        db.commit()
+
+    stale._record(jobs, {jobs[0].id: (False, "boom", True, True)})
+
+    with outbox_db() as db:
+        assert db.execute(select(EmailOutbox.status)).scalar_one() == "sent"
@@ -0,0 +1,50 @@
+import pytest
+from starlette.requests import Request
+
+import ratelimit
+from ratelimit import client_ip
+
+
+def _request(*forwarded: str) -> Request:
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded]
+    return Request({"type": "http", "headers": headers, "client": ("10.0.0.2", 5000)})
+
+
+@pytest.fixture
+def behind_proxy(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PROXY_HOPS", 1)
+
+
+def test_forged_forwarded_entries_do_not_change_the_client_ip(behind_proxy):
+    assert client_ip(_request("203.0.113.7")) == "203.0.113.7"
+    assert client_ip(_request("1.2.3.4, 203.0.113.7")) == "203.0.113.7"
+    assert client_ip(_request("5.6.7.8", "203.0.113.7")) == "203.0.113.7"
+
+
+def test_client_ip_counts_trusted_hops_from_the_right(behind_proxy, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PROXY_HOPS", 2)
+    assert client_ip(_request("1.2.3.4, 203.0.113.7, 10.0.0.1")) == "203.0.113.7"
+    assert client_ip(_request("203.0.113.7")) == "203.0.113.7"
+
+
+def test_forwarded_header_is_ignored_without_a_trusted_proxy():
+    assert client_ip(_request("1.2.3.4")) == "10.0.0.2"
+
+
+def test_full_memory_store_evicts_least_recently_hit_keys():
+    store = ratelimit.MemoryRateLimitStore(max_keys=100)
+    rule = ratelimit.Rule(limit=2, window=60)
+    now = 1000.0
+    assert store.take("ip:attacker", rule, now) == 0 and store.take("ip:attacker", rule, now) == 0
+
+    for i in range(1000):
+        store.take(f"ip:rotated-{i}", rule, now)
+        # The blocked key keeps getting hit, so rotating keys never evict it.
+        assert store.take("ip:attacker", rule, now) > 0
+    assert store.stats()["keys"] == 100
+
+    # Expired keys at the front are cleared in small batches by later inserts.
+    later = now + 10 * rule.window
+    store.take("ip:new", rule, later)
+    assert store.stats()["keys"] == 100 - ratelimit.MemoryRateLimitStore.EVICT_BATCH + 1
@@ -0,0 +1,44 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+
+import utils
+from revocation import DatabaseRevocationStore, MemoryRevocationStore
+from utils import create_access_token, decode_access_token, is_session_revoked, session_revocation_key
+
+
+@pytest.fixture(params=["memory", "database"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        store = MemoryRevocationStore()
+    else:
+        engine = create_engine(f"sqlite:///{tmp_path / 'revoked.db'}")
+        store = DatabaseRevocationStore(lambda: engine)
+    monkeypatch.setattr(utils, "revocation_store", store)
+    return store
+
+
+def test_revoked_session_rejects_its_access_tokens(store):
+    token = create_access_token({"sub": "a@example.com", "sid": 5})
+    other = create_access_token({"sub": "a@example.com", "sid": 6})
+    assert decode_access_token(token)["sid"] == 5
+
+    store.revoke(session_revocation_key(5), time.time() + 60)
+
+    with pytest.raises(HTTPException) as exc:
+        decode_access_token(token)
+    assert exc.value.status_code == 401
+    assert decode_access_token(other)["sid"] == 6
+    assert is_session_revoked({"sid": 5}) and not is_session_revoked({"sid": 6})
+
+
+def test_revoked_session_is_seen_by_another_worker(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'revoked.db'}")
+    DatabaseRevocationStore(lambda: engine).revoke(session_revocation_key(7), time.time() + 60)
+    other_worker = DatabaseRevocationStore(lambda: engine)
+    # Lookups only read the local copy; the background sync fills it.
+    assert not other_worker.is_revoked(session_revocation_key(7))
+    other_worker.sync()
+    assert other_worker.is_revoked(session_revocation_key(7))
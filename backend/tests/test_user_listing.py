@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+from sqlalchemy.dialects import postgresql
+
+from models import User
+from utils import encode_user_cursor, get_users_page_async
+
+
+@pytest.mark.parametrize("status", ["all", "unverified", "inactive"])
+def test_listing_pages_come_straight_from_an_index(app_db, status):
+    start = datetime(2026, 1, 1)
+    with app_db.SessionLocal() as db:
+        db.execute(insert(User), [
+            {"email": f"u{i}@example.com", "name": f"U{i}", "is_verified": i % 2 == 0, "is_active": i % 3 != 0,
+             "created_at": start + timedelta(minutes=i // 4)}  # ties on created_at are broken by id
+            for i in range(50)
+        ])
+        db.commit()
+
+    statements = []
+    engine = app_db.get_async_engine()
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, sql, params, context, many: statements.append((sql, params)))
+
+    async def all_pages():
+        ids, cursor = [], None
+        async with app_db.AsyncSessionLocal() as db:
+            while True:
+                rows, cursor = await get_users_page_async(db, status, 7, cursor)
+                ids += [row.id for row in rows]
+                if cursor is None:
+                    return ids
+
+    ids = asyncio.run(all_pages())
+    with app_db.SessionLocal() as db:
+        expected = [user.id for user in db.query(User).order_by(User.created_at.desc(), User.id.desc())
+                    if status == "all" or (status == "unverified" and not user.is_verified)
+                    or (status == "inactive" and not user.is_active)]
+    assert ids == expected
+
+    later_pages = [(sql, params) for sql, params in statements if "users.created_at, users.id) <" in sql]
+    assert later_pages
+    with app_db.get_engine().connect() as conn:
+        for sql, params in later_pages:
+            plan = " | ".join(row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params))
+            assert "TEMP B-TREE" not in plan and "created_at" in plan, plan
+
+
+class _Captured(Exception):
+    pass
+
+
+def test_postgres_page_query_matches_a_backward_index_scan():
+    captured = []
+
+    class Capture:
+        async def execute(self, query):
+            captured.append(str(query.compile(dialect=postgresql.dialect())))
+            raise _Captured
+
+    cursor = encode_user_cursor(datetime(2026, 1, 1), 10)
+    with pytest.raises(_Captured):
+        asyncio.run(get_users_page_async(Capture(), "all", 20, cursor))
+    sql = captured[0]
+    # DESC without NULLS LAST is what scanning the ascending (created_at, id) index backwards yields,
+    # and a bare row comparison lets that scan start at the cursor.
+    assert "ORDER BY users.created_at DESC, users.id DESC" in sql
+    assert "(users.created_at, users.id) < (" in sql and " OR " not in sql and "NULLS" not in sql
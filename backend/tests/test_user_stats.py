@@ -0,0 +1,38 @@
+import asyncio
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import user_stats
+from models import Base, UserSignupsDaily, UserStats
+from user_stats import bump_user_stats, get_user_stats_async
+
+
+def test_sharded_counters_sum_on_read(tmp_path, monkeypatch):
+    path = tmp_path / "stats.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine, tables=[UserStats.__table__, UserSignupsDaily.__table__])
+    monkeypatch.setattr(user_stats, "USER_STATS_SHARDS", 4)
+    today = date.today()
+    with sessionmaker(bind=engine)() as db:
+        for _ in range(40):
+            bump_user_stats(db, total=1, active=1, signups={today: 1})
+        bump_user_stats(db, verified=3, signups={today - timedelta(days=1): 2})
+        db.commit()
+        assert 1 < db.execute(select(func.count()).select_from(UserStats)).scalar() <= 4
+
+    async def read():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with AsyncSession(async_engine) as db:
+            stats = await get_user_stats_async(db, days=7)
+        await async_engine.dispose()
+        return stats
+
+    stats = asyncio.run(read())
+    assert (stats["total"], stats["verified"], stats["active"], stats["unverified"]) == (40, 3, 40, 37)
+    assert stats["signups_per_day"] == [
+        {"day": (today - timedelta(days=1)).isoformat(), "signups": 2},
+        {"day": today.isoformat(), "signups": 40},
+    ]
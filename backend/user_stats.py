@@ -0,0 +1,132 @@
+"""
+Aggregate user counters for the admin dashboard.
+
+`user_stats` holds running totals and `user_signups_daily` per-day signups.
+Every write path that adds users or flips is_verified/is_active applies its
+delta in the same transaction (`bump_user_stats[_async]`), so reading them is
+constant time however large `users` gets. Deltas land on one of
+USER_STATS_SHARDS rows chosen at random, so concurrent registrations do not
+queue on a single row lock; readers sum the shards.
+`rebuild_user_stats` recounts from scratch if they ever drift;
+`python user_stats.py` runs it.
+"""
+import json
+import os
+import random
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from database import SessionLocal, dialect_insert
+from models import User, UserSignupsDaily, UserStats
+
+load_dotenv()
+
+USER_STATS_SHARDS = max(int(os.getenv("USER_STATS_SHARDS", "16")), 1)
+
+
+def _statements(db, total: int, verified: int, active: int, signups: Optional[Dict[date, int]]) -> list:
+    statements = []
+    shard = random.randrange(USER_STATS_SHARDS)
+    if total or verified or active:
+        statements.append(
+            dialect_insert(db, UserStats)
+            .values(id=shard, total=total, verified=verified, active=active, updated_at=datetime.utcnow())
+            .on_conflict_do_update(
+                index_elements=[UserStats.id],
+                set_={
+                    "total": UserStats.total + total,
+                    "verified": UserStats.verified + verified,
+                    "active": UserStats.active + active,
+                    "updated_at": datetime.utcnow(),
+                },
+            )
+        )
+    for day, count in (signups or {}).items():
+        if count:
+            statements.append(
+                dialect_insert(db, UserSignupsDaily)
+                .values(day=day, shard=shard, signups=count)
+                .on_conflict_do_update(
+                    index_elements=[UserSignupsDaily.day, UserSignupsDaily.shard],
+                    set_={"signups": UserSignupsDaily.signups + count},
+                )
+            )
+    return statements
+
+
+def bump_user_stats(db: Session, total: int = 0, verified: int = 0, active: int = 0,
+                    signups: Optional[Dict[date, int]] = None) -> None:
+    """Apply a delta in the caller's transaction; nothing is counted until it commits."""
+    for stmt in _statements(db, total, verified, active, signups):
+        db.execute(stmt)
+
+
+async def bump_user_stats_async(db: AsyncSession, total: int = 0, verified: int = 0, active: int = 0,
+                                signups: Optional[Dict[date, int]] = None) -> None:
+    for stmt in _statements(db, total, verified, active, signups):
+        await db.execute(stmt)
+
+
+async def get_user_stats_async(db: AsyncSession, days: int = 30) -> dict:
+    total, verified, active, updated_at = (await db.execute(
+        select(
+            func.coalesce(func.sum(UserStats.total), 0),
+            func.coalesce(func.sum(UserStats.verified), 0),
+            func.coalesce(func.sum(UserStats.active), 0),
+            func.max(UserStats.updated_at),
+        )
+    )).one()
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    result = await db.execute(
+        select(UserSignupsDaily.day, func.sum(UserSignupsDaily.signups))
+        .where(UserSignupsDaily.day >= since)
+        .group_by(UserSignupsDaily.day)
+        .order_by(UserSignupsDaily.day)
+    )
+    return {
+        "total": total,
+        "verified": verified,
+        "unverified": total - verified,
+        "active": active,
+        "inactive": total - active,
+        "signups_per_day": [{"day": day.isoformat(), "signups": signups} for day, signups in result.all()],
+        "updated_at": updated_at.isoformat() if updated_at else None,
+    }
+
+
+def rebuild_user_stats(session_factory=SessionLocal) -> dict:
+    """Recount everything from `users` (a full scan; for repairs, not for serving)."""
+    with session_factory() as db:
+        total, verified, active = db.execute(
+            select(
+                func.count(),
+                func.count().filter(User.is_verified == True),
+                func.count().filter(User.is_active == True),
+            ).select_from(User)
+        ).one()
+        day = func.date(User.created_at)
+        daily: List = db.execute(
+            select(day, func.count()).where(User.created_at.isnot(None)).group_by(day)
+        ).all()
+
+        db.execute(UserSignupsDaily.__table__.delete())
+        if daily:
+            db.execute(UserSignupsDaily.__table__.insert(), [
+                {"day": d if isinstance(d, date) else date.fromisoformat(d), "signups": n} for d, n in daily
+            ])
+        db.execute(UserStats.__table__.delete())
+        db.execute(UserStats.__table__.insert().values(
+            id=0, total=total, verified=verified, active=active, updated_at=datetime.utcnow()
+        ))
+        db.commit()
+    return {"total": total, "verified": verified, "active": active, "days": len(daily)}
+
+
+if __name__ == "__main__":
+    print(json.dumps(rebuild_user_stats()))
@@ -1,51 +1,112 @@
 import models
 import jwt
+from sqlalchemy import select, func, or_, tuple_
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
 from fastapi import HTTPException, status
 from dotenv import load_dotenv
 import os
 import hashlib
+import secrets
+import base64
+import json
+from hashing import pwd_context, hash_password, check_password
+from keys import get_keyset
+from metrics import timed
+from revocation import revocation_store
 
 load_dotenv()
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Clients renew access tokens through /api/refresh (sessions.py), so they can stay short-lived.
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-blacklist = set()
-
 
 def hash_token(token: str) -> str:
     return hashlib.sha256(token.encode()).hexdigest()
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return check_password(plain_password, hashed_password)
+
+def normalize_email(email: str) -> str:
+    """Emails are stored lowercased; lookups compare lower(email) so ix_users_lower_email is used."""
+    return email.strip().lower()
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    return db.query(models.User).filter(func.lower(models.User.email) == normalize_email(email)).first()
 
-def get_user_by_status(db: Session, status: str):
+def user_status_filter(status: str):
     if status == "verified":
-        users = db.query(models.User).filter(models.User.is_verified == True).all()
+        return models.User.is_verified == True
     elif status == "unverified":
-        users = db.query(models.User).filter(models.User.is_verified == False).all()
+        return models.User.is_verified == False
     elif status == "all":
-        users = db.query(models.User).all()
+        return None
     elif status == "active":
-        users = db.query(models.User).filter(models.User.is_active == True).all()
+        return models.User.is_active == True
     elif status == "inactive":
-        users = db.query(models.User).filter(models.User.is_active == False).all()
-    else:
-        raise HTTPException(status_code=400, detail="Invalid status parameter")
-    return users
+        return models.User.is_active == False
+    raise HTTPException(status_code=400, detail="Invalid status parameter")
+
+def get_user_by_status(db: Session, status: str):
+    condition = user_status_filter(status)
+    query = db.query(models.User)
+    if condition is not None:
+        query = query.filter(condition)
+    return query.all()
+
+
+# Admin user listing
+
+USER_LISTING_COLUMNS = (
+    models.User.id,
+    models.User.email,
+    models.User.name,
+    models.User.is_admin,
+    models.User.is_active,
+    models.User.is_verified,
+    models.User.created_at,
+)
+
+def _prefix_pattern(q: str) -> str:
+    escaped = q.strip().lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+def _user_listing_query(status: str, q: str = None):
+    User = models.User
+    query = select(*USER_LISTING_COLUMNS)
+    condition = user_status_filter(status)
+    if condition is not None:
+        query = query.where(condition)
+    if q and q.strip():
+        pattern = _prefix_pattern(q)
+        query = query.where(or_(
+            func.lower(User.name).like(pattern, escape="\\"),
+            func.lower(User.email).like(pattern, escape="\\"),
+        ))
+    # Plain DESC is exactly a backward scan of the ascending (created_at, id) indexes;
+    # created_at is never NULL, so the NULLS FIRST/LAST default does not matter.
+    return query.order_by(User.created_at.desc(), User.id.desc())
+
+def encode_user_cursor(created_at: datetime, user_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), user_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_user_cursor(cursor: str):
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
+def iter_users_by_status(db: Session, status: str, q: str = None, chunk_size: int = 1000):
+    """Stream listing rows through a server-side cursor, `chunk_size` rows at a time."""
+    query = _user_listing_query(status, q).execution_options(yield_per=chunk_size)
+    yield from db.execute(query)
 
 def get_user_by_password_reset_token(db: Session, token: str):
     return db.query(models.User).filter(models.User.password_reset_token == token).first()
@@ -56,24 +117,102 @@ def get_user_by_verification_token(db: Session, token: str):
 def get_all_verified_users(db: Session):
     return db.query(models.User).filter(models.User.is_verified == True).all()
 
+def iter_verified_recipients(db: Session, chunk_size: int = 1000):
+    """
+    Stream (name, email) of every verified user through a server-side cursor,
+    `chunk_size` rows at a time, without loading User objects.
+    """
+    query = (
+        select(models.User.name, models.User.email)
+        .where(models.User.is_verified == True)
+        .order_by(models.User.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for name, email in db.execute(query):
+        yield name or "", email
+
+# Async variants for the AsyncSession routes
+
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    result = await db.execute(
+        select(models.User).where(func.lower(models.User.email) == normalize_email(email)).limit(1)
+    )
+    return result.scalars().first()
+
+async def get_users_page_async(db: AsyncSession, status: str, limit: int, cursor: str = None, q: str = None):
+    """
+    One page of the admin user listing, newest first.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    User = models.User
+    query = _user_listing_query(status, q)
+    if cursor:
+        created_at, last_id = decode_user_cursor(cursor)
+        # A row comparison, so the index range scan starts right after the cursor.
+        query = query.where(tuple_(User.created_at, User.id) < tuple_(created_at, last_id))
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_user_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+async def get_user_by_password_reset_token_async(db: AsyncSession, token: str):
+    result = await db.execute(
+        select(models.User).where(models.User.password_reset_token == token).limit(1)
+    )
+    return result.scalars().first()
+
+async def get_user_by_verification_token_async(db: AsyncSession, token: str):
+    result = await db.execute(
+        select(models.User).where(models.User.verification_token == token).limit(1)
+    )
+    return result.scalars().first()
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    now = datetime.now(timezone.utc)
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # A random jti keeps two tokens issued in the same second distinct, so revoking
+    # or caching one never affects the other.
+    to_encode.update({"exp": expire, "iat": now, "jti": secrets.token_urlsafe(16)})
+    with timed("jwt_encode"):
+        encoded_jwt = get_keyset().sign(to_encode)
     return encoded_jwt
 
 def create_verification_token(email: str):
     return create_access_token({"sub": email}, timedelta(minutes=15))
 
 def decode_access_token(token: str):
+    if revocation_store.is_revoked(hash_token(token)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        with timed("jwt_decode"):
+            payload = get_keyset().verify(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
     except jwt.PyJWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    if is_session_revoked(payload):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session has been revoked")
+    return payload
+
+def session_revocation_key(session_id: int) -> str:
+    """
+    Revocation-store key that rejects every access token issued for a session.
+    Hashed like token keys, so the store only ever holds sha256 hex digests.
+    """
+    return hash_token(f"session:{session_id}")
+
+def is_session_revoked(claims: dict) -> bool:
+    sid = claims.get("sid")
+    return sid is not None and revocation_store.is_revoked(session_revocation_key(sid))
+
+def revoke_access_token(token: str) -> None:
+    try:
+        payload = decode_access_token(token)
+    except HTTPException:
+        return  # already expired, invalid or revoked
+    revocation_store.revoke(hash_token(token), payload["exp"])
\ No newline at end of file
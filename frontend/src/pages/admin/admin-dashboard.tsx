@@ -16,12 +16,31 @@ type User = {
   joined: string; // ISO date
 };
 
-// Fetch users with status as a PATH param: /admin/users/{status}
-const fetchUsers = async (status: "all" | "active" | "inactive" | "verified" | "unverified"): Promise<User[]> => {
+type UsersPage = { users: User[]; next_cursor: string | null };
+
+type UserStats = {
+  total: number;
+  verified: number;
+  unverified: number;
+  active: number;
+  inactive: number;
+  signups_per_day: { day: string; signups: number }[];
+};
+
+const PAGE_SIZE = 50;
+
+// Fetch one page of users with status as a PATH param: /admin/users/{status}
+// Pass the previous page's next_cursor to continue; `q` is a name/email prefix.
+const fetchUsers = async (
+  status: "all" | "active" | "inactive" | "verified" | "unverified",
+  cursor?: string | null,
+  q?: string
+): Promise<UsersPage> => {
   const token = localStorage.getItem("bitva:access_token");
 
   const res = await api.get(`/admin/users/${encodeURIComponent(status)}`, {
     headers: { Authorization: `Bearer ${token}` },
+    params: { limit: PAGE_SIZE, cursor: cursor || undefined, q: q || undefined },
   });
 
   if (res.status !== 200) {
@@ -34,7 +53,17 @@ const fetchUsers = async (status: "all" | "active" | "inactive" | "verified" | "
   if (!Array.isArray(list)) {
     throw new Error("Unexpected response shape (expected { users: [...] })");
   }
-  return list as User[];
+  return { users: list as User[], next_cursor: data?.next_cursor ?? null };
+};
+
+// Totals come from server-side counters, not from the rows loaded so far
+const fetchStats = async (): Promise<UserStats> => {
+  const token = localStorage.getItem("bitva:access_token");
+  const res = await api.get("/admin/stats", {
+    headers: { Authorization: `Bearer ${token}` },
+    params: { days: 7 },
+  });
+  return res.data as UserStats;
 };
 
 // TEMP auth hook — replace with your real auth
@@ -80,38 +109,66 @@ export default function AdminUsers() {
   const [role, setRole] = useState<"all" | User["role"]>("all");
   const [status, setStatus] = useState<"all" | User["status"]>("all");
   const [loading, setLoading] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [errMsg, setErrMsg] = useState<string | null>(null);
+  const [stats, setStats] = useState<UserStats | null>(null);
+
+  useEffect(() => {
+    fetchStats()
+      .then(setStats)
+      .catch((err) => console.error("fetchStats error:", err));
+  }, []);
 
-  // Fetch users when status changes
+  // Fetch the first page when status or search changes (search is debounced)
   useEffect(() => {
     let mounted = true;
-    setLoading(true);
-    setErrMsg(null);
-    fetchUsers(status)
-      .then((data) => mounted && setUsers(data))
-      .catch((err) => {
-        console.error("fetchUsers error:", err);
-        if (mounted) {
-          setUsers([]);
-          setErrMsg(err?.message || "Failed to load users");
-        }
-      })
-      .finally(() => mounted && setLoading(false));
+    const q = query.trim();
+    const timer = setTimeout(() => {
+      setLoading(true);
+      setErrMsg(null);
+      fetchUsers(status, null, q)
+        .then((page) => {
+          if (!mounted) return;
+          setUsers(page.users);
+          setNextCursor(page.next_cursor);
+        })
+        .catch((err) => {
+          console.error("fetchUsers error:", err);
+          if (mounted) {
+            setUsers([]);
+            setNextCursor(null);
+            setErrMsg(err?.message || "Failed to load users");
+          }
+        })
+        .finally(() => mounted && setLoading(false));
+    }, q ? 300 : 0);
     return () => {
       mounted = false;
+      clearTimeout(timer);
     };
-  }, [status]);
+  }, [status, query]);
+
+  function loadMore() {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    fetchUsers(status, nextCursor, query.trim())
+      .then((page) => {
+        setUsers((list) => [...list, ...page.users]);
+        setNextCursor(page.next_cursor);
+      })
+      .catch((err) => setErrMsg(err?.message || "Failed to load users"))
+      .finally(() => setLoadingMore(false));
+  }
 
-  // Derived rows (search + role; status already filtered by API, but keep client filter for safety)
+  // Derived rows (role; status and search are already filtered by the API, but keep status filter for safety)
   const rows = useMemo(() => {
-    const q = query.trim().toLowerCase();
     return users.filter((u) => {
-      const matchQ = !q || `${u.name} ${u.email}`.toLowerCase().includes(q);
       const matchRole = role === "all" || u.role === role;
       const matchStatus = status === "all" || u.status === status;
-      return matchQ && matchRole && matchStatus;
+      return matchRole && matchStatus;
     });
-  }, [users, query, role, status]);
+  }, [users, role, status]);
 
   // Local UI actions (replace with API calls when ready)
   function toggleSuspend(id: string) {
@@ -293,14 +350,39 @@ export default function AdminUsers() {
             </table>
           </div>
 
+          {nextCursor && !loading && (
+            <div className="mt-4 flex justify-center">
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="rounded-md border border-gray-300 bg-white px-4 py-2 text-sm text-gray-700 shadow-sm hover:bg-gray-50 disabled:opacity-50"
+              >
+                {loadingMore ? "Loading..." : "Load more"}
+              </button>
+            </div>
+          )}
+
           {/* Footer summary */}
           <div className="mt-4 flex flex-wrap items-center gap-3 text-sm text-gray-600">
-            <span> Total: {rows.length} / {users.length} </span>
-            <span className="hidden sm:inline">•</span>
-            <span>
-              Active: {users.filter((u) => u.status === "active").length}, Inactive:{" "}
-              {users.filter((u) => u.status === "inactive").length}
-            </span>
+            <span> Showing: {rows.length} / {users.length} loaded </span>
+            {stats && (
+              <>
+                <span className="hidden sm:inline">•</span>
+                <span>Total: {stats.total}</span>
+                <span className="hidden sm:inline">•</span>
+                <span>
+                  Active: {stats.active}, Inactive: {stats.inactive}
+                </span>
+                <span className="hidden sm:inline">•</span>
+                <span>
+                  Verified: {stats.verified}, Unverified: {stats.unverified}
+                </span>
+                <span className="hidden sm:inline">•</span>
+                <span>
+                  Signups (7 days): {stats.signups_per_day.reduce((sum, d) => sum + d.signups, 0)}
+                </span>
+              </>
+            )}
           </div>
         </div>
       </main>
@@ -63,7 +63,7 @@ export default function Broadcast() {
   };
 
   try {
-    await api.post(
+    const response = await api.post(
       "/admin/send_broadcast/",
       broadcast,
       {
@@ -72,7 +72,7 @@ export default function Broadcast() {
         },
       }
     );
-    setSuccess("Broadcast sent successfully");
+    setSuccess(`Broadcast queued (job #${response.data.job_id})`);
   } catch (error) {
     setError("Failed to send broadcast");
   } finally {